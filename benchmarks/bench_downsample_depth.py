@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Recall of each tool against the mock community truth at several read depths.
+
+  bench_downsample_depth.py prepare   downsample one deep read pair (bin/downsample_reads.py) to several
+                                      depths, one reads folder per depth to run main.nf on
+  bench_downsample_depth.py score     score the summaries of those runs against the resistance profile
+                                      (datasets/raw-reads/resistance_profile/resistance_profile.tsv) and
+                                      pick the cheapest depth that keeps each tool's recall
+"""
+
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "bin"))
+import downsample_reads  # noqa: E402
+
+DEFAULT_TRUTH = os.path.join(BENCH_DIR, "..", "datasets", "raw-reads", "resistance_profile", "resistance_profile.tsv")
+TOOL_COLUMN = re.compile(r"^(?P<tool>.+)_report_(?P<sample>.+)$")
+
+
+def parse_runs(runs):
+    # DEPTH=PATH pairs, ordered by depth
+    parsed = []
+    for run in runs:
+        depth, sep, path = run.partition("=")
+        if not sep:
+            raise click.BadParameter(f"expected DEPTH=PATH, got {run}", param_hint="--run")
+        parsed.append((float(depth.rstrip("xX")), path))
+    return sorted(parsed)
+
+
+def read_truth(truth_file, gene_column, sample_column):
+    """{sample: set of genes} of the truth table; sample None when the profile applies to every sample."""
+    truth = pd.read_csv(truth_file, sep="\t", dtype=str)
+    if gene_column not in truth.columns or (sample_column and sample_column not in truth.columns):
+        raise click.ClickException(f"{truth_file} has the columns {', '.join(truth.columns)}; "
+                                   f"set --gene-column (and --sample-column) to match")
+    truth = truth.dropna(subset=[gene_column])
+    if not sample_column:
+        return {None: set(truth[gene_column])}
+    return {sample: set(group[gene_column]) for sample, group in truth.groupby(sample_column)}
+
+
+def called(values):
+    # Tool columns hold 0/1 (or 0.0/1.0) calls; ARIBA columns also hold match statuses such as yes_nonunique
+    numbers = pd.to_numeric(values, errors="coerce")
+    return np.where(numbers.notna(), numbers != 0, ~values.isin(["", "no"]))
+
+
+def read_calls(summary_dir, match_column):
+    """(sample, tool, gene) calls of the summary_<sample>.tsv files of a pipeline run."""
+    calls = []
+    files = [path for path in sorted(glob.glob(os.path.join(summary_dir, "summary_*.tsv")))
+             if os.path.basename(path) != "summary_matrix.tsv"]
+    if not files:
+        raise click.ClickException(f"No summary_<sample>.tsv files in {summary_dir}")
+    for path in files:
+        summary = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+        for column in summary.columns:
+            match = TOOL_COLUMN.match(column)
+            if match:
+                genes = summary.loc[called(summary[column]), match_column]
+                genes = genes[genes != ""]
+                calls.extend((match["sample"], match["tool"], gene) for gene in genes)
+    return pd.DataFrame(calls, columns=["sample", "tool", "gene"])
+
+
+def score(calls, truth):
+    """Per tool: true positives, false negatives, false positives, recall and precision over all samples."""
+    rows = []
+    samples = sorted(set(calls["sample"]))
+    for tool, tool_calls in calls.groupby("tool"):
+        tp = fn = fp = 0
+        for sample in samples:
+            expected = truth.get(sample, truth.get(None, set()))
+            called = set(tool_calls.loc[tool_calls["sample"] == sample, "gene"])
+            tp += len(called & expected)
+            fn += len(expected - called)
+            fp += len(called - expected)
+        rows.append({"tool": tool, "tp": tp, "fn": fn, "fp": fp,
+                     "recall": tp / (tp + fn) if tp + fn else float("nan"),
+                     "precision": tp / (tp + fp) if tp + fp else float("nan")})
+    return pd.DataFrame(rows)
+
+
+@click.group()
+def cli():
+    """Depth versus recall benchmarks of the downsampling stage."""
+
+
+@cli.command("prepare")
+@click.option('--r1', type=click.Path(exists=True), required=True, help='Forward reads of the deep sample')
+@click.option('--r2', type=click.Path(exists=True), required=True, help='Reverse reads of the deep sample')
+@click.option('--sample', required=True, help='Sample name of the downsampled pairs (<sample>_R1.fastq.gz)')
+@click.option('--depths', default='10,20,30,50,75,100', show_default=True, help='Comma-separated target depths')
+@click.option('--genome-size', default=None, help='Genome size (k/m/g suffixes allowed); estimated from the reads if omitted')
+@click.option('--seed', default=42, show_default=True, help='Random seed')
+@click.option('--output-dir', required=True, help='Writes <output-dir>/<depth>x/<sample>_R{1,2}.fastq.gz')
+def prepare(r1, r2, sample, depths, genome_size, seed, output_dir):
+    """Downsample a deep read pair to each depth, estimating its depth once."""
+    n_reads, genome, depth, _ = downsample_reads.estimate_depth(r1, genome_size)
+    click.echo(f"{sample}: {n_reads} pairs, genome size {genome}, depth {depth:.1f}x", err=True)
+
+    click.echo("target_depth\tfraction\tpairs\tseconds\treads")
+    for target in sorted(float(value) for value in depths.split(",")):
+        fraction = min(1.0, target / depth)
+        run_dir = os.path.join(output_dir, f"{target:g}x")
+        os.makedirs(run_dir, exist_ok=True)
+        prefix = os.path.join(run_dir, sample)
+        start = time.perf_counter()
+        if fraction >= 1:
+            downsample_reads.link_or_copy(r1, f"{prefix}_R1.fastq.gz")
+            downsample_reads.link_or_copy(r2, f"{prefix}_R2.fastq.gz")
+            kept = n_reads
+        else:
+            _, kept = downsample_reads.downsample_pairs(r1, r2, prefix, fraction, seed)
+        click.echo(f"{target:g}\t{fraction:.4f}\t{kept}\t{time.perf_counter() - start:.1f}\t{run_dir}/*_R{{1,2}}.fastq.gz")
+        with open(os.path.join(run_dir, f"{sample}_downsample.json"), "w") as handle:
+            json.dump({"genome_size": genome, "depth": round(depth, 2), "target_depth": target,
+                       "fraction": round(fraction, 6), "kept_pairs": kept, "seed": seed}, handle, indent=2)
+
+
+@cli.command("score")
+@click.option('--run', 'runs', multiple=True, required=True, help='DEPTH=SUMMARY_DIR: the summary folder of the pipeline run at that depth (repeatable)')
+@click.option('--truth', type=click.Path(exists=True), default=DEFAULT_TRUTH, show_default=True, help='Resistance profile of the mock community (TSV)')
+@click.option('--gene-column', default='Gene', show_default=True, help='Truth column holding the expected genes')
+@click.option('--sample-column', default=None, help='Truth column holding the sample name (default: one profile for every sample)')
+@click.option('--match-column', default='Gene', show_default=True, help='Summary column compared with the truth genes (e.g. allele or gene_family)')
+@click.option('--tolerance', default=0.01, show_default=True, help='Recall a depth may lose against the best depth of the tool')
+def score_command(runs, truth, gene_column, sample_column, match_column, tolerance):
+    """Recall and precision of each tool at each depth, and the cheapest depth that keeps recall."""
+    expected = read_truth(truth, gene_column, sample_column)
+    tables = []
+    for depth, summary_dir in parse_runs(runs):
+        table = score(read_calls(summary_dir, match_column), expected)
+        table.insert(0, "depth", depth)
+        tables.append(table)
+    results = pd.concat(tables, ignore_index=True)
+    printed = results.assign(depth=results["depth"].map("{:g}".format))
+    click.echo(printed.to_csv(sep="\t", index=False, float_format="%.4f"), nl=False)
+
+    for tool, tool_results in results.groupby("tool"):
+        best = tool_results["recall"].max()
+        cheapest = tool_results.loc[tool_results["recall"] >= best - tolerance, "depth"].min()
+        click.echo(f"{tool}: best recall {best:.4f}; cheapest depth within {tolerance:g} of it: {cheapest:g}x", err=True)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Recall of the k-mer prescreen (bin/kmer_prescreen.py) against full-database results.
+
+  bench_kmer_prescreen.py synthetic   plant reference genes in a random genome, simulate reads and
+                                      check that the planted genes (and their alleles) are candidates
+  bench_kmer_prescreen.py reports     compare prescreen tables with SRST2/ARIBA reports of the same
+                                      samples run against the full database (e.g. the mock communities
+                                      of datasets/raw-reads)
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "bin"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "datasets", "raw-reads", "utils"))
+import kmer_prescreen  # noqa: E402
+import simulate_reads  # noqa: E402
+from summarize_results import read_srst2_evidence  # noqa: E402
+
+
+def mutate(sequence, rate, rng):
+    # Substitutions at the given rate (allele variants of a gene)
+    sequence = sequence.copy()
+    sites = rng.random(len(sequence)) < rate
+    sequence[sites] = (sequence[sites] + rng.integers(1, 4, sites.sum(), dtype=np.uint8)) % 4
+    return sequence
+
+
+def synthetic_references(n_families, alleles, divergence, rng):
+    """Gene families of related alleles (base codes), named like SRST2 records: <family>__<gene>__<allele>__<n>."""
+    references = {}
+    for family in range(n_families):
+        founder = rng.integers(0, 4, int(rng.integers(600, 2400)), dtype=np.uint8)
+        for allele in range(alleles):
+            name = f"{family}__gene{family}__gene{family}_{allele}__{len(references)}"
+            references[name] = founder if allele == 0 else mutate(founder, divergence, rng)
+    return references
+
+
+def write_fasta(sequences, path):
+    with open(path, "wb") as handle:
+        for name, codes in sequences.items():
+            handle.write(b">" + name.encode() + b"\n" + simulate_reads.BASES[codes].tobytes() + b"\n")
+
+
+def srst2_gene(record):
+    # SRST2 reports the gene field of <cluster>__<gene>__<allele>__<id> records
+    parts = record.split("__")
+    return parts[1] if len(parts) == 4 else record
+
+
+def recall(expected, candidates):
+    expected = set(expected)
+    return len(expected & set(candidates)) / len(expected) if expected else float("nan")
+
+
+@click.group()
+def cli():
+    """Recall benchmarks of the k-mer prescreen."""
+
+
+@cli.command("synthetic")
+@click.option('--families', default=2000, show_default=True, help='Reference gene families')
+@click.option('--alleles', default=3, show_default=True, help='Alleles per family')
+@click.option('--divergence', default=0.02, show_default=True, help='Substitution rate between alleles of a family')
+@click.option('--planted', default=30, show_default=True, help='Genes planted in the sample genome')
+@click.option('--genome-size', default=2000000, show_default=True, help='Random background genome length')
+@click.option('--depths', default='2,5,10,30', show_default=True, help='Comma-separated read depths to simulate')
+@click.option('--min-coverage', default=0.5, show_default=True, help='Prescreen --min_coverage')
+@click.option('--kmer-size', default=31, show_default=True, help='k-mer length')
+@click.option('--seed', default=42, show_default=True, help='Random seed')
+def synthetic(families, alleles, divergence, planted, genome_size, depths, min_coverage, kmer_size, seed):
+    """Planted-gene recall and database reduction at several depths."""
+    rng = np.random.default_rng(seed)
+    work_dir = tempfile.mkdtemp(prefix="bench_kmer_prescreen.")
+    try:
+        references = synthetic_references(families, alleles, divergence, rng)
+        fasta = os.path.join(work_dir, "panARG.fasta")
+        write_fasta(references, fasta)
+        start = time.perf_counter()
+        index = kmer_prescreen.build_index({"srst2": fasta}, kmer_size)
+        build_seconds = time.perf_counter() - start
+
+        # The sample carries one allele of each planted family, diverged like a new allele
+        names = list(references)
+        planted_names = [names[i] for i in rng.choice(len(names), planted, replace=False)]
+        pieces = [rng.integers(0, 4, genome_size // (planted + 1), dtype=np.uint8)]
+        for name in planted_names:
+            pieces += [mutate(references[name], divergence / 2, rng), rng.integers(0, 4, genome_size // (planted + 1), dtype=np.uint8)]
+        simulate_reads.GENOMES["sample"] = np.concatenate(pieces)
+        expected_genes = {srst2_gene(name) for name in planted_names}
+
+        click.echo(f"index: {len(names)} records, {len(index['kmers'])} distinct {kmer_size}-mers, {build_seconds:.1f}s")
+        click.echo("depth\treads\tseconds\treads_per_s\tplanted_recall\tgene_recall\tcandidates\tdb_fraction")
+        for depth in (float(value) for value in depths.split(",")):
+            n_pairs = int(np.ceil(depth * len(simulate_reads.GENOMES["sample"]) / 250))
+            r1, r2 = os.path.join(work_dir, "S_R1.fastq.gz"), os.path.join(work_dir, "S_R2.fastq.gz")
+            simulate_reads.simulate_chunk(("sample", 0, n_pairs, np.random.SeedSequence(seed), 125, 350.0, 35.0,
+                                           0.001, 0.01, r1, r2, 1))
+            start = time.perf_counter()
+            hits, n_reads = kmer_prescreen.screen_reads(index, [r1, r2])
+            table = kmer_prescreen.record_table(index, hits)
+            seconds = time.perf_counter() - start
+            candidates = table.loc[table["kmer_coverage"] >= min_coverage, "gene"]
+            click.echo(f"{depth:g}\t{n_reads}\t{seconds:.2f}\t{n_reads / seconds:.0f}\t"
+                       f"{recall(planted_names, candidates):.3f}\t{recall(expected_genes, candidates.map(srst2_gene)):.3f}\t"
+                       f"{len(candidates)}\t{len(candidates) / len(names):.4f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@cli.command("reports")
+@click.argument('manifest', type=click.Path(exists=True))
+def reports(manifest):
+    """
+    Recall of the prescreen candidates against full-database reports.
+
+    MANIFEST is a TSV with the columns sample, prescreen (the kmer_prescreen.py
+    screen table) and srst2_results and/or ariba_results (reports of the run
+    against the full database); relative paths are resolved against it.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    samples = pd.read_csv(manifest, sep="\t", dtype=str).fillna("")
+    rows = []
+    for _, sample in samples.iterrows():
+        table = pd.read_csv(os.path.join(base, sample["prescreen"]), sep="\t")
+        candidates = table[table["candidate"] == 1]
+        if sample.get("srst2_results"):
+            _, evidence = read_srst2_evidence(os.path.join(base, sample["srst2_results"]))
+            detected = set(evidence["Gene"])
+            found = {srst2_gene(name) for name in candidates.loc[candidates["source"] == "srst2", "gene"]}
+            rows.append((sample["sample"], "srst2", len(detected), recall(detected, found), sorted(detected - found)))
+        if sample.get("ariba_results"):
+            report = pd.read_csv(os.path.join(base, sample["ariba_results"]), sep="\t")
+            detected = set(report["ref_name"]) if "ref_name" in report.columns else set()
+            found = set(candidates.loc[candidates["source"] == "ariba", "gene"])
+            rows.append((sample["sample"], "ariba", len(detected), recall(detected, found), sorted(detected - found)))
+
+    click.echo("sample\ttool\tdetected_full_db\trecall\tmissed")
+    for sample, tool, n_detected, value, missed in rows:
+        click.echo(f"{sample}\t{tool}\t{n_detected}\t{value:.3f}\t{','.join(missed)}")
+    detected_total = sum(row[2] for row in rows)
+    found_total = sum(row[2] - len(row[4]) for row in rows)
+    if detected_total:
+        click.echo(f"Overall recall: {found_total / detected_total:.4f} ({found_total}/{detected_total})", err=True)
+
+
+if __name__ == '__main__':
+    cli()
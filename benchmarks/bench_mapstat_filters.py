@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Check the Python mapstat filter (bin/mapstat_filters.py) against bin/mapstatFilters.R.
+
+  bench_mapstat_filters.py compare   write seeded raw mapstat/refdata fixtures, filter each with the
+                                     R script and with the Python port, and compare the output bytes
+                                     and the summarizer evidence; also times both routes
+"""
+
+import contextlib
+import filecmp
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "bin"))
+from mapstat_filters import filter_mapstat, write_mapstat  # noqa: E402
+from summarize_results import read_argprofiler_evidence, read_kma_mapstat_evidence  # noqa: E402
+from synthetic_reports import gene_names, write_raw_mapstat  # noqa: E402
+
+R_SCRIPT = os.path.join(BENCH_DIR, "..", "bin", "mapstatFilters.R")
+
+
+@click.group()
+def cli():
+    """Benchmarks of the in-process KMA mapstat filter."""
+
+
+@cli.command("compare")
+@click.option('--genes', default=2000, show_default=True, help='References in each fixture mapstat')
+@click.option('--fixtures', default=5, show_default=True, help='Number of seeded fixtures')
+@click.option('--depth', default=6.0, show_default=True, help='Depth filter (-d) of both routes')
+@click.option('--rscript', default='Rscript', show_default=True, help='Rscript executable (needs the optparse package)')
+@click.option('--keep', type=click.Path(), default=None, help='Copy the fixtures and both outputs here')
+def compare(genes, fixtures, depth, rscript, keep):
+    """Byte-compare the R and Python filtered mapstat files on synthetic fixtures."""
+    if shutil.which(rscript) is None:
+        raise click.ClickException(f"{rscript} not found; the comparison needs R with the optparse package")
+    work_dir = tempfile.mkdtemp(prefix="mapstat_filters.")
+    failed = []
+    try:
+        click.echo("fixture\trows\tkept\tr_seconds\tpython_seconds\tfile\tevidence")
+        for seed in range(fixtures):
+            mapstat, refdata = os.path.join(work_dir, f"fixture{seed}.mapstat"), os.path.join(work_dir, f"fixture{seed}.refdata")
+            write_raw_mapstat(mapstat, refdata, gene_names(genes), np.random.default_rng(seed))
+            r_output, py_output = os.path.join(work_dir, f"fixture{seed}.R.txt"), os.path.join(work_dir, f"fixture{seed}.py.txt")
+
+            start = time.perf_counter()
+            subprocess.run([rscript, R_SCRIPT, "-i", mapstat, "-o", r_output, "-r", refdata, "-d", str(depth)], check=True, stdout=subprocess.DEVNULL)
+            r_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            header, data = filter_mapstat(mapstat, refdata, {"depth": depth})
+            write_mapstat(header, data, py_output)
+            py_seconds = time.perf_counter() - start
+
+            same_file = filecmp.cmp(r_output, py_output, shallow=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, from_file = read_argprofiler_evidence(r_output)
+                _, in_process = read_kma_mapstat_evidence(mapstat, refdata, {"depth": depth})
+            same_evidence = from_file.equals(in_process)
+            if not (same_file and same_evidence):
+                failed.append(seed)
+            click.echo(f"{seed}\t{genes}\t{len(data)}\t{r_seconds:.3f}\t{py_seconds:.3f}\t{'ok' if same_file else 'DIFF'}\t{'ok' if same_evidence else 'DIFF'}")
+    finally:
+        if keep:
+            shutil.copytree(work_dir, keep, dirs_exist_ok=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if failed:
+        raise click.ClickException(f"{len(failed)} fixture(s) differ from the R output: {', '.join(map(str, failed))}")
+
+
+if __name__ == '__main__':
+    cli()
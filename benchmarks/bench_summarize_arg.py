@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Compare the per-group lambda aggregation with the long-form summarize_arg in get_args.py."""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "db", "utils"))
+from get_args import summarize_arg  # noqa: E402
+
+DATABASES = ["AMRfinderPlus_cds", "card_cds", "ARG-ANNOT_cds", "megares_cds", "ResFinder_cds", "MetalResistance_cds"]
+SUBTYPES = ["AMR", "METAL", "BIOCIDE", "AMR,METAL", "AMR,BIOCIDE", "METAL,AMR"]
+
+
+def synthetic_annotations(n_rows, n_genes, missing_rate, seed):
+    """Merged annotation rows as get_args.py builds them: several database entries per panARG gene."""
+    rng = np.random.default_rng(seed)
+    genes = rng.integers(0, n_genes, n_rows)
+
+    def column(prefix, n_values):
+        values = pd.Series([f"{prefix}{i}" for i in rng.integers(0, n_values, n_rows)], dtype=object)
+        return values.mask(rng.random(n_rows) < missing_rate)
+
+    return pd.DataFrame({
+        "fa_header": [f"entry_{i}" for i in range(n_rows)],
+        "userGeneName": [f"panARG_gene_{gene:06d}" for gene in genes],
+        "gene_len": (genes % 2700 + 300).astype(float),
+        "shortname": column("sn", n_genes),
+        "database": pd.Series(rng.choice(DATABASES, n_rows), dtype=object),
+        "id": column("acc_", n_rows),
+        "allele": column("allele_", n_rows // 2),
+        "gene_family": column("family_", n_genes // 4),
+        "subtype": pd.Series(rng.choice(SUBTYPES, n_rows), dtype=object).mask(rng.random(n_rows) < missing_rate),
+        "class": column("class_", 60),
+    })
+
+
+def summarize_arg_lambdas(merged_df):
+    """summarize_arg as it was before the long-form aggregation."""
+    summary = merged_df.groupby("userGeneName").agg({
+        "gene_len": "first",
+        "shortname": lambda x: ",".join(sorted(set(x.dropna()))),
+        "database": lambda x: ",".join(sorted(set(x.dropna()))),
+        "fa_header": "count",  # Number of entries
+        "id": lambda x: ",".join(sorted(set(x.dropna()))),
+        "allele": lambda x: ",".join(sorted(set(x.dropna()))),
+        "gene_family": lambda x: ",".join(sorted(set(x.dropna()))),
+        "subtype": lambda x: ",".join(sorted(set(x.dropna()))),
+        "class": lambda x: ",".join(sorted(set(x.dropna())))
+    }).rename(columns={"fa_header": "entry_count"})
+    summary["subtype"] = summary["subtype"].apply(
+        lambda x: ",".join(sorted(set(str(x).split(",")))) if pd.notna(x) and "," in str(x) else x
+    )
+    summary.reset_index(inplace=True)
+    return summary
+
+
+def measure(func, df):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(df)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+@click.command()
+@click.option('--rows', default=500000, show_default=True, help='Merged annotation rows')
+@click.option('--genes', default=100000, show_default=True, help='Distinct userGeneName values')
+@click.option('--missing-rate', default=0.2, show_default=True, help='Fraction of missing values per annotation column')
+@click.option('--repeats', default=1, show_default=True, help='Timing repeats; the best run is reported')
+@click.option('--seed', default=42, show_default=True, help='Random seed')
+def main(rows, genes, missing_rate, repeats, seed):
+    """Time and memory-profile both summarize_arg paths on a synthetic merged annotation table."""
+    df = synthetic_annotations(rows, genes, missing_rate, seed)
+    click.echo("rows\tgenes\tpath\tseconds\tpeak_MiB")
+    results = {}
+    for name, func in [("lambda_agg", summarize_arg_lambdas), ("long_form_agg", summarize_arg)]:
+        runs = [measure(func, df) for _ in range(repeats)]
+        results[name] = runs[0][0]
+        best = min(run[1] for run in runs)
+        peak = max(run[2] for run in runs) / 2**20
+        click.echo(f"{rows}\t{genes}\t{name}\t{best:.3f}\t{peak:.1f}")
+
+    # Both paths must write the same summary.txt
+    pd.testing.assert_frame_equal(results["lambda_agg"], results["long_form_agg"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Time and memory-profile summarize_results.py on synthetic reports, and check golden outputs.
+
+  bench_summarize_results.py run      readers and summary_report end to end at several sizes
+  bench_summarize_results.py golden   compare the outputs on a small fixed cohort with benchmarks/golden
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "bin"))
+sys.path.insert(0, BENCH_DIR)
+import summarize_results  # noqa: E402
+from synthetic_reports import write_cohort  # noqa: E402
+
+GOLDEN_DIR = os.path.join(BENCH_DIR, "golden")
+# The golden cohort: small enough to keep in the repository, large enough to hit every code path
+GOLDEN_COHORT = {"n_genes": 400, "n_samples": 2, "detection_rate": 0.1, "seed": 7}
+GOLDEN_FILES = ["single_summary_S1.tsv", "summary_matrix.tsv", "summary_S1.tsv", "summary_S2.tsv", "evidence.tsv"]
+
+
+def measure(func, *args, repeats=1):
+    """Best wall time and peak traced memory (MiB) of func(*args) over repeats."""
+    best, peak = float("inf"), 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def summary_report(args):
+    summarize_results.summary_report.main(args, standalone_mode=False)
+
+
+def single_sample_args(manifest, output_file, extra=()):
+    samples = summarize_results.read_manifest(manifest)
+    _, reports = samples[0]
+    args = [arg for option, path in reports.items() for arg in (f"--{option}", path)]
+    metadata = os.path.join(os.path.dirname(manifest), "panARG_annotations.tsv")
+    return args + ["--metadata", metadata, "--output_file", output_file, *extra]
+
+
+def cohort_args(manifest, output_dir, extra=()):
+    metadata = os.path.join(os.path.dirname(manifest), "panARG_annotations.tsv")
+    return ["--manifest", manifest, "--metadata", metadata, "--output_dir", output_dir,
+            "--matrix_file", "summary_matrix.tsv", *extra]
+
+
+@click.group()
+def cli():
+    """Benchmarks and golden-output checks for bin/summarize_results.py."""
+
+
+@cli.command()
+@click.option('--genes', '-g', multiple=True, type=int, default=[10000, 100000], show_default=True, help='panARG sizes to benchmark (repeatable)')
+@click.option('--samples', '-n', multiple=True, type=int, default=[1, 20], show_default=True, help='Cohort sizes to benchmark (repeatable)')
+@click.option('--detection-rate', default=0.05, show_default=True, help='Fraction of genes reported per (sample, tool)')
+@click.option('--repeats', default=3, show_default=True, help='Timing repeats; the best run is reported')
+@click.option('--jobs', default=1, show_default=True, help='--jobs passed to the cohort summary')
+@click.option('--seed', default=42, show_default=True, help='Random seed for the synthetic reports')
+@click.option('--keep', type=click.Path(), required=False, help='Keep the synthetic reports in this directory')
+def run(genes, samples, detection_rate, repeats, jobs, seed, keep):
+    """Time each report reader and the single-sample and cohort summaries."""
+    readers = [
+        ("groot", summarize_results.read_groot_evidence, ["groot_results"]),
+        ("ariba", summarize_results.read_ariba_evidence, ["ariba_results", "ariba_summary"]),
+        ("karga", summarize_results.read_karga_evidence, ["karga_results"]),
+        ("srst2", summarize_results.read_srst2_evidence, ["srst2_results"]),
+        ("argprofiler", summarize_results.read_argprofiler_evidence, ["argprofiler_results"]),
+    ]
+    click.echo("genes\tsamples\tstep\tseconds\tpeak_MiB")
+    for n_genes in genes:
+        for n_samples in samples:
+            work_dir = tempfile.mkdtemp(prefix="bench_summary.")
+            try:
+                manifest = write_cohort(os.path.join(work_dir, "reports"), n_genes, n_samples, detection_rate, seed)
+                _, reports = summarize_results.read_manifest(manifest)[0]
+                steps = [(f"read_{tool}", reader, [reports[option] for option in options]) for tool, reader, options in readers]
+                steps.append(("summary_report", summary_report, [single_sample_args(manifest, os.path.join(work_dir, "summary_S1.tsv"))]))
+                if n_samples > 1:
+                    steps.append(("summary_cohort", summary_report, [cohort_args(manifest, os.path.join(work_dir, "cohort"), ["--jobs", str(jobs)])]))
+                for name, func, args in steps:
+                    seconds, peak = measure(func, *args, repeats=repeats)
+                    click.echo(f"{n_genes}\t{n_samples}\t{name}\t{seconds:.3f}\t{peak:.1f}")
+            finally:
+                if keep:
+                    shutil.copytree(work_dir, os.path.join(keep, f"g{n_genes}_n{n_samples}"), dirs_exist_ok=True)
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def golden_outputs(work_dir):
+    """Summaries of the golden cohort: one single-sample run and one cohort run with evidence."""
+    manifest = write_cohort(os.path.join(work_dir, "reports"), **GOLDEN_COHORT)
+    output_dir = os.path.join(work_dir, "outputs")
+    os.makedirs(output_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary_report(single_sample_args(manifest, os.path.join(output_dir, "single_summary_S1.tsv")))
+        summary_report(cohort_args(manifest, os.path.join(work_dir, "cohort"), ["--evidence_file", "evidence.tsv"]))
+    for name in GOLDEN_FILES[1:]:
+        shutil.copy(os.path.join(work_dir, "cohort", name), output_dir)
+    return output_dir
+
+
+@cli.command()
+@click.option('--update', is_flag=True, help='Overwrite benchmarks/golden with the current outputs')
+def golden(update):
+    """Check that summaries of a fixed synthetic cohort still match benchmarks/golden."""
+    work_dir = tempfile.mkdtemp(prefix="golden_summary.")
+    try:
+        output_dir = golden_outputs(work_dir)
+        if update:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            for name in GOLDEN_FILES:
+                shutil.copy(os.path.join(output_dir, name), GOLDEN_DIR)
+            click.echo(f"Golden outputs updated in {GOLDEN_DIR}")
+            return
+
+        failed = []
+        for name in GOLDEN_FILES:
+            expected = pd.read_csv(os.path.join(GOLDEN_DIR, name), sep="\t", keep_default_na=False)
+            actual = pd.read_csv(os.path.join(output_dir, name), sep="\t", keep_default_na=False)
+            try:
+                pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+            except AssertionError as e:
+                failed.append(name)
+                click.echo(f"FAIL {name}\n{e}")
+            else:
+                click.echo(f"ok   {name}")
+        if failed:
+            raise click.ClickException(f"{len(failed)} golden output(s) differ: {', '.join(failed)}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Compare the old reduce-of-outer-merges with the indexed merge in summarize_results.py."""
+
+import os
+import sys
+import time
+import tracemalloc
+from functools import reduce
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+from summarize_results import merge_results  # noqa: E402
+
+TOOLS = ["groot_report", "ariba_report", "karga_report", "srst2_report", "ARGprofiler_report"]
+
+
+def synthetic_frames(n_genes, n_samples, detection_rate, seed):
+    """One Gene/call frame per (sample, tool), as returned by the parse_* functions."""
+    rng = np.random.default_rng(seed)
+    genes = np.array([f"panARG_gene_{i:06d}" for i in range(n_genes)], dtype=object)
+    frames = []
+    for sample in range(n_samples):
+        for tool in TOOLS:
+            detected = genes[rng.random(n_genes) < detection_rate]
+            column = f"{tool}_S{sample}.tsv"
+            frames.append(pd.DataFrame({"Gene": detected, column: 1}))
+    return frames
+
+
+def reduce_merge(dfs):
+    """The summary_report merge as it was before the indexed merge."""
+    merged_df = reduce(lambda left, right: pd.merge(left, right, on='Gene', how='outer'), dfs)
+    merged_df.fillna(0, inplace=True)
+    merged_df.columns = merged_df.columns.str.replace(r'\.(csv|tsv|txt)$', '', regex=True)
+    return merged_df
+
+
+def measure(func, frames):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(frames)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+@click.command()
+@click.option('--genes', default=10000, show_default=True, help='Number of genes in the synthetic panARG')
+@click.option('--samples', '-n', multiple=True, type=int, default=[1, 10, 50], show_default=True, help='Sample counts to benchmark (repeatable)')
+@click.option('--detection-rate', default=0.05, show_default=True, help='Fraction of genes called per (sample, tool)')
+@click.option('--repeats', default=3, show_default=True, help='Timing repeats; the best run is reported')
+@click.option('--seed', default=42, show_default=True, help='Random seed for the synthetic calls')
+def main(genes, samples, detection_rate, repeats, seed):
+    """Time and memory-profile both merge paths on synthetic genes x 5 tools x N samples."""
+    click.echo("samples\tframes\tpath\tseconds\tpeak_MiB")
+    for n_samples in samples:
+        frames = synthetic_frames(genes, n_samples, detection_rate, seed)
+        results = {}
+        for name, func in [("reduce_merge", reduce_merge), ("indexed_merge", merge_results)]:
+            runs = [measure(func, frames) for _ in range(repeats)]
+            results[name] = runs[0][0]
+            best = min(run[1] for run in runs)
+            peak = max(run[2] for run in runs) / 2**20
+            click.echo(f"{n_samples}\t{len(frames)}\t{name}\t{best:.3f}\t{peak:.1f}")
+
+        # Both paths must call the same genes
+        old = results["reduce_merge"].set_index("Gene").astype(np.uint8)
+        new = results["indexed_merge"].set_index("Gene")
+        pd.testing.assert_frame_equal(old, new, check_names=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Write synthetic GROOT, ARIBA, KARGA, SRST2 and ARGprofiler reports for benchmarking.
+
+The files follow the layouts the tools write in the pipeline (and that
+summarize_results.py reads), with a seeded random subset of a synthetic panARG
+called per (sample, tool), so the same arguments always produce the same files.
+"""
+
+import os
+
+import click
+import numpy as np
+import pandas as pd
+
+ANNOTATION_COLUMNS = ["userGeneName", "gene_len", "shortname", "database", "entry_count", "id", "allele", "gene_family", "subtype", "class"]
+ARIBA_REPORT_COLUMNS = ["#ariba_ref_name", "ref_name", "gene", "var_only", "flag", "reads", "cluster", "ref_len", "ref_base_assembled", "pc_ident", "ctg", "ctg_len", "ctg_cov"]
+SRST2_COLUMNS = ["Sample", "DB", "gene", "allele", "coverage", "depth", "diffs", "uncertainty", "divergence", "length", "maxMAF", "clusterid", "seqid", "annotation"]
+MAPSTAT_COLUMNS = ["# refSequence", "readCount", "fragmentCount", "mapScoreSum", "refCoveredPositions", "refConsensusSum", "bpTotal", "depthVariance",
+                   "nucHighDepthVariance", "depthMax", "snpSum", "insertSum", "deletionSum", "readCountAln", "fragmentCountAln", "length",
+                   "meanDepthCovered", "spuriosCovRatio", "FragReadRatio", "meanMapScore", "readConsensRefIdentity", "readRefIdentity", "depthCV", "propCovered"]
+# The six "##" lines KMA writes above the mapstat column header
+MAPSTAT_HEADER = ("## method\tKMA\n## version\t1.4.15\n## database\tpanARG\n## fragmentCount\t0\n## date\t2024-01-01\n"
+                  "## command\tkma -ipe sample_R1.fastq.gz sample_R2.fastq.gz -o sample -t_db panARG -ef -1t1 -nf -vcf -matrix\n")
+MANIFEST_COLUMNS = ["sample", "groot_results", "ariba_results", "ariba_summary", "karga_results", "srst2_results", "argprofiler_results"]
+
+
+def gene_names(n_genes):
+    return np.array([f"panARG_gene_{i:06d}" for i in range(n_genes)], dtype=object)
+
+
+def write_annotations(path, genes, rng):
+    """panARG_annotations.tsv for every gene but the last 5%, so some calls stay unannotated."""
+    annotated = genes[: max(1, int(len(genes) * 0.95))]
+    n = len(annotated)
+    family = rng.integers(0, max(1, n // 4), n)
+    pd.DataFrame({
+        "userGeneName": annotated,
+        "gene_len": rng.integers(300, 3000, n),
+        "shortname": [f"sn{i}" for i in family],
+        "database": rng.choice(["card", "megares", "resfinder", "argannot"], n),
+        "entry_count": rng.integers(1, 6, n),
+        "id": [f"id_{gene}" for gene in annotated],
+        "allele": [f"{gene}_1" for gene in annotated],
+        "gene_family": [f"family_{i}" for i in family],
+        "subtype": rng.choice(["AMR", "METAL", "BIOCIDE", "AMR,METAL"], n),
+        "class": [f"class_{i % 40}" for i in family],
+    })[ANNOTATION_COLUMNS].to_csv(path, sep="\t", index=False)
+
+
+def pick(genes, rng, rate):
+    return np.sort(genes[rng.random(len(genes)) < rate])
+
+
+def write_groot(path, genes, rng):
+    # gene, read count, gene length, coverage CIGAR; no header line
+    length = rng.integers(300, 3000, len(genes))
+    covered = (length * rng.uniform(0.6, 1.0, len(genes))).astype(int)
+    cigar = [f"{c}M" if c == n else f"{c}M{n - c}D" for c, n in zip(covered, length)]
+    pd.DataFrame({0: genes, 1: rng.integers(2, 500, len(genes)), 2: length, 3: cigar}).to_csv(path, sep="\t", header=False, index=False)
+
+
+def write_ariba(report_path, summary_path, sample, genes, rng, rows_per_cluster=3):
+    # Several contig rows per cluster in the report; one "<cluster>.match" column per cluster in the summary
+    clusters = np.array([f"{gene}_cluster" for gene in genes], dtype=object)
+    n = len(genes) * rows_per_cluster
+    ref_len = np.repeat(rng.integers(300, 3000, len(genes)), rows_per_cluster)
+    report = pd.DataFrame({
+        "#ariba_ref_name": np.repeat(genes, rows_per_cluster) + ".ref",
+        "ref_name": np.repeat(genes, rows_per_cluster),
+        "gene": 1,
+        "var_only": 0,
+        "flag": 27,
+        "reads": rng.integers(5, 800, n),
+        "cluster": np.repeat(clusters, rows_per_cluster),
+        "ref_len": ref_len,
+        "ref_base_assembled": (ref_len * rng.uniform(0.6, 1.0, n)).astype(int),
+        "pc_ident": rng.uniform(85, 100, n).round(2),
+        "ctg": [f"ctg{i}" for i in range(n)],
+        "ctg_len": ref_len + 50,
+        "ctg_cov": rng.uniform(2, 80, n).round(1),
+    })
+    report[ARIBA_REPORT_COLUMNS].to_csv(report_path, sep="\t", index=False)
+    matches = rng.choice(["yes", "yes", "no", "yes_nonunique"], len(clusters))
+    summary = pd.DataFrame([[os.path.basename(report_path), *matches]], columns=["name", *[f"{cluster}.match" for cluster in clusters]])
+    summary.to_csv(summary_path, index=False)
+
+
+def write_karga(path, genes, rng):
+    pd.DataFrame({
+        "GeneIdx": ">" + pd.Series(genes, dtype=object),
+        "PercentGeneCovered": [f"{value:.2f}%" for value in rng.uniform(40, 100, len(genes))],
+        "AverageKMerDepth": rng.uniform(1, 60, len(genes)).round(3),
+    }).to_csv(path, index=False)
+
+
+def write_srst2(path, sample, genes, rng):
+    n = len(genes)
+    pd.DataFrame({
+        "Sample": sample, "DB": "panARG", "gene": genes, "allele": genes,
+        "coverage": rng.uniform(90, 100, n).round(3), "depth": rng.uniform(2, 80, n).round(3),
+        "diffs": "", "uncertainty": "", "divergence": rng.uniform(0, 5, n).round(3),
+        "length": rng.integers(300, 3000, n), "maxMAF": rng.uniform(0, 0.2, n).round(3),
+        "clusterid": np.arange(n), "seqid": np.arange(n), "annotation": "",
+    })[SRST2_COLUMNS].to_csv(path, sep="\t", index=False)
+
+
+def write_mapstat(path, genes, rng):
+    # KMA filtered mapstat: "##" comment block, then a "# refSequence" header
+    n = len(genes)
+    length = rng.integers(300, 3000, n)
+    covered = rng.uniform(0.5, 1.0, n)
+    depth = rng.uniform(1, 60, n)
+    values = {column: rng.integers(0, 1000, n) for column in MAPSTAT_COLUMNS[1:]}
+    values.update({
+        "# refSequence": genes, "readCount": rng.integers(5, 2000, n), "length": length,
+        "refCoveredPositions": (length * covered).astype(int), "bpTotal": (length * depth).astype(int),
+        "meanDepthCovered": depth.round(2), "spuriosCovRatio": rng.uniform(0, 1, n).round(3),
+        "readConsensRefIdentity": rng.uniform(0.85, 1, n).round(4), "readRefIdentity": rng.uniform(0.85, 1, n).round(4),
+        "propCovered": covered.round(4),
+    })
+    with open(path, "w") as handle:
+        handle.write(MAPSTAT_HEADER)
+        pd.DataFrame(values)[MAPSTAT_COLUMNS].to_csv(handle, sep="\t", index=False)
+
+
+def write_raw_mapstat(path, refdata_path, genes, rng):
+    """Raw KMA mapstat (no length or derived columns) and a refdata file of gene lengths.
+
+    Values straddle the mapstatFilters.R thresholds, a few genes are missing
+    from the refdata and some counts are zero or large enough for R to print
+    them in scientific notation.
+    """
+    n = len(genes)
+    length = rng.integers(300, 3000, n)
+    covered = (length * rng.uniform(0.7, 1.0, n)).astype(np.int64)
+    bp_total = (length * rng.uniform(1, 15, n)).astype(np.int64)
+    bp_total[::17] = 10 ** rng.integers(9, 12, len(bp_total[::17]))
+    reads_aln = rng.integers(0, 2000, n)
+    reads_aln[::13] = 0
+    values = {
+        "# refSequence": genes, "readCount": rng.integers(5, 2000, n), "fragmentCount": rng.integers(5, 1000, n),
+        "mapScoreSum": rng.integers(0, 10 ** 6, n), "refCoveredPositions": covered,
+        "refConsensusSum": (covered * rng.uniform(0.85, 1.0, n)).astype(np.int64), "bpTotal": bp_total,
+        "depthVariance": rng.uniform(0, 50, n).round(6), "nucHighDepthVariance": (covered * rng.uniform(0, 1.2, n)).astype(np.int64),
+        "depthMax": rng.integers(1, 200, n), "snpSum": (bp_total * rng.uniform(0, 0.15, n)).astype(np.int64),
+        "insertSum": rng.integers(0, 20, n), "deletionSum": rng.integers(0, 20, n),
+        "readCountAln": reads_aln, "fragmentCountAln": (reads_aln * rng.uniform(0.4, 0.6, n)).astype(np.int64),
+    }
+    with open(path, "w") as handle:
+        handle.write(MAPSTAT_HEADER)
+        pd.DataFrame(values)[MAPSTAT_COLUMNS[:15]].to_csv(handle, sep="\t", index=False)
+    known = rng.random(n) < 0.97
+    pd.DataFrame({0: genes[known], 1: length[known], 2: "panARG"}).to_csv(refdata_path, sep="\t", header=False, index=False)
+
+
+def write_cohort(output_dir, n_genes=5000, n_samples=3, detection_rate=0.05, seed=42):
+    """Write annotations, per-sample reports of all five tools and a manifest; returns the manifest path."""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    genes = gene_names(n_genes)
+    write_annotations(os.path.join(output_dir, "panARG_annotations.tsv"), genes, rng)
+
+    rows = []
+    for index in range(n_samples):
+        sample = f"S{index + 1}"
+        paths = {
+            "groot_results": f"groot_report_{sample}.tsv",
+            "ariba_results": f"ariba_report_{sample}.tsv",
+            "ariba_summary": f"ariba_summary_{sample}.csv",
+            "karga_results": f"karga_report_{sample}.csv",
+            "srst2_results": f"srst2_report_{sample}_fullgenes_sequence_results.txt",
+            "argprofiler_results": f"ARGprofiler_report_{sample}.txt",
+        }
+        full = {option: os.path.join(output_dir, name) for option, name in paths.items()}
+        write_groot(full["groot_results"], pick(genes, rng, detection_rate), rng)
+        write_ariba(full["ariba_results"], full["ariba_summary"], sample, pick(genes, rng, detection_rate), rng)
+        write_karga(full["karga_results"], pick(genes, rng, detection_rate), rng)
+        write_srst2(full["srst2_results"], sample, pick(genes, rng, detection_rate), rng)
+        write_mapstat(full["argprofiler_results"], pick(genes, rng, detection_rate), rng)
+        rows.append({"sample": sample, **paths})
+
+    manifest = os.path.join(output_dir, "manifest.tsv")
+    pd.DataFrame(rows)[MANIFEST_COLUMNS].to_csv(manifest, sep="\t", index=False)
+    return manifest
+
+
+@click.command()
+@click.argument('output_dir', type=click.Path())
+@click.option('--genes', default=5000, show_default=True, help='Number of genes in the synthetic panARG')
+@click.option('--samples', default=3, show_default=True, help='Number of samples')
+@click.option('--detection-rate', default=0.05, show_default=True, help='Fraction of genes reported per (sample, tool)')
+@click.option('--seed', default=42, show_default=True, help='Random seed')
+def main(output_dir, genes, samples, detection_rate, seed):
+    """Write a synthetic cohort (reports, annotations and manifest.tsv) to OUTPUT_DIR."""
+    manifest = write_cohort(output_dir, genes, samples, detection_rate, seed)
+    click.echo(f"Synthetic cohort: {manifest}")
+
+
+if __name__ == '__main__':
+    main()
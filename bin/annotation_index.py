@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Compile panARG_annotations.tsv into a memory-mappable NumPy index.
+
+The index is a directory of .npy files:
+  genes.npy           sorted userGeneName keys (UTF-8 bytes); the row number is the gene ID
+  <n>.npy             numeric annotation columns, in key order
+  <n>.data.npy        string annotation columns as one UTF-8 blob ...
+  <n>.offsets.npy     ... with row offsets into the blob
+  <n>.null.npy        missing-value mask of string columns
+  meta.json           column layout and the size/mtime/sha256 of the source TSV
+
+Jobs sharing an index coordinate through <index>.lock next to it: the index
+is built and swapped in under an exclusive lock, and opened under a shared one.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import click
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 1
+KEY_COLUMN = "userGeneName"
+
+
+def default_index_path(tsv):
+    return f"{tsv}.idx"
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_stamp(tsv):
+    stat = os.stat(tsv)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+@contextlib.contextmanager
+def index_lock(index_dir, exclusive=True):
+    """Hold <index_dir>.lock, exclusively to build the index or shared to open it."""
+    with open(f"{index_dir.rstrip(os.sep)}.lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def write_meta(index_dir, meta):
+    # Replaced in one step, so a reader never parses a half-written file
+    handle, path = tempfile.mkstemp(prefix=".meta.", dir=index_dir)
+    try:
+        with os.fdopen(handle, "w") as out:
+            json.dump(meta, out, indent=2)
+        os.replace(path, os.path.join(index_dir, "meta.json"))
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        raise
+
+
+def read_meta(index_dir):
+    try:
+        with open(os.path.join(index_dir, "meta.json")) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def index_is_current(tsv, index_dir):
+    """Check the index against the TSV: size/mtime first, the checksum only if those changed."""
+    meta = read_meta(index_dir)
+    if meta is None or meta.get("version") != INDEX_VERSION:
+        return False
+    stamp = source_stamp(tsv)
+    if stamp["size"] == meta["size"] and stamp["mtime_ns"] == meta["mtime_ns"]:
+        return True
+    if stamp["size"] != meta["size"] or file_checksum(tsv) != meta["sha256"]:
+        return False
+    # Same content with a new mtime (e.g. re-copied): refresh the stamp if we can
+    meta.update(stamp)
+    with contextlib.suppress(OSError):
+        write_meta(index_dir, meta)
+    return True
+
+
+def compile_index(tsv, index_dir):
+    """Build the index for tsv in index_dir, replacing any previous index."""
+    stamp = source_stamp(tsv)
+    checksum = file_checksum(tsv)
+    annotations = pd.read_csv(tsv, sep="\t")
+    if KEY_COLUMN not in annotations.columns:
+        raise click.ClickException(f"'{KEY_COLUMN}' column not found in {tsv}")
+    annotations = annotations.sort_values(KEY_COLUMN, kind="stable", ignore_index=True)
+
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    build_dir = tempfile.mkdtemp(prefix=".annotation_index.", dir=parent)
+    try:
+        keys = annotations[KEY_COLUMN].astype(str).str.encode("utf-8")
+        np.save(os.path.join(build_dir, "genes.npy"), np.array(keys.tolist(), dtype=bytes))
+
+        columns = []
+        for position, column in enumerate(annotations.columns):
+            values = annotations[column]
+            if values.dtype.kind in "biuf":
+                np.save(os.path.join(build_dir, f"{position}.npy"), values.to_numpy())
+                columns.append({"name": column, "kind": "number"})
+                continue
+            missing = values.isna().to_numpy()
+            encoded = [b"" if null else str(value).encode("utf-8") for value, null in zip(values, missing)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            np.save(os.path.join(build_dir, f"{position}.data.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(os.path.join(build_dir, f"{position}.offsets.npy"), offsets)
+            np.save(os.path.join(build_dir, f"{position}.null.npy"), missing)
+            columns.append({"name": column, "kind": "string"})
+
+        meta = {"version": INDEX_VERSION, "source": os.path.abspath(tsv), "sha256": checksum,
+                "rows": len(annotations), "columns": columns, **stamp}
+        write_meta(build_dir, meta)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    # Move the old index aside, rename the new one in, then delete the old one, so
+    # readers never see a half-deleted index (open ones keep their mapped files)
+    old_dir = None
+    if os.path.isdir(index_dir):
+        old_dir = tempfile.mkdtemp(prefix=".annotation_index.old.", dir=parent)
+        try:
+            os.rename(index_dir, os.path.join(old_dir, "index"))
+        except OSError:
+            # Already moved aside by a concurrent build
+            pass
+    try:
+        os.rename(build_dir, index_dir)
+    except OSError:
+        # Another summary job installed the same index first
+        shutil.rmtree(build_dir, ignore_errors=True)
+        if not index_is_current(tsv, index_dir):
+            raise
+    finally:
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    return index_dir
+
+
+class AnnotationIndex:
+    """Read-only view of a compiled index; arrays are memory-mapped, not loaded."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.meta = read_meta(index_dir)
+        if self.meta is None:
+            raise click.ClickException(f"No annotation index found in {index_dir}")
+        # Map every file now, so a rebuild swapped in later does not mix two indexes
+        names = ["genes.npy"]
+        for position, column in enumerate(self.meta["columns"]):
+            suffixes = [".npy"] if column["kind"] == "number" else [".data.npy", ".offsets.npy", ".null.npy"]
+            names.extend(f"{position}{suffix}" for suffix in suffixes)
+        self.arrays = {name: np.load(os.path.join(index_dir, name), mmap_mode="r") for name in names}
+        self.genes = self._load("genes.npy")
+        self.columns = [column["name"] for column in self.meta["columns"]]
+
+    def _load(self, name):
+        return self.arrays[name]
+
+    def gene_ids(self, genes):
+        """Row numbers (gene IDs) for genes; -1 where a gene is not annotated."""
+        query = np.array([str(gene).encode("utf-8") for gene in genes], dtype=bytes)
+        if len(self.genes) == 0 or len(query) == 0:
+            return np.full(len(query), -1, dtype=np.int64)
+        rows = np.searchsorted(self.genes, query)
+        found = rows < len(self.genes)
+        found[found] = self.genes[rows[found]] == query[found]
+        return np.where(found, rows, -1)
+
+    def lookup(self, genes):
+        """Annotation rows (all columns, TSV column order) for the genes that are present."""
+        query = np.unique(np.array([str(gene).encode("utf-8") for gene in genes], dtype=bytes))
+        left = np.searchsorted(self.genes, query, side="left")
+        right = np.searchsorted(self.genes, query, side="right")
+        counts = right - left
+        # Expand [left, right) ranges so duplicated keys return every row
+        rows = np.repeat(left, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.rows(rows)
+
+    def rows(self, rows):
+        data = {}
+        for position, column in enumerate(self.meta["columns"]):
+            if column["kind"] == "number":
+                data[column["name"]] = np.asarray(self._load(f"{position}.npy")[rows])
+                continue
+            blob = self._load(f"{position}.data.npy")
+            offsets = self._load(f"{position}.offsets.npy")
+            missing = self._load(f"{position}.null.npy")
+            data[column["name"]] = pd.Series(
+                [np.nan if missing[row] else bytes(blob[offsets[row]:offsets[row + 1]]).decode("utf-8") for row in rows],
+                dtype=object,
+            )
+        return pd.DataFrame(data)
+
+
+def open_index(tsv, index_dir=None):
+    """Open the index for tsv, rebuilding it if the TSV changed. Returns None if it cannot be built or opened."""
+    index_dir = index_dir or default_index_path(tsv)
+    try:
+        with index_lock(index_dir, exclusive=False):
+            if index_is_current(tsv, index_dir):
+                return AnnotationIndex(index_dir)
+        with index_lock(index_dir):
+            # Concurrent summary jobs queue here; only the first one builds it
+            if not index_is_current(tsv, index_dir):
+                click.echo(f"Compiling annotation index: {index_dir}")
+                compile_index(tsv, index_dir)
+            return AnnotationIndex(index_dir)
+    except OSError as e:
+        print(f"Warning: could not use annotation index {index_dir} ({e}); reading {tsv} directly.")
+        return None
+
+
+@click.group()
+def cli():
+    """Compile and inspect the panARG annotation index used by summarize_results.py."""
+
+
+@cli.command("compile")
+@click.argument('metadata', type=click.Path(exists=True))
+@click.option('--index', 'index_dir', type=click.Path(), required=False, help='Index directory (default: <metadata>.idx)')
+@click.option('--force', is_flag=True, help='Rebuild even if the index is up to date')
+def compile_command(metadata, index_dir, force):
+    """Compile METADATA (panARG_annotations.tsv) into a binary index."""
+    index_dir = index_dir or default_index_path(metadata)
+    with index_lock(index_dir):
+        if not force and index_is_current(metadata, index_dir):
+            click.echo(f"Annotation index is up to date: {index_dir}")
+            return
+        compile_index(metadata, index_dir)
+        meta = read_meta(index_dir)
+    click.echo(f"Annotation index: {index_dir} ({meta['rows']} genes, sha256 {meta['sha256'][:12]})")
+
+
+@cli.command("info")
+@click.argument('index_dir', type=click.Path(exists=True))
+def info_command(index_dir):
+    """Print the layout and source checksum of INDEX_DIR."""
+    meta = read_meta(index_dir)
+    if meta is None:
+        raise click.ClickException(f"No annotation index found in {index_dir}")
+    click.echo(f"source\t{meta['source']}")
+    click.echo(f"sha256\t{meta['sha256']}")
+    click.echo(f"rows\t{meta['rows']}")
+    for column in meta["columns"]:
+        click.echo(f"column\t{column['name']}\t{column['kind']}")
+
+
+if __name__ == '__main__':
+    cli()
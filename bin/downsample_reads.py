@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Downsample a FASTQ pair to a target sequencing depth.
+
+The genome size is taken from --genome_size or estimated from a k-mer
+spectrum of R1: canonical 21-mers are hash-sampled (1 in 64), counted, and
+the solid k-mer occurrences divided by the depth at the spectrum peak. The
+depth is the bases of the pair over the genome size; pairs are then kept
+with probability target / depth from a seeded generator, so the same seed
+and chunk size give the same reads. Samples already at or below the target
+are linked through unchanged.
+"""
+
+import json
+import os
+
+import click
+import numpy as np
+
+from kmer_prescreen import CODES, kmer_codes, open_text, read_sequences
+from prepare_reads import open_input, open_output, read_chunks
+
+ESTIMATE_K = 21
+# Keep the k-mers whose hash has its top SKETCH_BITS bits clear: 1 in 2**SKETCH_BITS
+SKETCH_BITS = 6
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def kmer_spectrum(read_file, max_reads=None, chunk_bytes=4 << 20):
+    """
+    Reads and bases of read_file, and the count histogram of its hash-sampled
+    canonical k-mers (over the first max_reads reads; max_reads=0 only counts).
+    """
+    sketch = []
+    n_reads = n_bases = sketched = 0
+    with open_text(read_file) as handle:
+        for sequences in read_sequences(handle, chunk_bytes):
+            n_reads += len(sequences)
+            n_bases += sum(map(len, sequences))
+            if max_reads is not None:
+                # Stop at max_reads, within the chunk
+                sequences = sequences[:max(0, max_reads - sketched)]
+            if not sequences:
+                continue
+            sketched += len(sequences)
+            kmers, valid = kmer_codes(CODES[np.frombuffer(b'\n'.join(sequences), dtype=np.uint8)], ESTIMATE_K)
+            kmers = kmers[valid]
+            sketch.append(kmers[(kmers * HASH_MULTIPLIER) >> np.uint64(64 - SKETCH_BITS) == 0])
+    _, counts = np.unique(np.concatenate(sketch) if sketch else np.zeros(0, dtype=np.uint64), return_counts=True)
+    histogram = np.bincount(counts) if len(counts) else np.zeros(1, dtype=np.int64)
+    return n_reads, n_bases, sketched, histogram
+
+
+def estimate_genome_size(histogram):
+    """
+    Genome size and k-mer depth from a k-mer count histogram: error k-mers sit
+    below the first valley, the genome's k-mers around the peak after it.
+    """
+    counts = histogram.astype(float)
+    # First local minimum after count 1, then the most frequent count beyond it
+    valley = next((c for c in range(2, len(counts) - 1) if counts[c] <= counts[c + 1]), None)
+    if valley is None:
+        return None, None
+    peak = valley + int(np.argmax(counts[valley:]))
+    if counts[peak] == 0:
+        return None, None
+    solid = np.arange(valley, len(counts)) @ counts[valley:]
+    return int(solid / peak * 2 ** SKETCH_BITS), peak
+
+
+def parse_genome_size(value):
+    # Bases, with an optional k/m/g suffix
+    size = value.strip().lower()
+    multiplier = {'k': 10**3, 'm': 10**6, 'g': 10**9}.get(size[-1:], 1)
+    try:
+        return int(float(size.rstrip('kmg')) * multiplier)
+    except ValueError:
+        raise click.BadParameter(f"not a genome size: {value}", param_hint='--genome_size')
+
+
+def estimate_depth(r1_file, genome_size=None, estimate_reads=2000000):
+    """Read pairs, genome size, depth of the pair and k-mer depth (None when the genome size is given)."""
+    # With a genome size, R1 is only counted
+    n_reads, r1_bases, _, histogram = kmer_spectrum(r1_file, 0 if genome_size else estimate_reads)
+    if genome_size:
+        genome, kmer_depth = parse_genome_size(genome_size), None
+    else:
+        genome, kmer_depth = estimate_genome_size(histogram)
+        if genome is None:
+            raise click.ClickException(f"Could not estimate the genome size from the k-mer spectrum of {r1_file}; pass the genome size")
+    # R2 is assumed to carry as many bases as R1
+    return n_reads, genome, 2 * r1_bases / genome, kmer_depth
+
+
+def link_or_copy(source, target):
+    try:
+        os.symlink(os.path.realpath(source), target)
+    except OSError:
+        import shutil
+        shutil.copyfile(source, target)
+
+
+def downsample_pairs(r1_file, r2_file, output_prefix, fraction, seed, compress_level=1, threads=1, chunk_pairs=50000):
+    """Keep each pair with probability fraction; returns the pairs read and kept."""
+    rng = np.random.default_rng(seed)
+    kept = total = 0
+    out1 = open_output(f"{output_prefix}_R1.fastq.gz", compress_level, threads)
+    out2 = open_output(f"{output_prefix}_R2.fastq.gz", compress_level, threads)
+    try:
+        with open_input(r1_file, threads) as r1, open_input(r2_file, threads) as r2:
+            for lines1, lines2 in read_chunks(r1, r2, chunk_pairs):
+                n_pairs = len(lines1) // 4
+                keep = np.flatnonzero(rng.random(n_pairs) < fraction)
+                out1.writelines([line for i in keep for line in lines1[4 * i:4 * i + 4]])
+                out2.writelines([line for i in keep for line in lines2[4 * i:4 * i + 4]])
+                total += n_pairs
+                kept += len(keep)
+    finally:
+        out1.close()
+        out2.close()
+    return total, kept
+
+
+@click.command()
+@click.option('--r1', 'r1_file', type=click.Path(exists=True), required=True, help='Forward reads (FASTQ, optionally gzipped)')
+@click.option('--r2', 'r2_file', type=click.Path(exists=True), required=True, help='Reverse reads (FASTQ, optionally gzipped)')
+@click.option('--target_depth', type=click.FloatRange(min=0, min_open=True), required=True, help='Depth (X) to downsample to')
+@click.option('--genome_size', type=str, required=False, help='Genome size in bases (k/m/g suffixes allowed); estimated from the reads if omitted')
+@click.option('--estimate_reads', type=click.IntRange(min=1), default=2000000, show_default=True, help='R1 reads used for the k-mer spectrum')
+@click.option('--seed', type=int, default=42, show_default=True, help='Random seed')
+@click.option('--output_prefix', required=True, help='Writes <prefix>_R1.fastq.gz and <prefix>_R2.fastq.gz')
+@click.option('--compress_level', type=click.IntRange(1, 9), default=1, show_default=True, help='gzip level of the downsampled reads')
+@click.option('--threads', type=click.IntRange(min=1), default=1, show_default=True, help='pigz threads per stream, when pigz is installed')
+@click.option('--stats_file', required=False, help='Write the depth estimate and read counts as JSON')
+def main(r1_file, r2_file, target_depth, genome_size, estimate_reads, seed, output_prefix, compress_level, threads, stats_file):
+    """Estimate the depth of a read pair and subsample the pairs to --target_depth."""
+    n_reads, genome, depth, kmer_depth = estimate_depth(r1_file, genome_size, estimate_reads)
+    fraction = min(1.0, target_depth / depth)
+    click.echo(f"{n_reads} pairs, genome size {genome}, depth {depth:.1f}x: keeping {fraction:.3f} of the pairs")
+
+    if fraction >= 1:
+        link_or_copy(r1_file, f"{output_prefix}_R1.fastq.gz")
+        link_or_copy(r2_file, f"{output_prefix}_R2.fastq.gz")
+        total, kept = n_reads, n_reads
+    else:
+        total, kept = downsample_pairs(r1_file, r2_file, output_prefix, fraction, seed, compress_level, threads)
+
+    if stats_file:
+        stats = {"read_pairs": total, "kept_pairs": kept, "genome_size": genome, "kmer_depth": kmer_depth,
+                 "depth": round(depth, 2), "target_depth": target_depth, "fraction": round(fraction, 6), "seed": seed}
+        with open(stats_file, 'w') as handle:
+            json.dump(stats, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Crosswalk from the gene names each tool reports to panARG gene IDs.
+
+Every tool names genes after its own database build: GROOT and ARIBA report the
+first word of the FASTA header, KARGA and KMA (ARGprofiler) the whole header
+line, and SRST2 the gene field of <cluster>__<gene>__<allele>__<id>. build reads
+the tool FASTA files once and resolves every record to its panARG userGeneName:
+  name      a reported name is an annotated userGeneName
+  master    the header is a source header (fa_header) of panARG_master_gene_tbl.tsv
+  sequence  the sequence is that of a panARG gene (--panarg_fasta)
+The crosswalk is a TSV of (tool, identifier, gene, match). The summarizer turns
+each gene into its annotation index row (the gene ID), so the IDs always follow
+the current index, and joins the tool reports and the annotations on those IDs.
+"""
+
+import hashlib
+import os
+from collections import Counter
+
+import click
+import numpy as np
+import pandas as pd
+
+from kmer_prescreen import open_text
+
+CROSSWALK_COLUMNS = ["tool", "identifier", "gene", "match"]
+# Preference when a tool identifier resolves to several genes (e.g. an SRST2 gene field shared by alleles)
+MATCH_RANK = {"name": 0, "master": 1, "sequence": 2}
+
+
+def read_fasta_headers(path):
+    """Yield (header line without '>', upper-case sequence bytes) of a FASTA file."""
+    header, chunks = None, []
+    with open_text(path) as handle:
+        for line in handle:
+            if line.startswith(b'>'):
+                if header is not None:
+                    yield header, b''.join(chunks).upper()
+                header, chunks = line[1:].decode().strip(), []
+            else:
+                chunks.append(line.strip())
+    if header is not None:
+        yield header, b''.join(chunks).upper()
+
+
+def sequence_key(sequence):
+    return hashlib.sha1(sequence).digest()
+
+
+def record_identifiers(tool, header):
+    """The names a tool may report for a FASTA record."""
+    name = header.split(None, 1)[0] if header else header
+    identifiers = [name]
+    if header != name:
+        # KARGA's GeneIdx and KMA's refSequence keep the whole header line
+        identifiers.append(header)
+    fields = name.split("__")
+    if tool == "srst2" and len(fields) >= 4:
+        identifiers.append(fields[1])
+    return identifiers
+
+
+def record_candidates(tool, header):
+    # Names tried against the annotations: the identifiers, then the SRST2 allele field
+    candidates = record_identifiers(tool, header)
+    fields = candidates[0].split("__")
+    if tool == "srst2" and len(fields) >= 4:
+        candidates.append(fields[2])
+    return candidates
+
+
+def read_master_aliases(master_table, genes):
+    """{source header or its first word: userGeneName} of the GeneAssimilatoR master gene table."""
+    master = pd.read_csv(master_table, sep="\t", usecols=["userGeneName", "fa_header"], dtype=str).dropna()
+    master = master[master["userGeneName"].isin(genes)]
+    aliases = dict(zip(master["fa_header"].str.split(n=1).str[0], master["userGeneName"]))
+    aliases.update(zip(master["fa_header"].str.strip(), master["userGeneName"]))
+    return aliases
+
+
+def resolve_name(candidates, genes, aliases):
+    for candidate in candidates:
+        if candidate in genes:
+            return candidate, "name"
+    for candidate in candidates:
+        if candidate in aliases:
+            return aliases[candidate], "master"
+    return None, None
+
+
+def read_panarg_sequences(fasta_files, genes, aliases):
+    """{sequence key: userGeneName} of the panARG gene sequences."""
+    sequences = {}
+    for path in fasta_files:
+        for header, sequence in read_fasta_headers(path):
+            gene, _ = resolve_name(record_candidates(None, header), genes, aliases)
+            if gene is not None:
+                sequences.setdefault(sequence_key(sequence), gene)
+    return sequences
+
+
+def build_crosswalk(sources, genes, aliases=None, sequences=None):
+    """
+    Resolve the records of {tool: FASTA} to panARG genes. Returns the crosswalk,
+    per-tool counts of the resolved records, and the unresolved (tool, header) rows.
+    """
+    aliases, sequences = aliases or {}, sequences or {}
+    rows, unresolved, counts = [], [], {}
+    for tool, path in sources.items():
+        counts[tool] = Counter()
+        for header, sequence in read_fasta_headers(path):
+            gene, match = resolve_name(record_candidates(tool, header), genes, aliases)
+            if gene is None and sequence_key(sequence) in sequences:
+                gene, match = sequences[sequence_key(sequence)], "sequence"
+            counts[tool][match or "unresolved"] += 1
+            if gene is None:
+                unresolved.append((tool, header))
+                continue
+            rows.extend((tool, identifier, gene, match) for identifier in record_identifiers(tool, header))
+
+    crosswalk = pd.DataFrame(rows, columns=CROSSWALK_COLUMNS)
+    # One gene per (tool, identifier): the identifier's own gene if it is one, then the best match
+    crosswalk["exact"] = crosswalk["identifier"] == crosswalk["gene"]
+    crosswalk["rank"] = crosswalk["match"].map(MATCH_RANK)
+    crosswalk = crosswalk.sort_values(["tool", "identifier", "exact", "rank"], ascending=[True, True, False, True], kind="stable")
+    ambiguous = crosswalk.groupby(["tool", "identifier"])["gene"].nunique()
+    crosswalk = crosswalk.drop_duplicates(["tool", "identifier"])[CROSSWALK_COLUMNS].reset_index(drop=True)
+    return crosswalk, counts, pd.DataFrame(unresolved, columns=["tool", "header"]), int((ambiguous > 1).sum())
+
+
+class GeneCrosswalk:
+    """Tool identifiers to annotation index rows (gene IDs); -1 where a name does not resolve."""
+
+    def __init__(self, crosswalk_file, index):
+        self.index = index
+        crosswalk = pd.read_csv(crosswalk_file, sep="\t", dtype=str, keep_default_na=False)
+        missing = [column for column in CROSSWALK_COLUMNS if column not in crosswalk.columns]
+        if missing:
+            raise click.ClickException(f"{crosswalk_file} is not a gene crosswalk (missing {', '.join(missing)})")
+        genes = crosswalk["gene"].unique()
+        gene_ids = pd.Series(index.gene_ids(genes), index=genes)
+        stale = int((gene_ids < 0).sum())
+        if stale:
+            print(f"Warning: {stale} crosswalk genes are not in the annotation index; rebuild {crosswalk_file}.")
+        self.tools = {}
+        for tool, entries in crosswalk.groupby("tool"):
+            entries = entries.drop_duplicates("identifier")
+            self.tools[tool] = (pd.Index(entries["identifier"]), gene_ids[entries["gene"]].to_numpy(dtype=np.int64))
+
+    def gene_ids(self, tool, names):
+        """Gene IDs of the names a tool reported; names missing from the crosswalk are looked up as genes."""
+        names = pd.Series(names, dtype=object).astype(str)
+        ids = np.asarray(self.index.gene_ids(names), dtype=np.int64)
+        if tool in self.tools and len(names):
+            identifiers, tool_ids = self.tools[tool]
+            rows = identifiers.get_indexer(names)
+            ids = np.where(rows >= 0, tool_ids[rows], ids)
+        return ids
+
+
+@click.group()
+def cli():
+    """Build and inspect the tool-name to panARG gene crosswalk used by summarize_results.py."""
+
+
+@cli.command("build")
+@click.option('--metadata', type=click.Path(exists=True), required=True, help='panARG annotations (panARG_annotations.tsv)')
+@click.option('--fasta', 'fasta_files', multiple=True, required=True, help='Tool database FASTA as TOOL=PATH, e.g. srst2=sequence.fa (repeatable; tools: groot, ariba, karga, srst2, argprofiler)')
+@click.option('--master_table', type=click.Path(exists=True), required=False, help='GeneAssimilatoR panARG_master_gene_tbl.tsv; resolves source database headers')
+@click.option('--panarg_fasta', multiple=True, type=click.Path(exists=True), help='panARG gene sequences; resolves renamed records by sequence (repeatable)')
+@click.option('--output', required=True, type=click.Path(), help='Crosswalk (TSV)')
+@click.option('--unresolved_file', required=False, help='Also write the tool records that resolve to no panARG gene (TSV)')
+def build_command(metadata, fasta_files, master_table, panarg_fasta, output, unresolved_file):
+    """Resolve the records of the tool databases to panARG genes."""
+    sources = {}
+    for fasta in fasta_files:
+        tool, _, path = fasta.partition('=')
+        if not path:
+            raise click.BadParameter(f"expected TOOL=PATH, got {fasta}", param_hint="--fasta")
+        if not os.path.exists(path):
+            raise click.BadParameter(f"{path} not found", param_hint="--fasta")
+        sources[tool] = path
+    genes = set(pd.read_csv(metadata, sep="\t", usecols=["userGeneName"], dtype=str)["userGeneName"].dropna())
+    aliases = read_master_aliases(master_table, genes) if master_table else {}
+    sequences = read_panarg_sequences(panarg_fasta, genes, aliases)
+
+    crosswalk, counts, unresolved, ambiguous = build_crosswalk(sources, genes, aliases, sequences)
+    crosswalk.to_csv(output, sep="\t", index=False)
+    if unresolved_file:
+        unresolved.to_csv(unresolved_file, sep="\t", index=False)
+
+    click.echo("tool\trecords\tname\tmaster\tsequence\tunresolved")
+    for tool, count in counts.items():
+        click.echo(f"{tool}\t{sum(count.values())}\t{count['name']}\t{count['master']}\t{count['sequence']}\t{count['unresolved']}")
+    if ambiguous:
+        click.echo(f"Warning: {ambiguous} identifiers resolve to several genes; kept the best match of each.", err=True)
+    click.echo(f"Gene crosswalk: {output} ({len(crosswalk)} identifiers, {crosswalk['gene'].nunique()} genes)")
+
+
+@cli.command("info")
+@click.argument('crosswalk_file', type=click.Path(exists=True))
+def info_command(crosswalk_file):
+    """Print the identifiers per tool and match type of CROSSWALK_FILE."""
+    crosswalk = pd.read_csv(crosswalk_file, sep="\t", dtype=str, keep_default_na=False)
+    counts = crosswalk.groupby(["tool", "match"]).size().unstack(fill_value=0)
+    click.echo(counts.to_csv(sep="\t"), nl=False)
+    click.echo(f"genes\t{crosswalk['gene'].nunique()}")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Stage timers, peak-RSS sampling and profiles for the Python steps of the pipeline.
+
+Instrumentation is off unless the environment asks for it, so the timers cost
+nothing in normal runs:
+  ARG_SNIPER_METRICS=metrics.jsonl   append one JSON record per stage (stage, script,
+                                     wall and CPU seconds, RSS at start/end and its sampled peak)
+  ARG_SNIPER_PROFILE=run.prof        also run the whole script under cProfile and dump the
+                                     stats (pstats format: snakeviz, gprof2dot, python -m pstats)
+  ARG_SNIPER_RELEASE=v1.2            pipeline release stored in every record
+
+Records are appended with one write each, so parse workers of a process pool
+can share the metrics file. `instrumentation.py collect` aggregates the records
+of a run into a per-stage summary and compares it with the summary of an
+earlier release.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import resource
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+import pandas as pd
+
+METRICS_ENV = "ARG_SNIPER_METRICS"
+PROFILE_ENV = "ARG_SNIPER_PROFILE"
+RELEASE_ENV = "ARG_SNIPER_RELEASE"
+SCRIPT_ENV = "ARG_SNIPER_SCRIPT"
+SAMPLE_INTERVAL = 0.02
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+SUMMARY_KEYS = ["script", "stage", "tool"]
+
+_state = threading.local()
+
+
+def current_rss():
+    # Resident set size in bytes, from /proc where there is one
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return max_rss()
+
+
+def max_rss():
+    # Peak RSS of the process so far (ru_maxrss is in KiB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    """Poll the RSS in a background thread and keep the highest value seen."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def write_record(record, metrics_file=None):
+    metrics_file = metrics_file or os.environ.get(METRICS_ENV)
+    if metrics_file:
+        with open(metrics_file, "a") as handle:
+            handle.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a stage and write its metrics record; fields (tool, sample, ...) are
+    stored with it. Yields the record, so rows or bytes can be added once known.
+    Stages nest: the record keeps the path of the enclosing stages.
+    """
+    if not os.environ.get(METRICS_ENV):
+        yield {}
+        return
+    stack = getattr(_state, "stack", None)
+    if stack is None:
+        stack = _state.stack = []
+    record = {"script": os.environ.get(SCRIPT_ENV, ""), "stage": name, **fields}
+    stack.append(name)
+    rss_start = current_rss()
+    start, cpu_start, started = time.perf_counter(), time.process_time(), time.time()
+    try:
+        with RSSSampler() as sampler:
+            yield record
+    finally:
+        record.update({
+            "path": "/".join(stack),
+            "seconds": round(time.perf_counter() - start, 6),
+            "cpu_seconds": round(time.process_time() - cpu_start, 6),
+            "rss_start": rss_start,
+            "rss_end": current_rss(),
+            "peak_rss": sampler.peak,
+            "started": started,
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "release": os.environ.get(RELEASE_ENV, ""),
+        })
+        stack.pop()
+        write_record(record)
+
+
+def instrumented(script):
+    """
+    Decorator for the entry point of a script: names the records after script,
+    times the whole run as the stage "total" and, with ARG_SNIPER_PROFILE set,
+    profiles it.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # Exported, so pool workers started from here name their records too
+            os.environ[SCRIPT_ENV] = script
+            profile_file = os.environ.get(PROFILE_ENV)
+            profiler = cProfile.Profile() if profile_file else None
+            with stage("total") as record:
+                if profiler:
+                    profiler.enable()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    if profiler:
+                        profiler.disable()
+                        profiler.dump_stats(profile_file)
+                    if record:
+                        record["max_rss"] = max_rss()
+                        record["children_max_rss"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        return wrapper
+    return decorate
+
+
+def read_records(paths):
+    records = []
+    for path in paths:
+        with open(path) as handle:
+            records.extend(json.loads(line) for line in handle if line.strip())
+    return pd.DataFrame(records)
+
+
+def summarize_records(records):
+    """Per (script, stage, tool): runs, wall/CPU seconds and the highest peak RSS."""
+    records = records.copy()
+    for key in SUMMARY_KEYS:
+        records[key] = records[key].fillna("") if key in records.columns else ""
+    grouped = records.groupby(SUMMARY_KEYS)
+    return pd.DataFrame({
+        "runs": grouped.size(),
+        "seconds_total": grouped["seconds"].sum(),
+        "seconds_mean": grouped["seconds"].mean(),
+        "seconds_max": grouped["seconds"].max(),
+        "cpu_seconds_total": grouped["cpu_seconds"].sum(),
+        "peak_rss_max": grouped["peak_rss"].max(),
+    }).reset_index()
+
+
+@click.group()
+def cli():
+    """Aggregate the metrics records of the Python steps."""
+
+
+@cli.command("collect")
+@click.argument('metrics_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output_dir', default='.', show_default=True, help='Writes python_metrics.jsonl (all records) and python_metrics_summary.tsv')
+@click.option('--baseline', type=click.Path(exists=True), required=False, help='python_metrics_summary.tsv of an earlier run or release to compare with')
+@click.option('--tolerance', type=click.FloatRange(min=0), default=0.2, show_default=True, help='Relative growth of the mean stage time reported as a regression')
+def collect_command(metrics_files, output_dir, baseline, tolerance):
+    """Merge the per-task metrics files of a run and summarise them per stage."""
+    records = read_records(metrics_files)
+    if records.empty:
+        raise click.ClickException("No metrics records in the input files")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "python_metrics.jsonl"), "w") as handle:
+        for record in records.to_dict(orient="records"):
+            handle.write(json.dumps({key: value for key, value in record.items() if value == value}) + "\n")
+
+    summary = summarize_records(records)
+    if baseline:
+        previous = pd.read_csv(baseline, sep="\t", keep_default_na=False)[SUMMARY_KEYS + ["seconds_mean"]]
+        summary = summary.merge(previous.rename(columns={"seconds_mean": "baseline_seconds_mean"}), on=SUMMARY_KEYS, how="left")
+        summary["change"] = summary["seconds_mean"] / summary["baseline_seconds_mean"] - 1
+        for row in summary[summary["change"] > tolerance].itertuples(index=False):
+            stage_name = f"{row.script} {row.stage}" + (f" ({row.tool})" if row.tool else "")
+            click.echo(f"Regression: {stage_name} {row.baseline_seconds_mean:.3f}s -> {row.seconds_mean:.3f}s (+{row.change:.0%})", err=True)
+    summary_file = os.path.join(output_dir, "python_metrics_summary.tsv")
+    summary.to_csv(summary_file, sep="\t", index=False, float_format="%.6g")
+    click.echo(f"{len(records)} records from {len(metrics_files)} files summarised in {summary_file}")
+
+
+if __name__ == '__main__':
+    cli()
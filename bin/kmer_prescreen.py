@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""k-mer prescreen of a sample's reads against the panARG sequences.
+
+build   packs the canonical k-mers (2 bits per base, k <= 31) of one or more
+        reference FASTA files (e.g. the SRST2 and ARIBA panARG sequences) into
+        an .npz index: the sorted distinct k-mers, the records each k-mer
+        occurs in, and a bitmap prefilter over the low k-mer bits.
+screen  streams a sample's reads through the index once and reports, per
+        reference record, the fraction of its k-mers seen in the reads and
+        their mean depth. Records passing --min_coverage are the candidates;
+        for every source FASTA the candidate records are written to a reduced
+        FASTA for the downstream tool. A sample without candidates gets no
+        reduced FASTA.
+"""
+
+import gzip
+import os
+
+import click
+import numpy as np
+import pandas as pd
+
+from annotation_index import file_checksum
+
+INDEX_VERSION = 1
+# Bases as 2-bit codes; anything else (N, IUPAC codes, line ends) is 4 and breaks k-mers
+CODES = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate(b"ACGT"):
+    CODES[base] = code
+    CODES[ord(chr(base).lower())] = code
+# The prefilter bitmap has 2**BITMAP_BITS bits, addressed by the low bits of a k-mer
+BITMAP_BITS = 28
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_text(path):
+    with open(path, 'rb') as handle:
+        compressed = handle.read(2) == GZIP_MAGIC
+    return gzip.open(path, 'rb') if compressed else open(path, 'rb', buffering=1 << 20)
+
+
+def read_fasta(path):
+    """Yield (record ID, sequence bytes) of a FASTA file."""
+    name, chunks = None, []
+    with open_text(path) as handle:
+        for line in handle:
+            if line.startswith(b'>'):
+                if name is not None:
+                    yield name, b''.join(chunks)
+                name, chunks = line[1:].split(None, 1)[0].decode(), []
+            else:
+                chunks.append(line.strip())
+    if name is not None:
+        yield name, b''.join(chunks)
+
+
+def kmer_codes(codes, k, canonical=True):
+    """
+    k-mers (2 bits per base) starting at every position of a base-code array,
+    and whether the window holds only A/C/G/T. Windows are built by doubling
+    (k-mers of length a and b give length a + b), so a k-mer array costs
+    O(log k) vector operations. With canonical, the minimum of each k-mer and
+    its reverse complement; otherwise the forward k-mers only.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    bad = np.concatenate([[0], np.cumsum(codes > 3, dtype=np.int64)])
+    valid = (bad[k:] - bad[:-k]) == 0
+    forward = {1: (codes & 3).astype(np.uint64)}
+    length = 1
+    while length * 2 <= k:
+        f = forward[length]
+        forward[2 * length] = (f[:-length] << np.uint64(2 * length)) | f[length:]
+        length *= 2
+    # Compose k from the powers of two in its binary expansion
+    kmers, have = None, 0
+    for part in sorted(forward, reverse=True):
+        if have + part > k:
+            continue
+        if kmers is None:
+            kmers = forward[part]
+        else:
+            m = len(codes) - (have + part) + 1
+            kmers = (kmers[:m] << np.uint64(2 * part)) | forward[part][have:have + m]
+        have += part
+    kmers = kmers[:n]
+    return (np.minimum(kmers, reverse_complement(kmers, k)) if canonical else kmers), valid
+
+
+def reverse_complement(kmers, k):
+    """Reverse complements of 2-bit encoded k-mers: complement, reverse the 2-bit groups, realign."""
+    x = kmers ^ np.uint64((1 << (2 * k)) - 1)
+    x = ((x >> np.uint64(2)) & np.uint64(0x3333333333333333)) | ((x & np.uint64(0x3333333333333333)) << np.uint64(2))
+    x = ((x >> np.uint64(4)) & np.uint64(0x0F0F0F0F0F0F0F0F)) | ((x & np.uint64(0x0F0F0F0F0F0F0F0F)) << np.uint64(4))
+    return x.byteswap() >> np.uint64(64 - 2 * k)
+
+
+def sequence_kmers(sequences, k):
+    """Canonical k-mers of a list of sequences and the index of the sequence each comes from."""
+    if not sequences:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    # A separator between sequences invalidates every window spanning two of them
+    buffer = b'\n'.join(sequences) + b'\n'
+    kmers, valid = kmer_codes(CODES[np.frombuffer(buffer, dtype=np.uint8)], k)
+    starts = np.cumsum([0] + [len(sequence) + 1 for sequence in sequences[:-1]])
+    owner = np.searchsorted(starts, np.arange(len(kmers)), side='right') - 1
+    return kmers[valid], owner[valid]
+
+
+def build_index(sources, k):
+    """Index the k-mers of {source name: FASTA path}; returns the arrays saved in the .npz."""
+    names, source_ids, lengths, kmer_parts, record_parts = [], [], [], [], []
+    for source_id, (source, path) in enumerate(sources.items()):
+        records = list(read_fasta(path))
+        sequences = [sequence for _, sequence in records]
+        kmers, owner = sequence_kmers(sequences, k)
+        kmer_parts.append(kmers)
+        record_parts.append(owner + len(names))
+        names.extend(name for name, _ in records)
+        source_ids.extend([source_id] * len(records))
+        lengths.extend(len(sequence) for sequence in sequences)
+    kmers = np.concatenate(kmer_parts)
+    records = np.concatenate(record_parts).astype(np.int32)
+    # Distinct (k-mer, record) pairs in k-mer order; a k-mer shared by records appears once per record
+    order = np.lexsort((records, kmers))
+    kmers, records = kmers[order], records[order]
+    distinct = np.ones(len(kmers), dtype=bool)
+    distinct[1:] = (kmers[1:] != kmers[:-1]) | (records[1:] != records[:-1])
+    kmers, records = kmers[distinct], records[distinct]
+    first = np.ones(len(kmers), dtype=bool)
+    first[1:] = kmers[1:] != kmers[:-1]
+    unique_kmers = kmers[first]
+    offsets = np.append(np.flatnonzero(first), len(kmers)).astype(np.int64)
+    # Reads are tested with their forward k-mers, so the bitmap holds both strands
+    bitmap = np.zeros(1 << (BITMAP_BITS - 3), dtype=np.uint8)
+    for strand in (unique_kmers, reverse_complement(unique_kmers, k)):
+        low = (strand & np.uint64((1 << BITMAP_BITS) - 1)).astype(np.int64)
+        np.bitwise_or.at(bitmap, low >> 3, (1 << (low & 7)).astype(np.uint8))
+    return {
+        "version": np.array(INDEX_VERSION),
+        "k": np.array(k),
+        "kmers": unique_kmers,
+        "offsets": offsets,
+        "records": records,
+        "bitmap": bitmap,
+        "names": np.array(names, dtype=object).astype(str),
+        "record_source": np.array(source_ids, dtype=np.int16),
+        "lengths": np.array(lengths, dtype=np.int64),
+        "sources": np.array(list(sources), dtype=str),
+        "source_paths": np.array([os.path.abspath(path) for path in sources.values()], dtype=str),
+        "source_sha256": np.array([file_checksum(path) for path in sources.values()], dtype=str),
+    }
+
+
+def load_index(path):
+    with np.load(path, allow_pickle=False) as data:
+        index = {name: data[name] for name in data.files}
+    if int(index["version"]) != INDEX_VERSION:
+        raise click.ClickException(f"{path} is a version {int(index['version'])} index; rebuild it with 'build'")
+    return index
+
+
+def read_sequences(handle, chunk_bytes):
+    """
+    Sequence lines of the FASTQ records in blocks of about chunk_bytes. Blocks
+    are split into lines in one call and the incomplete record at the end is
+    carried over, instead of reading the file line by line.
+    """
+    rest = b''
+    while True:
+        block = handle.read(chunk_bytes)
+        lines = (rest + block).split(b'\n')
+        if not block:
+            # The file ends with a newline (or is empty)
+            yield lines[1:len(lines) - 1 if lines[-1] == b'' else len(lines):4]
+            return
+        complete = len(lines) - 1 - (len(lines) - 1) % 4
+        rest = b'\n'.join(lines[complete:])
+        yield lines[1:complete:4]
+
+
+def screen_reads(index, read_files, chunk_bytes=4 << 20, max_reads=None):
+    """Per indexed k-mer, how many read k-mers matched it; and the number of reads screened."""
+    k = int(index["k"])
+    kmers, bitmap = index["kmers"], index["bitmap"]
+    mask = np.uint64((1 << BITMAP_BITS) - 1)
+    hits = np.zeros(len(kmers), dtype=np.int64)
+    n_reads = 0
+    for read_file in read_files:
+        with open_text(read_file) as handle:
+            for sequences in read_sequences(handle, chunk_bytes):
+                if max_reads is not None:
+                    # A block may hold no complete record yet; stop only at the limit
+                    if n_reads >= max_reads:
+                        break
+                    sequences = sequences[:max_reads - n_reads]
+                n_reads += len(sequences)
+                if not sequences:
+                    continue
+                # The newline between reads breaks every k-mer spanning two of them
+                read_kmers, valid = kmer_codes(CODES[np.frombuffer(b'\n'.join(sequences), dtype=np.uint8)], k, canonical=False)
+                # Cheap bitmap test of the forward k-mers first; only the survivors are
+                # made canonical and looked up in the sorted index k-mers
+                low = (read_kmers & mask).astype(np.int64)
+                read_kmers = read_kmers[valid & ((bitmap[low >> 3] >> (low & 7).astype(np.uint8)) & 1).astype(bool)]
+                read_kmers = np.minimum(read_kmers, reverse_complement(read_kmers, k))
+                query, counts = np.unique(read_kmers, return_counts=True)
+                position = np.searchsorted(kmers, query)
+                position[position == len(kmers)] = 0
+                found = kmers[position] == query
+                hits[position[found]] += counts[found]
+    return hits, n_reads
+
+
+def record_table(index, hits):
+    """Per reference record: distinct k-mers, k-mers seen in the reads, their fraction and mean depth."""
+    offsets, records = index["offsets"], index["records"]
+    n_records = len(index["names"])
+    kmer_of_pair = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    pair_hits = hits[kmer_of_pair]
+    n_kmers = np.bincount(records, minlength=n_records)
+    seen = np.bincount(records, weights=pair_hits > 0, minlength=n_records).astype(np.int64)
+    depth = np.bincount(records, weights=pair_hits, minlength=n_records)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = np.where(n_kmers > 0, seen / n_kmers, 0.0)
+        mean_depth = np.where(n_kmers > 0, depth / n_kmers, 0.0)
+    return pd.DataFrame({
+        "source": index["sources"][index["record_source"]],
+        "gene": index["names"],
+        "length": index["lengths"],
+        "kmers": n_kmers,
+        "kmers_seen": seen,
+        "kmer_coverage": coverage.round(4),
+        "kmer_depth": mean_depth.round(2),
+    })
+
+
+def check_source(path, checksum):
+    # The reduced FASTA is cut from the file the index was built from; a moved
+    # or edited file no longer holds the records the k-mers were counted for
+    if not os.path.exists(path):
+        raise click.ClickException(f"Indexed FASTA {path} no longer exists; rebuild the index with 'build'")
+    if file_checksum(path) != checksum:
+        raise click.ClickException(f"Indexed FASTA {path} changed since the index was built; rebuild the index with 'build'")
+
+
+def write_subset(source_path, names, output_file):
+    # Reference records in names, copied unchanged in their original order
+    keep = False
+    with open_text(source_path) as handle, open(output_file, 'wb') as out:
+        for line in handle:
+            if line.startswith(b'>'):
+                keep = line[1:].split(None, 1)[0].decode() in names
+            if keep:
+                out.write(line)
+
+
+@click.group()
+def cli():
+    """Build the panARG k-mer index and prescreen samples against it."""
+
+
+@cli.command("build")
+@click.option('--fasta', 'fasta_files', multiple=True, required=True, help='Reference FASTA as SOURCE=PATH, e.g. srst2=sequence.fa (repeatable)')
+@click.option('--kmer_size', '-k', type=click.IntRange(11, 31), default=31, show_default=True, help='k-mer length')
+@click.option('--output', required=True, type=click.Path(), help='Index file (.npz)')
+def build_command(fasta_files, kmer_size, output):
+    """Index the canonical k-mers of the reference FASTA files."""
+    sources = {}
+    for fasta in fasta_files:
+        source, _, path = fasta.partition('=')
+        if not path:
+            source, path = os.path.splitext(os.path.basename(fasta))[0], fasta
+        if not os.path.exists(path):
+            raise click.BadParameter(f"{path} not found", param_hint="--fasta")
+        sources[source] = path
+    index = build_index(sources, kmer_size)
+    with open(output, 'wb') as handle:
+        np.savez(handle, **index)
+    click.echo(f"k-mer index: {output} ({len(index['names'])} records, {len(index['kmers'])} distinct {kmer_size}-mers)")
+
+
+@cli.command("screen")
+@click.option('--index', 'index_file', required=True, type=click.Path(exists=True), help='Index written by build')
+@click.option('--reads', 'read_files', multiple=True, required=True, type=click.Path(exists=True), help='FASTQ files of the sample, optionally gzipped (repeatable)')
+@click.option('--min_coverage', type=click.FloatRange(0, 1), default=0.5, show_default=True, help='Minimum fraction of a record\'s k-mers seen in the reads')
+@click.option('--min_depth', type=float, default=0, show_default=True, help='Minimum mean k-mer depth of a candidate')
+@click.option('--max_reads', type=click.IntRange(min=1), default=None, help='Screen only the first reads (over all read files)')
+@click.option('--chunk_mb', type=click.IntRange(min=1), default=4, show_default=True, help='Uncompressed FASTQ read and converted to k-mers per chunk (MB)')
+@click.option('--output_file', required=True, help='Table of the records with k-mer hits (TSV)')
+@click.option('--subset_prefix', required=False, help='Write the candidate records of every source as <prefix>.<source>.fasta')
+def screen_command(index_file, read_files, min_coverage, min_depth, max_reads, chunk_mb, output_file, subset_prefix):
+    """Screen the reads of one sample and write its candidate records."""
+    index = load_index(index_file)
+    hits, n_reads = screen_reads(index, read_files, chunk_mb << 20, max_reads)
+    table = record_table(index, hits)
+    table["candidate"] = ((table["kmer_coverage"] >= min_coverage) & (table["kmer_depth"] >= min_depth)).astype(int)
+    table[table["kmers_seen"] > 0].sort_values(["source", "kmer_coverage"], ascending=[True, False]).to_csv(output_file, sep="\t", index=False)
+
+    candidates = table[table["candidate"] == 1]
+    click.echo(f"Screened {n_reads} reads: {len(candidates)} candidate records of {len(table)}")
+    if candidates.empty:
+        # No ARG signal: no reduced FASTA, so the downstream tools are skipped for this sample
+        click.echo("No candidate records; nothing to align.")
+        return
+    if subset_prefix:
+        for source, path, checksum in zip(index["sources"], index["source_paths"], index["source_sha256"]):
+            names = set(candidates.loc[candidates["source"] == source, "gene"])
+            if names:
+                check_source(path, checksum)
+                write_subset(path, names, f"{subset_prefix}.{source}.fasta")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Python port of bin/mapstatFilters.R (ARGprofiler's KMA mapstat filter).
+
+The raw KMA .mapstat is joined with the reference lengths of the refdata file
+(first column the reference name, second its length), the derived statistics
+are added and the references failing the filters are dropped:
+  propCovered > 0.9, readRefIdentity > 0.9, readConsensRefIdentity > 0.9,
+  spuriosCovRatio < 0.9 and meanDepthCovered > depth (6)
+The filter command writes the same file as the R script: the "##" header, then
+the rows sorted by reference name, with numbers written to 15 significant
+digits as R's write.table does. Like R it:
+  - sorts with the collation of the session (LC_COLLATE; byte order under C),
+    as R's merge does; R built with ICU may order punctuation differently
+  - drops the rows with any NA field only when some references are missing
+    from the refdata (R's na.omit)
+  - writes a row of NA for each reference whose filter comparison is NA (a
+    missing field or 0/0) and fails no other filter, as R's logical indexing does
+summarize_results.py --kma_mapstat applies the same filters in process.
+"""
+
+import csv
+import locale
+import math
+
+import click
+import numpy as np
+import pandas as pd
+
+GENE_COLUMN = "# refSequence"
+# Thresholds of mapstatFilters.R; depth is its -d option
+DEFAULT_FILTERS = {"min_coverage": 0.9, "min_read_identity": 0.9, "min_consensus_identity": 0.9, "max_spurious": 0.9, "depth": 6.0}
+# R reads 32-bit integers; larger whole numbers become doubles
+INT32_MAX = 2 ** 31 - 1
+
+
+def read_mapstat(mapstat_file):
+    """("##" header lines, data) of a KMA mapstat; NA fields are missing, as in R's read.delim."""
+    with open(mapstat_file, encoding="utf-8") as handle:
+        lines = handle.read().splitlines()
+    header = [line for line in lines if "##" in line]
+    if len(lines) <= len(header):
+        raise pd.errors.EmptyDataError(f"No column line in {mapstat_file}")
+    columns = lines[len(header)].split("\t")
+    data = pd.read_csv(mapstat_file, sep="\t", header=None, names=columns, comment="#",
+                       dtype={GENE_COLUMN: str}, na_values=["NA"], keep_default_na=False)
+    # Masked columns keep R's NA apart from the NaN of a 0/0, and a whole-number
+    # column with NA fields an integer one, as R reads it
+    for column in data.columns[data.dtypes == np.float64]:
+        values = data[column].dropna()
+        if len(values) < len(data):
+            whole = (values == values.round()).all() and (values.abs() <= INT32_MAX).all()
+            data[column] = data[column].astype("Int64" if whole else "Float64")
+    return header, data
+
+
+def read_refdata(refdata_file):
+    """Reference names and lengths: the first two columns, "#" lines skipped."""
+    refdata = pd.read_csv(refdata_file, sep="\t", header=None, comment="#", usecols=[0, 1],
+                          dtype={0: str}, na_values=["NA"], keep_default_na=False)
+    refdata.columns = [GENE_COLUMN, "length"]
+    return refdata
+
+
+def collation_key(names):
+    # R's merge orders the names with the collation of the session, NA last
+    return names.map(locale.strxfrm, na_action="ignore")
+
+
+def derive_mapstat(data, refdata):
+    """Join the lengths, drop incomplete rows if any length is missing (R's na.omit) and add the derived statistics."""
+    merged = data.merge(refdata, on=GENE_COLUMN, how="left", sort=False)
+    missing = int(merged["length"].isna().sum())
+    if missing:
+        print(f"WARNING: {missing} gene lengths not found in refdata!")
+        merged = merged.dropna()
+        merged["length"] = merged["length"].astype(np.int64)
+    merged = merged.sort_values(GENE_COLUMN, kind="stable", key=collation_key, ignore_index=True)
+
+    def ratio(numerator, denominator):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = numerator.to_numpy(dtype=np.float64, na_value=np.nan) / denominator.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = (numerator.isna() | denominator.isna()).to_numpy()
+        return pd.arrays.FloatingArray(values, missing) if missing.any() else values
+
+    bp_total = merged["bpTotal"]
+    aligned = bp_total - merged["snpSum"] - merged["insertSum"] - merged["deletionSum"]
+    derived = pd.DataFrame({
+        "meanDepthCovered": ratio(bp_total, merged["length"]),
+        "spuriosCovRatio": ratio(merged["nucHighDepthVariance"], merged["refCoveredPositions"]),
+        "FragReadRatio": ratio(merged["fragmentCountAln"], merged["readCountAln"]),
+        "meanMapScore": ratio(merged["mapScoreSum"], bp_total),
+        "readConsensRefIdentity": ratio(merged["refConsensusSum"], merged["refCoveredPositions"]),
+        "readRefIdentity": ratio(aligned, bp_total),
+        "depthCV": merged["depthVariance"].array,
+        "propCovered": ratio(merged["refCoveredPositions"], merged["length"]),
+    })
+    return pd.concat([merged, derived], axis=1)
+
+
+def passes_filters(derived, filters=None):
+    """(passed, undecided) rows under R's logic: an NA comparison leaves a row undecided unless another filter fails it."""
+    filters = {**DEFAULT_FILTERS, **(filters or {})}
+    with np.errstate(invalid="ignore"):
+        comparisons = [
+            ("propCovered", np.greater, filters["min_coverage"]),
+            ("readRefIdentity", np.greater, filters["min_read_identity"]),
+            ("readConsensRefIdentity", np.greater, filters["min_consensus_identity"]),
+            ("spuriosCovRatio", np.less, filters["max_spurious"]),
+            ("meanDepthCovered", np.greater, filters["depth"]),
+        ]
+        failed = np.zeros(len(derived), dtype=bool)
+        unknown = np.zeros(len(derived), dtype=bool)
+        for column, compare, threshold in comparisons:
+            values = derived[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(values)
+            failed |= ~missing & ~compare(values, threshold)
+            unknown |= missing
+    undecided = unknown & ~failed
+    return ~failed & ~undecided, undecided
+
+
+def filter_mapstat(mapstat_file, refdata_file, filters=None):
+    """("##" header lines, filtered rows with the derived statistics) of a raw mapstat.
+
+    Undecided references become rows of NA, where R writes them.
+    """
+    header, data = read_mapstat(mapstat_file)
+    derived = derive_mapstat(data, read_refdata(refdata_file))
+    passed, undecided = passes_filters(derived, filters)
+    output = derived[passed | undecided].reset_index(drop=True)
+    if undecided.any():
+        output = output.astype({column: "Int64" for column in output.columns if output[column].dtype.kind in "iu"})
+        output.loc[undecided[passed | undecided], :] = pd.NA
+    return header, output
+
+
+def format_r_number(value):
+    """A double as R's write.table writes it: up to 15 significant digits, fixed or scientific, whichever is narrower."""
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "Inf" if value > 0 else "-Inf"
+    if value == 0:
+        return "0"
+    mantissa, exponent = f"{value:.14e}".split("e")
+    digits = mantissa.lstrip("-").replace(".", "").rstrip("0")
+    significant, power = len(digits), int(exponent)
+    negative = value < 0
+    right = max(0, significant - power - 1)
+    fixed_width = negative + (power + 1 if power >= 0 else 1) + right + (right > 0)
+    sci_width = negative + (significant > 1) + (significant - 1) + 4 + (2 if power >= 100 or power <= -99 else 1)
+    if fixed_width <= sci_width:
+        return f"{value:.{right}f}"
+    return f"{value:.{significant - 1}e}"
+
+
+def as_written(values):
+    """Values as read back from a file written by the R script, so in-process results match the file route."""
+    return np.array([float(format_r_number(value)) for value in np.asarray(values, dtype=np.float64)])
+
+
+def format_column(values):
+    # Integer columns R reads as integer print as they are; anything else as an R double
+    if values.dtype.kind in "iu" and (values.empty or (values.abs() <= INT32_MAX).all()):
+        return values.astype(str)
+    if values.dtype.kind in "iufb":
+        return values.astype(np.float64).map(format_r_number)
+    return values.fillna("NA").astype(str)
+
+
+def write_mapstat(header, data, output_file):
+    with open(output_file, "w", encoding="utf-8") as handle:
+        for line in header:
+            handle.write(line + "\n")
+        handle.write("\t".join(data.columns) + "\n")
+        if len(data):
+            formatted = pd.DataFrame({column: format_column(data[column]) for column in data.columns})
+            # NA prints as NA; in plain float columns a missing value is a NaN from a division
+            for column in data.columns:
+                if data[column].dtype != np.float64:
+                    formatted.loc[data[column].isna().to_numpy(), column] = "NA"
+            formatted.loc[data.isna().all(axis=1).to_numpy(), :] = "NA"
+            formatted.to_csv(handle, sep="\t", header=False, index=False, quoting=csv.QUOTE_NONE, lineterminator="\n")
+
+
+@click.group()
+def cli():
+    """Filter KMA mapstat files the way bin/mapstatFilters.R does."""
+
+
+@cli.command("filter")
+@click.option('--input', '-i', 'mapstat_file', type=click.Path(exists=True), required=True, help='Raw .mapstat file of the KMA alignment')
+@click.option('--output', '-o', 'output_file', required=True, help='Filtered mapstat file')
+@click.option('--refdata', '-r', type=click.Path(exists=True), required=True, help='Refdata file whose 1st and 2nd columns are reference names and lengths')
+@click.option('--depth', '-d', type=float, default=DEFAULT_FILTERS["depth"], show_default=True, help='Minimum mean depth of the covered gene (meanDepthCovered >)')
+@click.option('--min_coverage', type=float, default=DEFAULT_FILTERS["min_coverage"], show_default=True, help='Minimum fraction of the gene covered (propCovered >)')
+@click.option('--min_read_identity', type=float, default=DEFAULT_FILTERS["min_read_identity"], show_default=True, help='Minimum read to reference identity (readRefIdentity >)')
+@click.option('--min_consensus_identity', type=float, default=DEFAULT_FILTERS["min_consensus_identity"], show_default=True, help='Minimum consensus to reference identity (readConsensRefIdentity >)')
+@click.option('--max_spurious', type=float, default=DEFAULT_FILTERS["max_spurious"], show_default=True, help='Maximum share of high depth-variance positions (spuriosCovRatio <)')
+def filter_command(mapstat_file, output_file, refdata, depth, min_coverage, min_read_identity, min_consensus_identity, max_spurious):
+    """Filter a raw mapstat and write it in the layout of mapstatFilters.R."""
+    filters = {"min_coverage": min_coverage, "min_read_identity": min_read_identity,
+               "min_consensus_identity": min_consensus_identity, "max_spurious": max_spurious, "depth": depth}
+    try:
+        # Collate as R does, from the environment
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        pass
+    header, data = filter_mapstat(mapstat_file, refdata, filters)
+    write_mapstat(header, data, output_file)
+
+
+if __name__ == '__main__':
+    cli()
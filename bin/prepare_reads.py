@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Decompress a FASTQ pair once, validate the pairing and write the read layouts the tools need.
+
+One pass over R1/R2 writes any of (the pipeline asks only for the layouts the sample's tools read):
+  --pairs_prefix   <prefix>_R1/_R2 pairs (plain, or fast gzip) for GROOT, KMA, ARIBA and SRST2
+  --interleaved    one interleaved file (R1, R2, R1, ...) for KARGA instead of a concatenated copy
+  --shards N       the pairs split into N shard pairs (<prefix>.<k>_R1/_R2)
+"""
+
+import gzip
+import io
+import json
+import shutil
+import subprocess
+from itertools import islice, repeat
+
+import click
+
+GZIP_MAGIC = b'\x1f\x8b'
+BUFFER_SIZE = 1 << 20
+
+
+class ReadPairError(click.ClickException):
+    pass
+
+
+def gzip_command(threads=1):
+    # pigz (multi-threaded) or gzip; either way (de)compression runs beside the Python process
+    pigz = shutil.which('pigz')
+    if pigz:
+        return [pigz, '-p', str(threads)]
+    gzip_binary = shutil.which('gzip')
+    return [gzip_binary] if gzip_binary else None
+
+
+def open_input(path, threads=1):
+    """Buffered binary reader; gzip input is decoded in a pigz/gzip subprocess when one is installed."""
+    with open(path, 'rb') as handle:
+        compressed = handle.read(2) == GZIP_MAGIC
+    if not compressed:
+        return open(path, 'rb', buffering=BUFFER_SIZE)
+    command = gzip_command(threads)
+    if command:
+        process = subprocess.Popen(command + ['-dc', path], stdout=subprocess.PIPE, bufsize=BUFFER_SIZE)
+        return ProcessReader(process)
+    return io.BufferedReader(gzip.open(path, 'rb'), buffer_size=BUFFER_SIZE)
+
+
+def open_output(path, level=1, threads=1):
+    """Buffered binary writer; .gz paths are compressed at the given level, in a pigz/gzip subprocess when one is installed."""
+    if not path.endswith('.gz'):
+        return open(path, 'wb', buffering=BUFFER_SIZE)
+    command = gzip_command(threads)
+    if command:
+        output = open(path, 'wb')
+        process = subprocess.Popen(command + [f'-{level}', '-c'], stdin=subprocess.PIPE, stdout=output, bufsize=BUFFER_SIZE)
+        return ProcessWriter(process, output)
+    return io.BufferedWriter(gzip.open(path, 'wb', compresslevel=level), buffer_size=BUFFER_SIZE)
+
+
+class ProcessReader:
+    """Iterate the stdout lines of a decompressor; fails if it exits with an error."""
+
+    def __init__(self, process):
+        self.process = process
+
+    def __iter__(self):
+        return iter(self.process.stdout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.process.stdout.close()
+        if self.process.wait() and exc[0] is None:
+            raise click.ClickException(f"{self.process.args[0]} exited with status {self.process.returncode}")
+
+
+class ProcessWriter:
+    """Write to the stdin of a compressor writing to output."""
+
+    def __init__(self, process, output):
+        self.process = process
+        self.output = output
+
+    def writelines(self, lines):
+        self.process.stdin.writelines(lines)
+
+    def close(self):
+        self.process.stdin.close()
+        status = self.process.wait()
+        self.output.close()
+        if status:
+            raise click.ClickException(f"{self.process.args[0]} exited with status {status}")
+
+
+def read_names(headers):
+    # Read IDs without the comment and a /1 or /2 mate suffix
+    names = [header.split(None, 1)[0] for header in headers]
+    return [name[:-2] if name[-2:] in (b'/1', b'/2') else name for name in names]
+
+
+def check_records(lines, mate, first_pair):
+    # Header/separator markers and sequence/quality lengths (without line terminators),
+    # checked with C-level comparisons of whole columns; the offending record is looked up only on failure
+    if (all(map(bytes.startswith, lines[0::4], repeat(b'@'))) and all(map(bytes.startswith, lines[2::4], repeat(b'+')))
+            and list(map(len, map(bytes.rstrip, lines[1::4]))) == list(map(len, map(bytes.rstrip, lines[3::4])))):
+        return
+    bad = next(i for i in range(0, len(lines), 4) if lines[i][:1] != b'@' or lines[i + 2][:1] != b'+'
+               or len(lines[i + 1].rstrip()) != len(lines[i + 3].rstrip()))
+    raise ReadPairError(f"Malformed FASTQ record in R{mate} at read {first_pair + bad // 4 + 1}: {lines[bad].strip().decode(errors='replace')}")
+
+
+def read_chunks(r1, r2, chunk_pairs):
+    """Yield (R1 lines, R2 lines) for chunks of read pairs, checking FASTQ structure and pairing."""
+    pair = 0
+    while True:
+        lines1 = list(islice(r1, 4 * chunk_pairs))
+        lines2 = list(islice(r2, 4 * chunk_pairs))
+        if not lines1 and not lines2:
+            return
+        if len(lines1) != len(lines2):
+            raise ReadPairError(f"R1 and R2 have a different number of reads (after read pair {pair + min(len(lines1), len(lines2)) // 4})")
+        if len(lines1) % 4:
+            raise ReadPairError("Truncated FASTQ record at the end of the input")
+        # A last record without a trailing newline is ended here, so it cannot run into the next record written
+        for lines in (lines1, lines2):
+            if not lines[-1].endswith(b'\n'):
+                lines[-1] += b'\n'
+        check_records(lines1, 1, pair)
+        check_records(lines2, 2, pair)
+        # Identical headers (the common case for /1 /2-free IDs) skip the name parsing
+        if lines1[0::4] != lines2[0::4]:
+            names1, names2 = read_names(lines1[0::4]), read_names(lines2[0::4])
+            if names1 != names2:
+                mismatch = next(i for i, (name1, name2) in enumerate(zip(names1, names2)) if name1 != name2)
+                raise ReadPairError(f"Unpaired reads at pair {pair + mismatch + 1}: "
+                                    f"{lines1[4 * mismatch].strip().decode(errors='replace')} / {lines2[4 * mismatch].strip().decode(errors='replace')}")
+        pair += len(lines1) // 4
+        yield lines1, lines2
+
+
+def interleave(lines1, lines2):
+    # R1 record, then its R2 record, by slice assignment of the eight line columns
+    lines = [None] * (len(lines1) + len(lines2))
+    for line in range(4):
+        lines[line::8] = lines1[line::4]
+        lines[4 + line::8] = lines2[line::4]
+    return lines
+
+
+def prepare_reads(r1_file, r2_file, pairs_prefix=None, interleaved=None, shards=1, extension='fastq',
+                  compress_level=1, threads=1, chunk_pairs=50000):
+    """Stream the pair once into the requested layouts; returns read and base counts."""
+    writers = []
+    pair_outputs = []
+    if pairs_prefix:
+        names = [f"{pairs_prefix}" if shards == 1 else f"{pairs_prefix}.{k}" for k in range(shards)]
+        for name in names:
+            pair = (open_output(f"{name}_R1.{extension}", compress_level, threads), open_output(f"{name}_R2.{extension}", compress_level, threads))
+            pair_outputs.append(pair)
+            writers.extend(pair)
+    interleaved_output = open_output(interleaved, compress_level, threads) if interleaved else None
+    if interleaved_output:
+        writers.append(interleaved_output)
+
+    stats = {"read_pairs": 0, "bases_R1": 0, "bases_R2": 0}
+    try:
+        with open_input(r1_file, threads) as r1, open_input(r2_file, threads) as r2:
+            for chunk, (lines1, lines2) in enumerate(read_chunks(r1, r2, chunk_pairs)):
+                if pair_outputs:
+                    # Whole chunks go round-robin to the shards, so shards stay pair-aligned
+                    out1, out2 = pair_outputs[chunk % len(pair_outputs)]
+                    out1.writelines(lines1)
+                    out2.writelines(lines2)
+                if interleaved_output:
+                    interleaved_output.writelines(interleave(lines1, lines2))
+                n_pairs = len(lines1) // 4
+                stats["read_pairs"] += n_pairs
+                # Sequence lengths without the newline
+                stats["bases_R1"] += sum(map(len, lines1[1::4])) - n_pairs
+                stats["bases_R2"] += sum(map(len, lines2[1::4])) - n_pairs
+    finally:
+        for writer in writers:
+            writer.close()
+    return stats
+
+
+@click.command()
+@click.option('--r1', 'r1_file', type=click.Path(exists=True), required=True, help='Forward reads (FASTQ, optionally gzipped)')
+@click.option('--r2', 'r2_file', type=click.Path(exists=True), required=True, help='Reverse reads (FASTQ, optionally gzipped)')
+@click.option('--pairs_prefix', required=False, help='Write the validated pair as <prefix>_R1.<ext> and <prefix>_R2.<ext>')
+@click.option('--interleaved', required=False, help='Write an interleaved FASTQ (gzip if the name ends in .gz)')
+@click.option('--shards', type=click.IntRange(min=1), default=1, show_default=True, help='Split the pairs into this many shard pairs (<prefix>.<k>_R1/_R2)')
+@click.option('--compress', is_flag=True, help='gzip the pairs (fast level) instead of writing plain FASTQ')
+@click.option('--compress_level', type=click.IntRange(1, 9), default=1, show_default=True, help='gzip level for compressed outputs')
+@click.option('--threads', type=click.IntRange(min=1), default=1, show_default=True, help='pigz threads per stream, when pigz is installed')
+@click.option('--chunk_pairs', type=click.IntRange(min=1), default=50000, show_default=True, help='Read pairs validated and written per chunk (and per shard block)')
+@click.option('--stats_file', required=False, help='Write read/base counts as JSON')
+def main(r1_file, r2_file, pairs_prefix, interleaved, shards, compress, compress_level, threads, chunk_pairs, stats_file):
+    """Decompress and validate a FASTQ pair once, writing every per-tool read layout in the same pass."""
+    if not pairs_prefix and not interleaved:
+        raise click.UsageError("Nothing to write: give --pairs_prefix and/or --interleaved.")
+    extension = 'fastq.gz' if compress else 'fastq'
+    stats = prepare_reads(r1_file, r2_file, pairs_prefix, interleaved, shards, extension, compress_level, threads, chunk_pairs)
+    click.echo(f"Prepared {stats['read_pairs']} read pairs from {r1_file} and {r2_file}")
+    if stats_file:
+        with open(stats_file, 'w') as handle:
+            json.dump(stats, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Per-process cpus/memory/time for the pipeline, fitted on the traces of past runs.
+
+  fit    read Nextflow trace files (or the embedded data of execution reports) and fit,
+         per process, runtime and peak RSS as a linear function of the sample's FASTQ
+         size (R1 + R2 in --reads_dir), shifted up to cover --quantile of the tasks
+  plan   size the processes for a batch of samples: write a resources config to pass with
+         `-c`, with memory and time escalating on each retry, and print the projected
+         core-hours and GB-hours against the current allocation (--dry_run: report only)
+"""
+
+import glob
+import json
+import math
+import os
+import re
+
+import click
+import numpy as np
+import pandas as pd
+
+from result_cache import format_size, parse_size
+
+GB = 1 << 30
+# Exit statuses of tasks killed for memory (137, 139: SIGKILL/SIGSEGV) or time (140: SLURM, 143: SIGTERM)
+RETRY_EXIT_STATUS = [104, 134, 137, 139, 140, 143, 247]
+# maxRetries set in the modules, kept when the config overrides the process
+MODULE_RETRIES = {"srst2": 5, "srst2_prescreened": 5}
+DURATION_UNITS = {"ms": 1, "s": 1000, "m": 60000, "h": 3600000, "d": 86400000}
+
+
+def parse_duration(text):
+    # Trace durations: raw milliseconds or "1h 2m 3s", "3.4s", "345ms"
+    text = str(text).strip()
+    if text in ("", "-", "nan"):
+        return np.nan
+    if re.fullmatch(r"[\d.]+", text):
+        return float(text)
+    parts = re.findall(r"([\d.]+)\s*(ms|s|m|h|d)", text)
+    if not parts:
+        raise click.ClickException(f"Cannot parse the trace duration '{text}'")
+    return sum(float(value) * DURATION_UNITS[unit] for value, unit in parts)
+
+
+def parse_memory(text):
+    # Trace memory: raw bytes or "1.2 GB", "512 MB"
+    text = str(text).strip()
+    return np.nan if text in ("", "-", "nan") else float(parse_size(text))
+
+
+def parse_percent(text):
+    text = str(text).strip().rstrip("%")
+    return np.nan if text in ("", "-", "nan") else float(text)
+
+
+def read_trace(path):
+    """The trace records of a trace TSV or an HTML execution report, as a DataFrame of strings."""
+    with open(path) as handle:
+        content = handle.read()
+    if content.lstrip().startswith("<"):
+        # The execution report embeds its trace records as JSON
+        match = re.search(r"window\.data\s*=\s*(\{.*?\});?\s*</script>", content, re.S)
+        if not match:
+            raise click.ClickException(f"No trace data in the report {path}")
+        return pd.DataFrame(json.loads(match.group(1))["trace"]).astype(str)
+    return pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+
+
+def sample_sizes(reads_dirs):
+    """{sample: bytes of <sample>_R1* + <sample>_R2*} of the read pairs in the folders."""
+    sizes = {}
+    for reads_dir in reads_dirs:
+        for r1 in glob.glob(os.path.join(reads_dir, "*_R1*")):
+            sample, _, suffix = os.path.basename(r1).rpartition("_R1")
+            r2 = os.path.join(os.path.dirname(r1), f"{sample}_R2{suffix}")
+            if os.path.exists(r2):
+                sizes[sample] = os.path.getsize(r1) + os.path.getsize(r2)
+    return sizes
+
+
+def load_tasks(trace_files, sizes):
+    """Completed tasks with process, sample, input size (GB) and the resources allocated and used."""
+    traces = pd.concat([read_trace(path) for path in trace_files], ignore_index=True)
+    missing = {"process", "status", "realtime", "peak_rss"} - set(traces.columns)
+    if missing:
+        raise click.ClickException(f"The traces lack the fields {', '.join(sorted(missing))}; see trace.fields in nextflow.config")
+    traces = traces[traces["status"] == "COMPLETED"]
+    tasks = pd.DataFrame({
+        # "NF:WORKFLOW:srst2" -> "srst2"
+        "process": traces["process"].str.rpartition(":")[2],
+        "sample": traces.get("tag", pd.Series("", index=traces.index)),
+        "cpus": traces.get("cpus", pd.Series("", index=traces.index)).replace({"-": ""}),
+        "memory": traces.get("memory", pd.Series("", index=traces.index)).map(parse_memory),
+        "realtime": traces["realtime"].map(parse_duration),
+        "cpu_percent": traces.get("%cpu", pd.Series("", index=traces.index)).map(parse_percent),
+        "peak_rss": traces["peak_rss"].map(parse_memory),
+    })
+    tasks["cpus"] = pd.to_numeric(tasks["cpus"], errors="coerce")
+    tasks["size_gb"] = tasks["sample"].map(sizes) / GB
+    return tasks.dropna(subset=["realtime", "peak_rss"])
+
+
+def fit_linear(x, y, quantile):
+    """
+    y ~ intercept + slope * x by least squares, with the intercept raised so the
+    line covers the quantile of the observations. Falls back to the quantile of
+    y when x does not vary or the slope comes out negative.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    known = ~np.isnan(x)
+    if known.sum() >= 3 and len(np.unique(x[known])) >= 2:
+        slope, intercept = np.polyfit(x[known], y[known], 1)
+        if slope > 0:
+            residuals = y[known] - (intercept + slope * x[known])
+            return {"intercept": float(intercept + max(0.0, np.quantile(residuals, quantile))), "slope": float(slope)}
+    return {"intercept": float(np.quantile(y, quantile)), "slope": 0.0}
+
+
+def predict(model, size_gb):
+    return model["intercept"] + model["slope"] * (size_gb if size_gb == size_gb else 0.0)
+
+
+def fit_models(tasks, quantile):
+    models = {}
+    for process, group in tasks.groupby("process"):
+        per_sample = bool(group["size_gb"].notna().any())
+        cpus = group["cpus"].dropna()
+        memory = group["memory"].dropna()
+        models[process] = {
+            "tasks": int(len(group)),
+            "per_sample": per_sample,
+            "max_size_gb": float(group["size_gb"].max()) if per_sample else None,
+            # What the traced runs allocated
+            "cpus": int(cpus.mode().iloc[0]) if len(cpus) else None,
+            "memory": float(memory.mode().iloc[0]) if len(memory) else None,
+            # Cores busy at the quantile, from %cpu (100 per busy core)
+            "cpu_usage": float(np.nanquantile(group["cpu_percent"], quantile) / 100) if group["cpu_percent"].notna().any() else None,
+            "realtime_ms": fit_linear(group["size_gb"], group["realtime"], quantile),
+            "peak_rss": fit_linear(group["size_gb"], group["peak_rss"], quantile),
+        }
+    return models
+
+
+def round_up(value, step):
+    return max(step, math.ceil(value / step) * step)
+
+
+def directives(model, size_gb, max_cpus, memory_headroom, time_headroom):
+    """cpus, memory (bytes) and time (minutes) of a process for inputs up to size_gb."""
+    allocated = model["cpus"] or max_cpus
+    usage = model["cpu_usage"]
+    if usage is None or usage >= 0.9 * allocated:
+        # CPU-bound at its allocation (or unknown): it may use more cores than it got
+        cpus = allocated
+    else:
+        cpus = max(1, math.ceil(usage))
+    memory = round_up(predict(model["peak_rss"], size_gb) * memory_headroom, GB // 2)
+    minutes = round_up(predict(model["realtime_ms"], size_gb) * time_headroom / 60000, 10)
+    return min(cpus, max_cpus), memory, minutes
+
+
+def config_block(process, cpus, memory, minutes, max_retries, max_memory):
+    retries = MODULE_RETRIES.get(process, max_retries)
+    memory, max_memory = memory // (1 << 20), max_memory // (1 << 20)
+    return "\n".join([
+        f"    withName: '{process}' {{",
+        f"        cpus = {cpus}",
+        f"        memory = {{ [{memory}.MB * task.attempt, {max(memory, max_memory)}.MB].min() }}",
+        f"        time = {{ {minutes}.min * task.attempt }}",
+        f"        errorStrategy = {{ task.exitStatus in {RETRY_EXIT_STATUS} ? 'retry' : 'terminate' }}",
+        f"        maxRetries = {retries}",
+        "    }",
+    ])
+
+
+@click.group()
+def cli():
+    """Fit per-process resource models on Nextflow traces and size the processes from them."""
+
+
+@cli.command("fit")
+@click.option('--trace', 'trace_files', multiple=True, required=True, type=click.Path(exists=True), help='Nextflow trace TSV or execution report HTML (repeatable)')
+@click.option('--reads_dir', 'reads_dirs', multiple=True, type=click.Path(exists=True, file_okay=False), help='Read folder of a traced run, for the FASTQ size of each sample (repeatable)')
+@click.option('--quantile', type=click.FloatRange(0.5, 1), default=0.95, show_default=True, help='Fraction of the traced tasks the fitted runtime and memory must cover')
+@click.option('--output', required=True, help='Model JSON')
+def fit_command(trace_files, reads_dirs, quantile, output):
+    """Fit runtime and peak RSS per process against the input FASTQ size."""
+    tasks = load_tasks(trace_files, sample_sizes(reads_dirs))
+    if tasks.empty:
+        raise click.ClickException("No completed tasks in the traces")
+    models = fit_models(tasks, quantile)
+    with open(output, "w") as handle:
+        json.dump({"quantile": quantile, "processes": models}, handle, indent=2)
+    for process, model in sorted(models.items()):
+        click.echo(f"{process}: {model['tasks']} tasks, runtime {model['realtime_ms']['intercept'] / 60000:.1f} + "
+                   f"{model['realtime_ms']['slope'] / 60000:.1f} min/GB, peak RSS {format_size(model['peak_rss']['intercept'])} + "
+                   f"{format_size(model['peak_rss']['slope'])}/GB", err=True)
+
+
+@cli.command("plan")
+@click.option('--model', 'model_file', required=True, type=click.Path(exists=True), help='Model JSON written by fit')
+@click.option('--reads_dir', 'reads_dirs', multiple=True, type=click.Path(exists=True, file_okay=False), help='Read folder of the batch to size for (default: the largest traced sample)')
+@click.option('--max_cpus', type=click.IntRange(min=1), default=8, show_default=True, help='Upper bound of cpus (params.NCPUS)')
+@click.option('--current_memory', default='16 GB', show_default=True, help='Memory allocated today where the traces do not say (params.MEM)')
+@click.option('--memory_headroom', type=click.FloatRange(min=1), default=1.2, show_default=True, help='Factor on the predicted peak RSS')
+@click.option('--time_headroom', type=click.FloatRange(min=1), default=2.0, show_default=True, help='Factor on the predicted runtime')
+@click.option('--max_retries', type=click.IntRange(min=0), default=2, show_default=True, help='Retries (with doubled, tripled, ... memory and time) of processes without their own maxRetries')
+@click.option('--max_memory', default='64 GB', show_default=True, help='Cap of the memory escalated on retries')
+@click.option('--config_file', default='resources.config', show_default=True, help='Nextflow config to write')
+@click.option('--dry_run', is_flag=True, help='Only print the report, do not write the config')
+def plan_command(model_file, reads_dirs, max_cpus, current_memory, memory_headroom, time_headroom, max_retries, max_memory, config_file, dry_run):
+    """Per-process directives for a batch, and the core-hours they save against the current allocation."""
+    with open(model_file) as handle:
+        models = json.load(handle)["processes"]
+    sizes = sample_sizes(reads_dirs)
+    batch = np.array(list(sizes.values()), dtype=float) / GB
+    current_memory = parse_size(current_memory)
+    max_memory = parse_size(max_memory)
+
+    rows, blocks = [], []
+    for process, model in sorted(models.items()):
+        if model["per_sample"]:
+            task_sizes = batch if len(batch) else np.array([model["max_size_gb"]])
+        else:
+            task_sizes = np.array([np.nan])
+        # One static directive per process, sized for the largest input of the batch
+        cpus, memory, minutes = directives(model, np.nanmax(task_sizes) if model["per_sample"] else np.nan,
+                                           max_cpus, memory_headroom, time_headroom)
+        hours = np.array([predict(model["realtime_ms"], size) for size in task_sizes]) / 3600000
+        now_cpus = model["cpus"] or max_cpus
+        now_memory = model["memory"] or current_memory
+        rows.append({
+            "process": process, "tasks": len(task_sizes),
+            "cpus": f"{now_cpus}->{cpus}", "memory": f"{format_size(now_memory)}->{format_size(memory)}",
+            "time": f"{minutes}min", "task_hours": hours.sum(),
+            "core_hours": now_cpus * hours.sum(), "core_hours_new": cpus * hours.sum(),
+            "gb_hours": now_memory / GB * hours.sum(), "gb_hours_new": memory / GB * hours.sum(),
+        })
+        blocks.append(config_block(process, cpus, memory, minutes, max_retries, max_memory))
+
+    report = pd.DataFrame(rows)
+    click.echo(report.to_csv(sep="\t", index=False, float_format="%.2f"), nl=False)
+    total, total_new = report["core_hours"].sum(), report["core_hours_new"].sum()
+    gb_total, gb_total_new = report["gb_hours"].sum(), report["gb_hours_new"].sum()
+    click.echo(f"Core-hours: {total:.1f} -> {total_new:.1f} ({1 - total_new / total:.0%} saved); "
+               f"GB-hours: {gb_total:.1f} -> {gb_total_new:.1f} ({1 - gb_total_new / gb_total:.0%} saved)"
+               if total and gb_total else "Nothing to project", err=True)
+    if not dry_run:
+        with open(config_file, "w") as handle:
+            handle.write("// Written by bin/resource_model.py plan; pass with -c\nprocess {\n" + "\n".join(blocks) + "\n}\n")
+        click.echo(f"Wrote {config_file}", err=True)
+
+
+if __name__ == '__main__':
+    cli()
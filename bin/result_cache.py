@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Content-addressed cache of tool reports, shared between projects and work directories.
+
+An entry is keyed on the tool, the checksums of the read files, the database
+(file or directory), the container image and the tool parameters. The cache
+directory holds:
+  entries/<kk>/<key>/      the cached report files and meta.json
+  entries/.../last_used    touched on every restore; eviction is least recently used first
+  checksums/<stamp>        sha256 memo per (path, size, mtime), so every file is hashed once
+File names keep the sample field of "<tool prefix><sample>" as a placeholder,
+so a hit restores the reports under the name of the sample being analysed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+from annotation_index import file_checksum
+
+# Bump when the key inputs or the entry layout change, to start from an empty cache
+CACHE_VERSION = 2
+SAMPLE_PLACEHOLDER = "{sample}"
+# Report names are "<prefix><sample>..." (the names main.nf looks up for the summary)
+REPORT_PREFIXES = {"groot": "groot_report_", "kma": "ARGprofiler_report_", "ariba": "ariba_report_", "karga": "karga_report_", "srst2": "srst2_report_"}
+SIZE_UNITS = {"": 1, "B": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def name_pattern(name, sample, tool):
+    """The report name with its sample field templated; names without the tool prefix are kept as they are."""
+    prefix = REPORT_PREFIXES.get(tool, f"{tool}_report_") + sample
+    if name.startswith(prefix):
+        return prefix[:-len(sample)] + SAMPLE_PLACEHOLDER + name[len(prefix):]
+    return name
+
+
+def sample_name(pattern, sample):
+    # Only the single templated field is filled in
+    head, placeholder, tail = pattern.partition(SAMPLE_PLACEHOLDER)
+    return head + sample + tail if placeholder else pattern
+
+
+def parse_size(text):
+    # "500G", "500 GB", "2.5T" or a plain number of bytes
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)I?B?\s*", str(text).upper())
+    if not match:
+        raise click.BadParameter(f"Cannot parse size '{text}' (e.g. 500G or '2 TB')")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def format_size(size):
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}B"
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+def write_json(data, path):
+    handle, tmp = tempfile.mkstemp(prefix=".tmp.", dir=os.path.dirname(path))
+    with os.fdopen(handle, "w") as out:
+        json.dump(data, out, indent=1)
+    os.replace(tmp, path)
+
+
+class ResultCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.entries_dir = os.path.join(cache_dir, "entries")
+        self.checksums_dir = os.path.join(cache_dir, "checksums")
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.checksums_dir, exist_ok=True)
+
+    def checksum(self, path):
+        """sha256 of a file, memoised on its resolved path, size and mtime."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        stamp = hashlib.sha1(f"{path}\t{stat.st_size}\t{stat.st_mtime_ns}".encode("utf-8")).hexdigest()
+        memo = os.path.join(self.checksums_dir, stamp)
+        try:
+            with open(memo) as handle:
+                return handle.read().strip()
+        except OSError:
+            pass
+        digest = file_checksum(path)
+        handle, tmp = tempfile.mkstemp(prefix=".tmp.", dir=self.checksums_dir)
+        with os.fdopen(handle, "w") as out:
+            out.write(digest)
+        os.replace(tmp, memo)
+        return digest
+
+    def path_checksum(self, path):
+        """Checksum of a file, or of every file under a directory with its relative path."""
+        if not os.path.isdir(path):
+            return self.checksum(path)
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path, followlinks=True):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(f"{os.path.relpath(file_path, path)}\t{self.checksum(file_path)}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def key(self, tool, reads, database=None, container=None, parameters=()):
+        """Cache key (sha256) of a tool run."""
+        inputs = {
+            "version": CACHE_VERSION,
+            "tool": tool,
+            "reads": [self.checksum(path) for path in reads],
+            # Databases and images that are not local paths (e.g. docker://) are keyed by name
+            "database": self.path_checksum(database) if database and os.path.exists(database) else database,
+            "container": self.path_checksum(container) if container and os.path.exists(container) else container,
+            "parameters": sorted(parameters),
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.entries_dir, key[:2], key)
+
+    def entries(self):
+        """meta.json of every complete entry, with its directory and last use."""
+        for prefix in sorted(os.listdir(self.entries_dir)):
+            prefix_dir = os.path.join(self.entries_dir, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                continue
+            for key in sorted(os.listdir(prefix_dir)):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    with open(os.path.join(entry_dir, "meta.json")) as handle:
+                        meta = json.load(handle)
+                    meta["last_used"] = os.stat(os.path.join(entry_dir, "last_used")).st_mtime
+                except (OSError, ValueError):
+                    continue
+                meta["dir"] = entry_dir
+                yield meta
+
+    def restore(self, key, dest, sample):
+        """Copy the reports of a hit into dest under the sample name; returns the restored paths or None."""
+        entry_dir = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, "meta.json")) as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        restored = []
+        try:
+            for stored in meta["files"]:
+                target = os.path.join(dest, sample_name(stored["name"], sample))
+                shutil.copyfile(os.path.join(entry_dir, stored["name"]), target)
+                restored.append(target)
+        except OSError:
+            # Evicted while being restored: a miss
+            for target in restored:
+                os.remove(target)
+            return None
+        os.utime(os.path.join(entry_dir, "last_used"))
+        return restored
+
+    def store(self, key, files, sample, tool):
+        """Add an entry; a concurrent store of the same key keeps the first complete one."""
+        entry_dir = self.entry_dir(key)
+        if os.path.exists(os.path.join(entry_dir, "meta.json")):
+            os.utime(os.path.join(entry_dir, "last_used"))
+            return False
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=".store.", dir=os.path.dirname(entry_dir))
+        try:
+            stored = []
+            for path in files:
+                name = name_pattern(os.path.basename(path), sample, tool)
+                shutil.copyfile(path, os.path.join(work_dir, name))
+                stored.append({"name": name, "size": os.path.getsize(path), "sha256": file_checksum(path)})
+            meta = {"key": key, "tool": tool, "sample": sample, "created": time.time(), "files": stored,
+                    "size": sum(entry["size"] for entry in stored)}
+            write_json(meta, os.path.join(work_dir, "meta.json"))
+            open(os.path.join(work_dir, "last_used"), "w").close()
+            os.rename(work_dir, entry_dir)
+            return True
+        except OSError:
+            if os.path.exists(os.path.join(entry_dir, "meta.json")):
+                return False
+            raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def verify(self, meta):
+        """Names of the entry's files that are missing or whose checksum changed."""
+        bad = []
+        for stored in meta["files"]:
+            path = os.path.join(meta["dir"], stored["name"])
+            if not os.path.exists(path) or file_checksum(path) != stored["sha256"]:
+                bad.append(stored["name"])
+        return bad
+
+    def remove(self, meta):
+        shutil.rmtree(meta["dir"], ignore_errors=True)
+
+    def prune(self, max_size=None, max_age=None):
+        """Evict least recently used entries until the cache fits max_size (bytes); also drop entries unused for max_age days."""
+        entries = sorted(self.entries(), key=lambda meta: meta["last_used"])
+        total = sum(meta["size"] for meta in entries)
+        removed = []
+        now = time.time()
+        for meta in entries:
+            too_old = max_age is not None and now - meta["last_used"] > max_age * 86400
+            too_big = max_size is not None and total > max_size
+            if not too_old and not too_big:
+                continue
+            self.remove(meta)
+            total -= meta["size"]
+            removed.append(meta)
+        return removed, total
+
+
+def parse_parameters(parameters):
+    for parameter in parameters:
+        if "=" not in parameter:
+            raise click.BadParameter(f"Expected NAME=VALUE, got '{parameter}'", param_hint="--param")
+    return list(parameters)
+
+
+cache_option = click.option('--cache', 'cache_dir', type=click.Path(), required=True, help='Cache directory')
+
+
+@click.group()
+def cli():
+    """Content-addressed cache of tool reports."""
+
+
+@cli.command("key")
+@cache_option
+@click.option('--tool', required=True, help='Tool name (groot, ariba, karga, srst2, kma)')
+@click.option('--reads', multiple=True, required=True, type=click.Path(exists=True), help='Read files (repeatable)')
+@click.option('--database', required=False, help='Database file or directory')
+@click.option('--container', required=False, help='Container image file or URI')
+@click.option('--param', 'parameters', multiple=True, help='Tool parameter as NAME=VALUE (repeatable)')
+def key_command(cache_dir, tool, reads, database, container, parameters):
+    """Print the cache key of a tool run."""
+    key = ResultCache(cache_dir).key(tool, reads, database, container, parse_parameters(parameters))
+    click.echo(key)
+
+
+@cli.command("restore")
+@cache_option
+@click.option('--key', required=True, help='Cache key (see the key command)')
+@click.option('--sample_name', required=True, help='Sample the reports are restored for')
+@click.option('--dest', type=click.Path(file_okay=False), default='.', show_default=True, help='Directory to restore the reports into')
+def restore_command(cache_dir, key, sample_name, dest):
+    """Restore the reports of a cached run; exits with status 1 on a miss."""
+    restored = ResultCache(cache_dir).restore(key, dest, sample_name)
+    if restored is None:
+        sys.exit(1)
+    for path in restored:
+        click.echo(path)
+
+
+@cli.command("store")
+@cache_option
+@click.option('--key', required=True, help='Cache key (see the key command)')
+@click.option('--sample_name', required=True, help='Sample the reports belong to')
+@click.option('--tool', required=True, help='Tool name')
+@click.option('--max_size', required=False, help='Evict least recently used entries beyond this size after storing (e.g. 500G)')
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def store_command(cache_dir, key, sample_name, tool, max_size, files):
+    """Store the report FILES of a tool run under KEY."""
+    cache = ResultCache(cache_dir)
+    if cache.store(key, files, sample_name, tool):
+        click.echo(f"Cached {len(files)} {tool} reports of {sample_name}: {key}")
+    if max_size:
+        removed, total = cache.prune(max_size=parse_size(max_size))
+        if removed:
+            click.echo(f"Evicted {len(removed)} entries; cache size {format_size(total)}")
+
+
+@cli.command("list")
+@cache_option
+def list_command(cache_dir):
+    """List the entries, least recently used first."""
+    entries = sorted(ResultCache(cache_dir).entries(), key=lambda meta: meta["last_used"])
+    click.echo("key\ttool\tsample\tsize\tcreated\tlast_used")
+    for meta in entries:
+        created, last_used = (time.strftime("%Y-%m-%d %H:%M", time.localtime(meta[name])) for name in ("created", "last_used"))
+        click.echo(f"{meta['key']}\t{meta['tool']}\t{meta['sample']}\t{format_size(meta['size'])}\t{created}\t{last_used}")
+    click.echo(f"{len(entries)} entries, {format_size(sum(meta['size'] for meta in entries))}", err=True)
+
+
+@cli.command("verify")
+@cache_option
+@click.option('--remove', is_flag=True, help='Remove entries with missing or changed files')
+def verify_command(cache_dir, remove):
+    """Check the files of every entry against their stored checksums."""
+    cache = ResultCache(cache_dir)
+    n_entries = n_bad = 0
+    for meta in cache.entries():
+        n_entries += 1
+        bad = cache.verify(meta)
+        if bad:
+            n_bad += 1
+            click.echo(f"{meta['key']}\t{meta['tool']}\t{meta['sample']}\t{','.join(bad)}")
+            if remove:
+                cache.remove(meta)
+    click.echo(f"{n_entries} entries checked, {n_bad} {'removed' if remove else 'damaged'}", err=True)
+    if n_bad and not remove:
+        sys.exit(1)
+
+
+@cli.command("prune")
+@cache_option
+@click.option('--max_size', required=False, help='Evict least recently used entries until the cache fits this size (e.g. 500G)')
+@click.option('--max_age', type=float, required=False, help='Evict entries not used for this many days')
+def prune_command(cache_dir, max_size, max_age):
+    """Evict entries by size (least recently used first) and/or age."""
+    if max_size is None and max_age is None:
+        raise click.UsageError("Give --max_size and/or --max_age.")
+    removed, total = ResultCache(cache_dir).prune(parse_size(max_size) if max_size else None, max_age)
+    click.echo(f"Evicted {len(removed)} entries; cache size {format_size(total)}")
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,167 +1,703 @@
-import csv, os
+import csv, json, os, re
 import click
+import numpy as np
 import pandas as pd
 from collections import defaultdict
-from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+from annotation_index import open_index
+from gene_crosswalk import GeneCrosswalk
+from instrumentation import instrumented, stage
+from mapstat_filters import DEFAULT_FILTERS as MAPSTAT_FILTERS, GENE_COLUMN as MAPSTAT_GENE_COLUMN, as_written, filter_mapstat
+from summary_state import SummaryState
 pd.set_option('future.no_silent_downcasting', True)
 
-def parse_groot_results(groot_output_file):
+# Manifest columns for cohort mode, named after the per-sample command line options
+MANIFEST_COLUMNS = ['sample', 'groot_results', 'ariba_results', 'ariba_summary', 'karga_results', 'srst2_results', 'argprofiler_results']
+# Optional manifest columns: raw KMA mapstat files, filtered with --kma_refdata
+OPTIONAL_MANIFEST_COLUMNS = ['kma_mapstat']
+# File extensions of the columnar --output_format choices
+COLUMNAR_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+TOOLS = ['groot', 'ariba', 'karga', 'srst2', 'argprofiler']
+# Quantitative columns kept for every reported gene; thresholds apply to these
+EVIDENCE_COLUMNS = ['coverage', 'depth', 'identity', 'reads']
+# Default {tool: {metric: minimum}} cut-offs, overridden with --thresholds
+DEFAULT_THRESHOLDS = {'karga': {'coverage': 80}}
+ARIBA_REPORT_COLUMNS = ('ref_name', 'cluster', 'ref_len', 'ref_base_assembled', 'pc_ident', 'ctg_cov', 'reads')
+# ARIBA summary match values written as calls; 'no' is dropped and any other
+# status (yes_nonunique, fragmented, ...) is written as it is
+ARIBA_CALLS = {'yes': 1}
+# Annotation columns left out of the summaries
+DROPPED_METADATA_COLUMNS = ['entry_count', 'shortname', 'database', 'id']
+# Calls whose gene identifier matched no panARG gene (--unmatched_file)
+UNMATCHED_COLUMNS = ['sample', 'tool', 'identifier', 'reason']
+
+def evidence_frame(genes, coverage=None, depth=None, identity=None, reads=None):
+    # Typed long-format evidence: one row per reported gene, NaN where the tool
+    # does not report a value. Coverage and identity are percentages.
+    genes = pd.Series(genes, dtype=object).reset_index(drop=True)
+    evidence = pd.DataFrame({"Gene": genes})
+    for column, values in zip(EVIDENCE_COLUMNS, (coverage, depth, identity, reads)):
+        if values is None:
+            evidence[column] = np.nan
+        else:
+            evidence[column] = pd.to_numeric(pd.Series(values).reset_index(drop=True), errors="coerce").astype("float64")
+    return evidence
+
+def passes_thresholds(evidence, thresholds):
+    # Vectorised {metric: minimum} filter; a metric the tool does not report
+    # (NaN) does not reject the call
+    keep = np.ones(len(evidence), dtype=bool)
+    for metric, minimum in (thresholds or {}).items():
+        values = evidence[metric]
+        keep &= ((values >= minimum) | values.isna()).to_numpy()
+    return keep
+
+def detection_calls(file_name, evidence, thresholds=None):
+    # Gene + call column named after the report, as merged by merge_results:
+    # 1, or the reader's "call" value (the ARIBA match status) when it has one
+    keep = passes_thresholds(evidence, thresholds)
+    output = evidence.loc[keep, ["Gene"]]
+    output[file_name] = evidence.loc[keep, "call"] if "call" in evidence.columns else 1
+    return output
+
+def load_thresholds(thresholds_file=None):
+    # JSON config {"tool": {"metric": minimum}}; a tool listed in the config
+    # replaces that tool's defaults, e.g. {"karga": {}} disables the KARGA cut-off
+    thresholds = {tool: dict(values) for tool, values in DEFAULT_THRESHOLDS.items()}
+    if not thresholds_file:
+        return thresholds
+    with open(thresholds_file) as handle:
+        config = json.load(handle)
+    for tool, values in config.items():
+        if tool not in TOOLS:
+            raise click.ClickException(f"Unknown tool '{tool}' in {thresholds_file}; choose from {', '.join(TOOLS)}")
+        for metric, minimum in values.items():
+            if metric not in EVIDENCE_COLUMNS or not isinstance(minimum, (int, float)):
+                raise click.ClickException(f"Invalid threshold {tool}.{metric}={minimum!r} in {thresholds_file}; metrics are {', '.join(EVIDENCE_COLUMNS)}")
+        thresholds[tool] = dict(values)
+    return thresholds
+
+def read_groot_evidence(groot_output_file):
     file_name = os.path.basename(groot_output_file)
     click.echo(f"Processing GROOT output: {file_name}")
     try:
         output = pd.read_csv(groot_output_file, sep="\t") # Assuming TSV format
-        output.columns.values[0] = "Gene"
-        output[file_name] = 1
-        output=output[["Gene",file_name]]
+        # Columns: gene, read count, gene length, coverage CIGAR (matched bases as <n>M)
+        reads = output.iloc[:, 1] if output.shape[1] > 1 else None
+        coverage = None
+        if output.shape[1] > 3:
+            length = pd.to_numeric(output.iloc[:, 2], errors="coerce")
+            matched = output.iloc[:, 3].astype(str).str.extractall(r"(\d+)M")[0].astype(float).groupby(level=0).sum()
+            coverage = matched.reindex(output.index) / length * 100
+        evidence = evidence_frame(output.iloc[:, 0], coverage=coverage, reads=reads)
     except pd.errors.EmptyDataError:
         print(f"Warning GROOT output: {file_name} is empty.")
-        output[file_name]=0
-    return output
+        evidence = evidence_frame([])
+    return file_name, evidence
 
-def parse_ariba_results(ariba_output_file, ariba_summary_file):
-    mapping={}
+def read_ariba_evidence(ariba_output_file, ariba_summary_file):
     file_name = os.path.basename(ariba_output_file)
     click.echo(f"Processing ARIBA output: {file_name}")
+    # cluster -> ref_name and metrics of the first report row of each cluster
+    report = pd.DataFrame(columns=["cluster"])
     try:
-        output = pd.read_csv(ariba_output_file, sep="\t", header=0) # Assuming TSV format
+        output = pd.read_csv(ariba_output_file, sep="\t", header=0, usecols=lambda col: col in ARIBA_REPORT_COLUMNS) # Assuming TSV format
         if 'ref_name' in output.columns and 'cluster' in output.columns:
-            for _, row in output.iterrows():
-                ref_name = row['ref_name']
-                cluster = row['cluster']
-                if cluster not in mapping:
-                    mapping[cluster] = ref_name
+            report = output.drop_duplicates("cluster")
     except pd.errors.EmptyDataError:
         print(f"Warning ARIBA output: {ariba_output_file}")
+    mapping = report.set_index("cluster")["ref_name"] if "ref_name" in report.columns else pd.Series(dtype=object)
     
-    ## Parse summary file
+    ## Parse summary file: keep this sample's row and reshape the <cluster>.match calls to long format
     try:
-        summary = pd.read_csv(ariba_summary_file, sep=",", header=0) # Assuming CSV format
-        summary = summary.replace({"yes": 1, "no": 0}).infer_objects(copy=False)
-        summary.columns = summary.columns.str.replace(r"\.match$", "", regex=True)
-        summary.rename(columns=mapping, inplace=True)
-        summary=summary.T
-        summary.columns = summary.iloc[0]
-        summary = summary[1:].reset_index()
-        summary.columns.values[0]="Gene"
-        summary=summary[["Gene",file_name]]
-        summary = summary[summary[file_name] != 0]
+        summary = pd.read_csv(ariba_summary_file, sep=",", header=0, dtype=str, usecols=lambda col: col == "name" or col.endswith(".match")) # Assuming CSV format
+        calls = summary.loc[summary["name"] == file_name].drop(columns="name")
+        summary = calls.melt(var_name="cluster", value_name="match")
+        summary["cluster"] = summary["cluster"].str.replace(r"\.match$", "", regex=True)
+        summary = summary[summary["match"] != "no"]
     except pd.errors.EmptyDataError:
         print(f"Warning ARIBA summary: {ariba_summary_file} is empty")
+        summary = pd.DataFrame(columns=["cluster", "match"])
 
-    return summary
+    summary = summary.merge(report.drop(columns="ref_name", errors="ignore"), on="cluster", how="left")
+    genes = summary["cluster"].map(mapping).fillna(summary["cluster"])
+    column = lambda name: summary[name] if name in summary.columns else None
+    coverage = None
+    if "ref_base_assembled" in summary.columns and "ref_len" in summary.columns:
+        coverage = summary["ref_base_assembled"] / summary["ref_len"] * 100
+    evidence = evidence_frame(genes, coverage=coverage, depth=column("ctg_cov"), identity=column("pc_ident"), reads=column("reads"))
+    evidence["call"] = summary["match"].map(lambda match: ARIBA_CALLS.get(match, match)).to_numpy(dtype=object)
+    return file_name, evidence
 
-def parse_karga_results(karga_output_file):
+def read_karga_evidence(karga_output_file):
     file_name = os.path.basename(karga_output_file)
     click.echo(f"Processing KARGA output: {file_name}")  # Print current file being processed
     try:
-        output = pd.read_csv(karga_output_file, sep=",", header=0) # Read CSV file
-        output["PercentGeneCovered"] = output["PercentGeneCovered"].str.rstrip('%').astype(float) # Process PercentGeneCovered column
-        output=output[output["PercentGeneCovered"] >= 80]
-        output["PercentGeneCovered"]=1
-        output["GeneIdx"]=output["GeneIdx"].str.lstrip('>').astype(str)
-        output=output[["GeneIdx", "PercentGeneCovered"]].rename(columns={"GeneIdx": "Gene", "PercentGeneCovered": file_name})
+        output = pd.read_csv(karga_output_file, sep=",", header=0, usecols=lambda col: col in ("GeneIdx", "PercentGeneCovered", "AverageKMerDepth")) # Read CSV file
+        coverage = output["PercentGeneCovered"].astype(str).str.rstrip('%').astype(float) # Process PercentGeneCovered column
+        depth = output["AverageKMerDepth"] if "AverageKMerDepth" in output.columns else None
+        evidence = evidence_frame(output["GeneIdx"].str.lstrip('>').astype(str), coverage=coverage, depth=depth)
     except pd.errors.EmptyDataError:
         print(f"Warning: {file_name} is empty.")
-        output[file_name]=0
+        evidence = evidence_frame([])
     
+    return file_name, evidence
+
+def count_header_lines(report_file, prefix="##"):
+    # Number of leading comment lines (e.g. the "##" block of a KMA mapstat)
+    count = 0
+    with open(report_file) as handle:
+        for line in handle:
+            if not line.startswith(prefix):
+                break
+            count += 1
+    return count
+
+def first_rows(frame, keep=None):
+    # One row per gene in file order: the first one, or the first one where
+    # the boolean column keep is set if the gene has any
+    if keep is None:
+        return frame.drop_duplicates("Gene")
+    return frame.sort_values(keep, ascending=False, kind="stable").drop_duplicates("Gene").sort_index()
+
+def scan_report(report_file, gene_column, columns=(), sep="\t", skiprows=0, passes=None, chunksize=100000):
+    # Stream a report in chunks, reading only the gene column (renamed Gene)
+    # and the requested value columns. One row is kept per gene: the first
+    # one, or with passes (chunk -> boolean mask, e.g. the tool thresholds)
+    # the first passing one, so peak memory is bounded by the number of
+    # distinct genes rather than by the size of the file. Rows without a gene
+    # name are skipped.
+    wanted = {gene_column, *columns}
+    seen = set()
+    passed = set()
+    frames = []
+    chunks = pd.read_csv(report_file, sep=sep, header=0, skiprows=skiprows, usecols=lambda col: col in wanted, chunksize=chunksize)
+    for chunk in chunks:
+        chunk = chunk.rename(columns={gene_column: "Gene"})
+        chunk = chunk[chunk["Gene"].notna() & ~chunk["Gene"].isin(passed)]
+        if passes is None:
+            chunk = first_rows(chunk[~chunk["Gene"].isin(seen)])
+        else:
+            chunk = first_rows(chunk.assign(_passes=np.asarray(passes(chunk), dtype=bool)), "_passes")
+            # A failing row only stands in for a gene without any row yet
+            chunk = chunk[chunk["_passes"] | ~chunk["Gene"].isin(seen)]
+            passed.update(chunk.loc[chunk["_passes"], "Gene"])
+        seen.update(chunk["Gene"])
+        frames.append(chunk)
+    if not frames:
+        return pd.DataFrame(columns=["Gene"])
+    output = pd.concat(frames, ignore_index=True)
+    if passes is not None:
+        # A passing row from a later chunk replaces the failing row of its gene
+        output = output[output["_passes"] | ~output["Gene"].isin(passed)].drop(columns="_passes").reset_index(drop=True)
     return output
 
-def parse_srst2_results(srst2_output_file):
+def srst2_evidence(output):
+    identity = 100 - output["divergence"] if "divergence" in output.columns else None
+    return evidence_frame(output["Gene"], coverage=output.get("coverage"), depth=output.get("depth"), identity=identity)
+
+def argprofiler_evidence(output):
+    coverage = output["propCovered"] * 100 if "propCovered" in output.columns else None
+    identity = output["readRefIdentity"] * 100 if "readRefIdentity" in output.columns else None
+    return evidence_frame(output["Gene"], coverage=coverage, depth=output.get("meanDepthCovered"), identity=identity, reads=output.get("readCount"))
+
+def threshold_filter(evidence, thresholds):
+    # The passes argument of scan_report for a tool's evidence and thresholds
+    if not thresholds:
+        return None
+    return lambda chunk: passes_thresholds(evidence(chunk), thresholds)
+
+def read_srst2_evidence(srst2_output_file, thresholds=None):
 
     #file = srst2_output_file.replace("__genes__", "__fullgenes__")
     file_name = os.path.basename(srst2_output_file).replace("_fullgenes_sequence_results.txt", "")
-    click.echo(f"Processing ARGprofiler output: {file_name}")
+    click.echo(f"Processing SRST2 output: {file_name}")
     try:
-        output = pd.read_csv(srst2_output_file, sep="\t", header=0) # Read txt file
-        output = output[["gene"]]
-        output[file_name]=1
-        output.rename(columns={"gene": "Gene"}, inplace=True)
+        # With thresholds, a gene reported twice keeps its first passing row
+        output = scan_report(srst2_output_file, "gene", columns=("coverage", "depth", "divergence"), passes=threshold_filter(srst2_evidence, thresholds)) # Read txt file
+        evidence = srst2_evidence(output)
             
     except pd.errors.EmptyDataError:
         print(f"Warning: {srst2_output_file} is empty.")
-        output[file_name]=0
+        evidence = evidence_frame([])
             
     except FileNotFoundError:
         print(f"Warning: {srst2_output_file} not found.")
-        output[file_name] = 0  # Add missing file column with zeros
+        evidence = evidence_frame([])
 
-    return output
+    return file_name, evidence
 
-def parse_argprofiler_results(argprofiler_output_file):
+def read_argprofiler_evidence(argprofiler_output_file, thresholds=None):
     file_name = os.path.basename(argprofiler_output_file)
     click.echo(f"Processing ARGprofiler output: {file_name}")
     try:
-        # Parase the file where first 6 lines are comments and 7 line is the header
-        output = pd.read_csv(argprofiler_output_file, sep="\t", header=0, skiprows=6) # Read txt file
-        output = output[["# refSequence"]]
-        output[file_name]=1
-        output.rename(columns={"# refSequence": "Gene"}, inplace=True)
+        # Parse the file where the "##" lines are comments and the next line is the header
+        skiprows = count_header_lines(argprofiler_output_file)
+        output = scan_report(argprofiler_output_file, "# refSequence", columns=("propCovered", "meanDepthCovered", "readRefIdentity", "readCount"), skiprows=skiprows,
+                             passes=threshold_filter(argprofiler_evidence, thresholds)) # Read txt file
+        evidence = argprofiler_evidence(output)
 
     except pd.errors.EmptyDataError:
         print(f"Warning: {file_name} is empty.")
-        output[file_name]=0
+        evidence = evidence_frame([])
 
     except FileNotFoundError:
         print(f"Warning: {file_name} not found.")
-        output[file_name] = 0
-    return output
+        evidence = evidence_frame([])
+    return file_name, evidence
 
-@click.command()
-#@click.argument('abricate_result', type=click.Path(exists=True))
-@click.option('--groot_results', type=click.Path(exists=True), required=False, help='Path to groot output file')
-@click.option('--ariba_results', type=click.Path(exists=True), required=False, help='Path to ARIBA output TSV/CSV files')
-@click.option('--ariba_summary', type=click.Path(exists=True), required=False, help='Path to ARIBA summary CSV file')
-@click.option('--karga_results', type=click.Path(exists=True), required=False, help='Path to KARGA output TSV/CSV files')
-@click.option('--srst2_results', type=click.Path(exists=True), required=False, help='Path to SRST2 output TXT files')
-@click.option('--argprofiler_results', type=click.Path(exists=True), required=False, help='Path to ARGprofiler output TXT files')
-@click.option('--metadata', type=click.Path(exists=True), required=False, help='Path to metadata file (panARG_annotation.tsv)')
-@click.option('--output_file', required=True, help='Name of the output file to write the combined results')
+def read_kma_mapstat_evidence(kma_mapstat_file, kma_refdata_file, filters=None, thresholds=None):
+    # Raw KMA mapstat filtered here as bin/mapstatFilters.R would, instead of
+    # an Rscript run and a filtered file per sample; the evidence equals that
+    # of the filtered report
+    file_name = os.path.basename(kma_mapstat_file)
+    click.echo(f"Processing KMA mapstat: {file_name}")
+    try:
+        _, output = filter_mapstat(kma_mapstat_file, kma_refdata_file, filters)
+        # The rows of NA stand for undecided references, not calls
+        output = output.dropna(subset=[MAPSTAT_GENE_COLUMN])
+        evidence = evidence_frame(output[MAPSTAT_GENE_COLUMN], coverage=as_written(output["propCovered"]) * 100, depth=as_written(output["meanDepthCovered"]),
+                                  identity=as_written(output["readRefIdentity"]) * 100, reads=output["readCount"])
+        if thresholds:
+            evidence = first_rows(evidence.assign(_passes=passes_thresholds(evidence, thresholds)), "_passes").drop(columns="_passes")
+        evidence = first_rows(evidence).reset_index(drop=True)
+
+    except pd.errors.EmptyDataError:
+        print(f"Warning: {file_name} is empty.")
+        evidence = evidence_frame([])
+
+    except FileNotFoundError:
+        print(f"Warning: {file_name} not found.")
+        evidence = evidence_frame([])
+    return file_name, evidence
+
+def parse_groot_results(groot_output_file, thresholds=None):
+    return detection_calls(*read_groot_evidence(groot_output_file), thresholds)
+
+def parse_ariba_results(ariba_output_file, ariba_summary_file, thresholds=None):
+    return detection_calls(*read_ariba_evidence(ariba_output_file, ariba_summary_file), thresholds)
 
-def summary_report(groot_results, ariba_results, ariba_summary, karga_results, srst2_results, argprofiler_results, metadata, output_file):   
-    dfs = []
+def parse_karga_results(karga_output_file, thresholds=DEFAULT_THRESHOLDS["karga"]):
+    return detection_calls(*read_karga_evidence(karga_output_file), thresholds)
+
+def parse_srst2_results(srst2_output_file, thresholds=None):
+    return detection_calls(*read_srst2_evidence(srst2_output_file, thresholds), thresholds)
+
+def parse_argprofiler_results(argprofiler_output_file, thresholds=None):
+    return detection_calls(*read_argprofiler_evidence(argprofiler_output_file, thresholds), thresholds)
+
+def sample_parse_tasks(groot_results=None, ariba_results=None, ariba_summary=None, karga_results=None, srst2_results=None, argprofiler_results=None, kma_mapstat=None, kma_refdata=None, mapstat_filters=None, thresholds=DEFAULT_THRESHOLDS):
+    # (tool, reader, arguments) in the fixed tool order used for the merge;
+    # readers return (report column name, evidence) before the calls are
+    # made. SRST2 and ARGprofiler list a gene once per allele or template, so
+    # their readers take the thresholds to keep the first passing row.
+    tasks = []
     if groot_results:
-        groot = parse_groot_results(groot_results)
-        dfs.append(groot)
+        tasks.append(("groot", read_groot_evidence, (groot_results,)))
     
     if ariba_results:
-        ariba = parse_ariba_results(ariba_results, ariba_summary)
-        dfs.append(ariba)
+        tasks.append(("ariba", read_ariba_evidence, (ariba_results, ariba_summary)))
 
     if karga_results:
-        karga = parse_karga_results(karga_results)
-        dfs.append(karga)
+        tasks.append(("karga", read_karga_evidence, (karga_results,)))
 
     if srst2_results:
-        srst2 = parse_srst2_results(srst2_results)
-        dfs.append(srst2)
+        tasks.append(("srst2", read_srst2_evidence, (srst2_results, dict(thresholds.get("srst2") or {}))))
     
     if argprofiler_results:
-        argprofiler = parse_argprofiler_results(argprofiler_results)
-        dfs.append(argprofiler)
+        tasks.append(("argprofiler", read_argprofiler_evidence, (argprofiler_results, dict(thresholds.get("argprofiler") or {}))))
+    elif kma_mapstat:
+        tasks.append(("argprofiler", read_kma_mapstat_evidence, (kma_mapstat, kma_refdata, mapstat_filters or dict(MAPSTAT_FILTERS), dict(thresholds.get("argprofiler") or {}))))
     
+    return tasks
+
+def run_parse_task(task):
+    tool, reader, args = task
+    with stage("parse", tool=tool) as record:
+        result = reader(*args)
+        record["rows"] = len(result[1])
+    return result
+
+def run_parse_tasks(tasks, jobs=1):
+    # Parsers are independent, so they can be spread over a process pool.
+    # executor.map returns results in submission order, which keeps the
+    # merged output identical to the serial run for any number of workers.
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            return list(executor.map(run_parse_task, tasks))
+    return [run_parse_task(task) for task in tasks]
+
+def parse_sample_reports(groot_results=None, ariba_results=None, ariba_summary=None, karga_results=None, srst2_results=None, argprofiler_results=None, jobs=1, kma_mapstat=None, kma_refdata=None, mapstat_filters=None, thresholds=DEFAULT_THRESHOLDS):
+    tasks = sample_parse_tasks(groot_results, ariba_results, ariba_summary, karga_results, srst2_results, argprofiler_results, kma_mapstat, kma_refdata, mapstat_filters, thresholds)
+    return run_parse_tasks(tasks, jobs), [tool for tool, _, _ in tasks]
+
+def sample_calls(parsed, tools, thresholds):
+    # Apply each tool's thresholds to its evidence; returns the frames to merge
+    return [detection_calls(file_name, evidence, thresholds.get(tool)) for (file_name, evidence), tool in zip(parsed, tools)]
+
+def evidence_table(sample, parsed, tools, thresholds):
+    # All evidence of one sample in long format, with the thresholded call
+    frames = []
+    for (file_name, evidence), tool in zip(parsed, tools):
+        evidence = evidence.copy()
+        evidence.insert(1, "sample", sample)
+        evidence.insert(2, "tool", tool)
+        evidence["detected"] = passes_thresholds(evidence, thresholds.get(tool)).astype(np.uint8)
+        frames.append(evidence.drop(columns="call", errors="ignore"))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Gene", "sample", "tool", *EVIDENCE_COLUMNS, "detected"])
+
+def run_cohort_tasks(samples, sample_tasks, jobs=1, state=None):
+    # Read the (sample, tool) evidence of the whole cohort in one pool. With a
+    # state store, evidence of unchanged reports is reused and only new or
+    # changed reports are parsed.
+    flat = [(sample, task) for (sample, _), tasks in zip(samples, sample_tasks) for task in tasks]
+    if state is None:
+        return run_parse_tasks([task for _, task in flat], jobs)
+
+    parsed = [state.get(sample, tool, args) for sample, (tool, _, args) in flat]
+    stale = [i for i, result in enumerate(parsed) if result is None]
+    for i, result in zip(stale, run_parse_tasks([flat[i][1] for i in stale], jobs)):
+        sample, (tool, _, args) = flat[i]
+        state.put(sample, tool, args, result)
+        parsed[i] = result
+    state.retain([state.key(sample, tool) for sample, (tool, _, _) in flat])
+    state.save()
+    click.echo(f"Summary state: reused {len(flat) - len(stale)} of {len(flat)} parsed reports")
+    return parsed
+
+def summary_column_name(column):
+    # replace .csv, .tsv, .txt with "" in column names
+    return re.sub(r'\.(csv|tsv|txt|mapstat)$', '', column)
+
+def tool_columns(dfs, tools):
+    # Summary column -> tool, for the single call column of each parsed frame
+    return {summary_column_name(df.columns[1]): tool for df, tool in zip(dfs, tools)}
+
+def merge_results(dfs):
     if not dfs:
         raise ValueError("No DataFrames available to merge. Exiting.")
-    else:
-        merged_df = reduce(lambda left, right: pd.merge(left, right, on='Gene', how='outer'), dfs)
-        merged_df.fillna(0, inplace=True)
-        # replace .csv, .tsv, .txt with "" in column names
-        merged_df.columns = merged_df.columns.str.replace(r'\.(csv|tsv|txt)$', '', regex=True)
+    # Index every frame on the sorted union of genes and fill integer 0/1
+    # columns in place, instead of a chain of pairwise outer merges + fillna.
+    # Columns holding ARIBA statuses keep their values, with 0 for the other genes.
+    genes = pd.Index(pd.concat([df["Gene"] for df in dfs], ignore_index=True).unique())
+    if len(dfs) > 1:
+        # Sorted like the outer joins of the original; a single report keeps its own order
+        genes = genes.sort_values()
+    columns = {"Gene": genes}
+    for df in dfs:
+        df = df.drop_duplicates("Gene")
+        rows = genes.get_indexer(df["Gene"])
+        for col in df.columns.drop("Gene"):
+            values = df[col].to_numpy()
+            if values.dtype == object:
+                calls = np.zeros(len(genes), dtype=object)
+                calls[rows] = values
+            else:
+                calls = np.zeros(len(genes), dtype=np.uint8)
+                calls[rows] = values != 0
+            columns[col] = calls
+    merged_df = pd.DataFrame(columns)
+    merged_df.columns = [summary_column_name(col) for col in merged_df.columns]
+    return merged_df
 
-    if metadata:
+def load_metadata(metadata, genes=None, annotation_index=None):
+    # With the compiled index only the annotations of the detected genes are read
+    index = open_index(metadata, annotation_index) if genes is not None else None
+    if index is not None:
+        metadata_df = index.lookup(genes)
+    else:
         metadata_df = pd.read_csv(metadata, sep="\t")  # Assuming metadata is a TSV file
-        metadata_df.drop(columns=['entry_count','shortname','database','entry_count','id'], inplace=True)
-        if 'userGeneName' in metadata_df.columns:
-            metadata_df.rename(columns={'userGeneName': 'Gene'}, inplace=True)
-            merged_df = pd.merge(merged_df, metadata_df, on="Gene", how="inner")
-            merged_df.fillna(0, inplace=True)
-            print(f"Summary: Finalized report {output_file}")
-            merged_df.to_csv(output_file, sep="\t", index=False)
-        else:
-            print("Warning: 'userGeneName' column not found in metadata file.")
+    metadata_df.drop(columns=DROPPED_METADATA_COLUMNS, inplace=True)
+    if 'userGeneName' not in metadata_df.columns:
+        print("Warning: 'userGeneName' column not found in metadata file.")
+        return None
+    metadata_df.rename(columns={'userGeneName': 'Gene'}, inplace=True)
+    return metadata_df
+
+def annotate_results(merged_df, metadata_df):
+    merged_df = pd.merge(merged_df, metadata_df, on="Gene", how="inner")
+    merged_df.fillna(0, inplace=True)
+    return merged_df
+
+def open_crosswalk(crosswalk_file, metadata, annotation_index=None, use_index=True):
+    # Crosswalk gene IDs are rows of the compiled annotation index
+    if not metadata or not use_index:
+        raise click.UsageError("--crosswalk needs --metadata and the annotation index (drop --no_annotation_index).")
+    index = open_index(metadata, annotation_index)
+    if index is None:
+        raise click.ClickException("--crosswalk needs the annotation index; compile it with bin/annotation_index.py compile.")
+    return GeneCrosswalk(crosswalk_file, index)
+
+def resolve_gene_ids(sample, dfs, tools, crosswalk):
+    # Replace the tool gene names of each call frame by crosswalk gene IDs, so
+    # merge_results joins on integers; calls without an ID are returned as unmatched
+    ids = [crosswalk.gene_ids(tool, df["Gene"]) for df, tool in zip(dfs, tools)]
+    unmatched = unmatched_calls(sample, dfs, tools, [gene_ids >= 0 for gene_ids in ids], "not in crosswalk")
+    return [df.assign(Gene=gene_ids)[gene_ids >= 0] for df, gene_ids in zip(dfs, ids)], unmatched
+
+def annotate_gene_ids(merged_df, index):
+    # Gene IDs are index rows: read the annotations of those rows directly
+    # instead of joining on names. IDs sort like the names, so the row order
+    # matches annotate_results.
+    metadata_df = index.rows(merged_df["Gene"].to_numpy(dtype=np.int64))
+    metadata_df = metadata_df.drop(columns=DROPPED_METADATA_COLUMNS).rename(columns={'userGeneName': 'Gene'})
+    merged_df = pd.concat([metadata_df[["Gene"]], merged_df.drop(columns="Gene").reset_index(drop=True), metadata_df.drop(columns="Gene")], axis=1)
+    merged_df.fillna(0, inplace=True)
+    return merged_df
+
+def unmatched_calls(sample, dfs, tools, matched, reason):
+    # Calls of one sample whose gene identifier did not match; one mask per call frame
+    frames = [pd.DataFrame({"sample": sample, "tool": tool, "identifier": df.loc[~np.asarray(mask), "Gene"].to_numpy(), "reason": reason})
+              for df, tool, mask in zip(dfs, tools, matched)]
+    return pd.concat(frames, ignore_index=True).drop_duplicates() if frames else pd.DataFrame(columns=UNMATCHED_COLUMNS)
+
+def report_unmatched(frames, unmatched_file=None):
+    # Hits lost in the metadata join are listed instead of disappearing silently
+    unmatched_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=UNMATCHED_COLUMNS)
+    if unmatched_file:
+        unmatched_df.to_csv(unmatched_file, sep="\t", index=False)
+    if len(unmatched_df):
+        where = f"; see {unmatched_file}" if unmatched_file else "; list them with --unmatched_file"
+        print(f"Warning: {len(unmatched_df)} calls of {unmatched_df['identifier'].nunique()} gene identifiers matched no panARG gene{where}.")
+
+def to_long_format(summary_df, sample_columns):
+    # One row per (gene, sample, tool) with a uint8 call; the column layout no
+    # longer depends on report file names, so per-sample files form one dataset
+    called = {col for columns in sample_columns.values() for col in columns}
+    annotation_columns = [col for col in summary_df.columns if col != "Gene" and col not in called]
+    frames = []
+    for sample, columns in sample_columns.items():
+        long_df = summary_df.melt(id_vars=["Gene"] + annotation_columns, value_vars=list(columns), var_name="tool", value_name="detected")
+        long_df["tool"] = long_df["tool"].map(columns)
+        long_df.insert(1, "sample", sample)
+        frames.append(long_df)
+    long_df = pd.concat(frames, ignore_index=True)[["Gene", "sample", "tool", "detected"] + annotation_columns]
+
+    # ARIBA statuses other than yes (e.g. yes_nonunique) count as detected
+    long_df["detected"] = (long_df["detected"] != 0).astype(np.uint8)
+    for col in ["sample", "tool"] + [col for col in annotation_columns if long_df[col].dtype == object]:
+        long_df[col] = long_df[col].astype(str).astype("category")
+    return long_df
+
+def output_path(output_file, output_format):
+    if output_format == "tsv":
+        return output_file
+    return os.path.splitext(output_file)[0] + COLUMNAR_EXTENSIONS[output_format]
+
+def write_table(df, output_file, output_format):
+    # TSV, or a typed parquet/arrow table; categoricals are written as
+    # dictionary-encoded columns
+    output_file = output_path(output_file, output_format)
+    if output_format == "tsv":
+        df.to_csv(output_file, sep="\t", index=False)
+        return output_file
+
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise click.ClickException(f"--output_format {output_format} requires the pyarrow package")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if output_format == "parquet":
+        pq.write_table(table, output_file)
     else:
-        # Writer reference to a file
-        merged_df.to_csv(output_file, sep="\t", index=False)
-        print(f"Summary: Finalized report {output_file}")
+        feather.write_feather(table, output_file)
+    return output_file
+
+def write_summary(summary_df, output_file, output_format, sample_columns):
+    if output_format != "tsv":
+        summary_df = to_long_format(summary_df, sample_columns)
+    return write_table(summary_df, output_file, output_format)
+
+def write_evidence(evidence_df, evidence_file, output_format):
+    evidence_df = evidence_df.copy()
+    for col in ["sample", "tool"]:
+        evidence_df[col] = evidence_df[col].astype(str).astype("category")
+    evidence_file = write_table(evidence_df, evidence_file, output_format)
+    print(f"Summary: Finalized evidence table {evidence_file}")
+
+def load_results(results_dir, output_format="parquet", exclude=("summary_matrix", "summary_evidence", "summary_unmatched")):
+    """Read every columnar summary_<sample> file in results_dir as one DataFrame, via a pyarrow dataset.
+
+    Evidence tables, the cohort matrix and the unmatched calls share the directory and are skipped.
+    """
+    import pyarrow.dataset as ds
+    extension = COLUMNAR_EXTENSIONS[output_format]
+    files = sorted(
+        os.path.join(results_dir, name) for name in os.listdir(results_dir)
+        if name.startswith("summary_") and name.endswith(extension) and name[:-len(extension)] not in exclude
+    )
+    dataset = ds.dataset(files, format="parquet" if output_format == "parquet" else "ipc")
+    return dataset.to_table().to_pandas()
+
+def read_manifest(manifest):
+    # One row per sample: sample name followed by the per-tool report paths.
+    # Relative paths are resolved against the manifest location.
+    manifest_df = pd.read_csv(manifest, sep="\t", header=0, dtype=str, keep_default_na=False)
+    missing = [col for col in MANIFEST_COLUMNS if col not in manifest_df.columns]
+    if missing:
+        raise click.ClickException(f"Manifest {manifest} is missing columns: {', '.join(missing)}")
+    if manifest_df["sample"].duplicated().any():
+        raise click.ClickException(f"Manifest {manifest} lists the same sample more than once")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    columns = MANIFEST_COLUMNS + [col for col in OPTIONAL_MANIFEST_COLUMNS if col in manifest_df.columns]
+    samples = []
+    for row in manifest_df[columns].itertuples(index=False):
+        reports = {}
+        for option, path in zip(columns[1:], row[1:]):
+            path = path.strip()
+            if path:
+                reports[option] = path if os.path.isabs(path) else os.path.join(base_dir, path)
+        samples.append((row.sample, reports))
+    return samples
+
+def summarize_cohort(manifest, metadata, output_dir, matrix_file, jobs=1, annotation_index=None, use_index=True, output_format="tsv", state=None, thresholds=DEFAULT_THRESHOLDS, evidence_file=None, crosswalk=None, unmatched_file=None, kma_refdata=None, mapstat_filters=None):
+    samples = read_manifest(manifest)
+    if not samples:
+        raise ValueError(f"No samples listed in {manifest}. Exiting.")
+    if not kma_refdata and any(reports.get("kma_mapstat") for _, reports in samples):
+        raise click.UsageError(f"{manifest} lists raw KMA mapstat files; pass their reference lengths with --kma_refdata.")
+
+    # Parse every (sample, tool) report in one pool, then regroup by sample
+    sample_tasks = [sample_parse_tasks(**reports, kma_refdata=kma_refdata, mapstat_filters=mapstat_filters, thresholds=thresholds) for _, reports in samples]
+    parsed = run_cohort_tasks(samples, sample_tasks, jobs, state)
+
+    sample_columns = {}
+    sample_frames = []
+    evidence = []
+    unmatched = []
+    # Call frames kept for the unmatched report of the name join
+    named_calls = []
+    offset = 0
+    with stage("merge", samples=len(samples)) as record:
+        for (sample, _), tasks in zip(samples, sample_tasks):
+            results = parsed[offset:offset + len(tasks)]
+            offset += len(tasks)
+            tools = [tool for tool, _, _ in tasks]
+            dfs = sample_calls(results, tools, thresholds)
+            sample_columns[sample] = tool_columns(dfs, tools)
+            if crosswalk:
+                dfs, sample_unmatched = resolve_gene_ids(sample, dfs, tools, crosswalk)
+                unmatched.append(sample_unmatched)
+            elif metadata:
+                named_calls.append((sample, dfs, tools))
+            sample_frames.append(merge_results(dfs))
+            if evidence_file:
+                evidence.append(evidence_table(sample, results, tools, thresholds))
+
+        # Gene x (sample, tool) matrix, annotated with the metadata in a single join
+        matrix_df = merge_results(sample_frames)
+        record["rows"] = len(matrix_df)
+    os.makedirs(output_dir, exist_ok=True)
+    if crosswalk:
+        with stage("metadata"):
+            matrix_df = annotate_gene_ids(matrix_df, crosswalk.index)
+    elif metadata:
+        with stage("metadata"):
+            metadata_df = load_metadata(metadata, matrix_df["Gene"] if use_index else None, annotation_index)
+            if metadata_df is not None:
+                matrix_df = annotate_results(matrix_df, metadata_df)
+                for sample, dfs, tools in named_calls:
+                    matched = [df["Gene"].isin(metadata_df["Gene"]).to_numpy() for df in dfs]
+                    unmatched.append(unmatched_calls(sample, dfs, tools, matched, "not in metadata"))
+    report_unmatched(unmatched, unmatched_file and os.path.join(output_dir, unmatched_file))
+    with stage("write", samples=len(samples)):
+        matrix_file = write_summary(matrix_df, os.path.join(output_dir, matrix_file), output_format, sample_columns)
+        print(f"Summary: Finalized cohort matrix {matrix_file}")
+
+        called = {col for columns in sample_columns.values() for col in columns}
+        annotation_columns = [col for col in matrix_df.columns if col != "Gene" and col not in called]
+        for sample, columns in sample_columns.items():
+            detected = (matrix_df[list(columns)] != 0).any(axis=1)
+            sample_df = matrix_df.loc[detected, ["Gene"] + list(columns) + annotation_columns]
+            output_file = os.path.join(output_dir, f"summary_{sample}.tsv")
+            output_file = write_summary(sample_df, output_file, output_format, {sample: columns})
+            print(f"Summary: Finalized report {output_file}")
+
+        if evidence_file:
+            write_evidence(pd.concat(evidence, ignore_index=True), os.path.join(output_dir, evidence_file), output_format)
+
+@click.command()
+#@click.argument('abricate_result', type=click.Path(exists=True))
+@click.option('--groot_results', type=click.Path(exists=True), required=False, help='Path to groot output file')
+@click.option('--ariba_results', type=click.Path(exists=True), required=False, help='Path to ARIBA output TSV/CSV files')
+@click.option('--ariba_summary', type=click.Path(exists=True), required=False, help='Path to ARIBA summary CSV file')
+@click.option('--karga_results', type=click.Path(exists=True), required=False, help='Path to KARGA output TSV/CSV files')
+@click.option('--srst2_results', type=click.Path(exists=True), required=False, help='Path to SRST2 output TXT files')
+@click.option('--argprofiler_results', type=click.Path(exists=True), required=False, help='Path to ARGprofiler output TXT files')
+@click.option('--kma_mapstat', type=click.Path(exists=True), required=False, help='Raw KMA .mapstat, filtered here as bin/mapstatFilters.R does (instead of --argprofiler_results)')
+@click.option('--kma_refdata', type=click.Path(exists=True), required=False, help='Reference names and lengths for --kma_mapstat (ARGprofiler gene_length.tsv)')
+@click.option('--mapstat_depth', type=float, default=MAPSTAT_FILTERS['depth'], show_default=True, help='Raw mapstat filter: minimum meanDepthCovered (mapstatFilters.R -d)')
+@click.option('--mapstat_min_coverage', type=float, default=MAPSTAT_FILTERS['min_coverage'], show_default=True, help='Raw mapstat filter: minimum propCovered')
+@click.option('--mapstat_min_identity', type=float, default=MAPSTAT_FILTERS['min_read_identity'], show_default=True, help='Raw mapstat filter: minimum readRefIdentity and readConsensRefIdentity')
+@click.option('--mapstat_max_spurious', type=float, default=MAPSTAT_FILTERS['max_spurious'], show_default=True, help='Raw mapstat filter: maximum spuriosCovRatio')
+@click.option('--metadata', type=click.Path(exists=True), required=False, help='Path to metadata file (panARG_annotation.tsv)')
+@click.option('--output_file', required=False, help='Name of the output file to write the combined results')
+@click.option('--manifest', type=click.Path(exists=True), required=False, help='TSV manifest (sample + per-tool report paths) to summarise a whole cohort in one run')
+@click.option('--output_dir', default='.', show_default=True, help='Directory for the per-sample reports written in manifest mode')
+@click.option('--matrix_file', default='summary_matrix.tsv', show_default=True, help='Gene x (sample, tool) matrix written in manifest mode (in --output_dir unless absolute)')
+@click.option('--jobs', type=click.IntRange(min=1), default=1, show_default=True, help='Number of worker processes used to parse the tool reports')
+@click.option('--annotation_index', type=click.Path(), required=False, help='Compiled metadata index, rebuilt when the metadata changes (default: <metadata>.idx)')
+@click.option('--no_annotation_index', is_flag=True, help='Read the metadata TSV directly instead of the compiled index')
+@click.option('--output_format', type=click.Choice(['tsv', 'parquet', 'arrow']), default='tsv', show_default=True, help='Summary format; parquet/arrow write typed long-format tables (requires pyarrow)')
+@click.option('--sample_name', required=False, help='Sample name stored in parquet/arrow output (default: derived from --output_file)')
+@click.option('--state_dir', type=click.Path(), required=False, help='State store of parsed reports; in manifest mode only new or changed reports are parsed')
+@click.option('--rebuild', is_flag=True, help='Ignore the state store and re-parse every report')
+@click.option('--thresholds', 'thresholds_file', type=click.Path(exists=True), required=False, help='JSON {tool: {metric: minimum}} detection thresholds; metrics are coverage, depth, identity and reads (default: KARGA coverage >= 80)')
+@click.option('--evidence_file', required=False, help='Also write per-(gene, sample, tool) coverage/depth/identity/reads with the detection call (written in --output_dir in manifest mode)')
+@click.option('--crosswalk', 'crosswalk_file', type=click.Path(exists=True), required=False, help='Gene crosswalk (bin/gene_crosswalk.py build): map each tool\'s gene names to panARG gene IDs and join on those')
+@click.option('--unmatched_file', required=False, help='Also write the calls whose gene identifier matched no panARG gene (TSV; written in --output_dir in manifest mode)')
+
+@instrumented("summarize_results")
+def summary_report(groot_results, ariba_results, ariba_summary, karga_results, srst2_results, argprofiler_results, kma_mapstat, kma_refdata, mapstat_depth, mapstat_min_coverage, mapstat_min_identity, mapstat_max_spurious, metadata, output_file, manifest, output_dir, matrix_file, jobs, annotation_index, no_annotation_index, output_format, sample_name, state_dir, rebuild, thresholds_file, evidence_file, crosswalk_file, unmatched_file):   
+    thresholds = load_thresholds(thresholds_file)
+    crosswalk = open_crosswalk(crosswalk_file, metadata, annotation_index, not no_annotation_index) if crosswalk_file else None
+    mapstat_filters = {"min_coverage": mapstat_min_coverage, "min_read_identity": mapstat_min_identity, "min_consensus_identity": mapstat_min_identity,
+                       "max_spurious": mapstat_max_spurious, "depth": mapstat_depth}
+    if manifest:
+        state = SummaryState(state_dir, rebuild) if state_dir else None
+        summarize_cohort(manifest, metadata, output_dir, matrix_file, jobs, annotation_index, not no_annotation_index, output_format, state, thresholds, evidence_file, crosswalk, unmatched_file, kma_refdata, mapstat_filters)
+        return
+
+    if not output_file:
+        raise click.UsageError("--output_file is required unless --manifest is given.")
+    if not sample_name:
+        sample_name = re.sub(r'^summary_', '', os.path.splitext(os.path.basename(output_file))[0])
+    if kma_mapstat and argprofiler_results:
+        raise click.UsageError("Pass either --argprofiler_results or --kma_mapstat, not both.")
+    if kma_mapstat and not kma_refdata:
+        raise click.UsageError("--kma_mapstat needs the reference lengths in --kma_refdata.")
+
+    parsed, tools = parse_sample_reports(groot_results, ariba_results, ariba_summary, karga_results, srst2_results, argprofiler_results, jobs, kma_mapstat, kma_refdata, mapstat_filters, thresholds)
+    if evidence_file:
+        with stage("write", output="evidence"):
+            write_evidence(evidence_table(sample_name, parsed, tools, thresholds), evidence_file, output_format)
+    with stage("merge", sample=sample_name) as record:
+        dfs = sample_calls(parsed, tools, thresholds)
+        sample_columns = {sample_name: tool_columns(dfs, tools)}
+        if crosswalk:
+            dfs, unmatched = resolve_gene_ids(sample_name, dfs, tools, crosswalk)
+        merged_df = merge_results(dfs)
+        record["rows"] = len(merged_df)
+
+    if metadata:
+        with stage("metadata", sample=sample_name):
+            if crosswalk:
+                merged_df = annotate_gene_ids(merged_df, crosswalk.index)
+            else:
+                metadata_df = load_metadata(metadata, None if no_annotation_index else merged_df["Gene"], annotation_index)
+                if metadata_df is None:
+                    return
+                merged_df = annotate_results(merged_df, metadata_df)
+                matched = [df["Gene"].isin(metadata_df["Gene"]).to_numpy() for df in dfs]
+                unmatched = unmatched_calls(sample_name, dfs, tools, matched, "not in metadata")
+        report_unmatched([unmatched], unmatched_file)
+    # Writer reference to a file
+    with stage("write", sample=sample_name):
+        output_file = write_summary(merged_df, output_file, output_format, sample_columns)
+    print(f"Summary: Finalized report {output_file}")
 
         
 if __name__ == '__main__':
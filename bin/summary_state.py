@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""On-disk store of parsed tool reports for incremental cohort summaries.
+
+Each (sample, tool) entry records the size, mtime and sha256 of its report
+files and the reader settings, and points at the pickled reader result (report
+column and evidence). A report is parsed again only when one of its files or
+settings changed.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from annotation_index import file_checksum
+
+# Bump when the parsers change what they return, to invalidate old entries
+STATE_VERSION = 3
+
+
+def file_stamp(path):
+    if isinstance(path, dict):
+        # Reader settings (e.g. the mapstat filters) are compared as they are
+        return {"settings": path}
+    if not path or not os.path.exists(path):
+        return None
+    # Resolve symlinks so reports staged into a new work directory keep their identity
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class SummaryState:
+    def __init__(self, state_dir, rebuild=False):
+        self.state_dir = state_dir
+        self.frames_dir = os.path.join(state_dir, "frames")
+        self.index_file = os.path.join(state_dir, "state.json")
+        os.makedirs(self.frames_dir, exist_ok=True)
+        self.entries = {}
+        if not rebuild:
+            try:
+                with open(self.index_file) as handle:
+                    state = json.load(handle)
+                if state.get("version") == STATE_VERSION:
+                    self.entries = state["entries"]
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def key(sample, tool):
+        return f"{sample}\t{tool}"
+
+    def _is_current(self, entry, paths):
+        if len(entry["files"]) != len(paths):
+            return False
+        for stored, path in zip(entry["files"], paths):
+            stamp = file_stamp(path)
+            if stored is None or stamp is None or "settings" in stamp:
+                if stored != stamp:
+                    return False
+                continue
+            if stamp["size"] != stored["size"]:
+                return False
+            if stamp["path"] != stored["path"] or stamp["mtime_ns"] != stored["mtime_ns"]:
+                # Moved, touched or re-copied: only a content change invalidates the entry
+                if file_checksum(path) != stored["sha256"]:
+                    return False
+                stored.update(stamp)
+        return True
+
+    def get(self, sample, tool, paths):
+        """The stored result for (sample, tool) if its report files are unchanged, else None."""
+        entry = self.entries.get(self.key(sample, tool))
+        if entry is None or not self._is_current(entry, paths):
+            return None
+        try:
+            return pd.read_pickle(os.path.join(self.frames_dir, entry["frame"]))
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # Truncated or corrupt, or pickled by an incompatible pandas: parse again
+            return None
+
+    def put(self, sample, tool, paths, result):
+        files = []
+        for path in paths:
+            stamp = file_stamp(path)
+            if stamp is not None and "settings" not in stamp:
+                stamp["sha256"] = file_checksum(path)
+            files.append(stamp)
+        key = self.key(sample, tool)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pkl"
+        pd.to_pickle(result, os.path.join(self.frames_dir, name))
+        self.entries[key] = {"sample": sample, "tool": tool, "files": files, "frame": name}
+
+    def retain(self, keys):
+        """Drop entries (and their frames) for samples/tools that are no longer summarised."""
+        for key in set(self.entries) - set(keys):
+            entry = self.entries.pop(key)
+            try:
+                os.remove(os.path.join(self.frames_dir, entry["frame"]))
+            except OSError:
+                pass
+
+    def save(self):
+        handle, path = tempfile.mkstemp(prefix=".state.", dir=self.state_dir)
+        with os.fdopen(handle, "w") as out:
+            json.dump({"version": STATE_VERSION, "entries": self.entries}, out, indent=1)
+        os.replace(path, self.index_file)
@@ -2,9 +2,10 @@
 
 ariba="singularity exec /qib/research-groups/CoreBioInfo/projects/arg-snipper/singulariy-images/ariba_2.14.6--py39heaaa4ec_6.img ariba"
 db="/qib/research-groups/CoreBioInfo/projects/arg-snipper/databases"
-Heatmap="/qib/research-groups/CoreBioInfo/projects/arg-snipper/databases/scripts/gene_overlap_heatmap_plot.py"
 GeneAssimilatoR="singularity exec /qib/research-groups/CoreBioInfo/projects/arg-snipper/singulariy-images/gene_assimilator.img GeneAssimilatoR.R"
 scripts="/qib/research-groups/CoreBioInfo/projects/arg-snipper/databases/scripts"
+AnnotationIndex="/qib/research-groups/CoreBioInfo/projects/arg-snipper/ARG-Sniper/bin/annotation_index.py"
+GeneCrosswalk="/qib/research-groups/CoreBioInfo/projects/arg-snipper/ARG-Sniper/bin/gene_crosswalk.py"
 # Define the directory path
 database_dir="panARG/sequences"
 
@@ -63,16 +64,35 @@ echo "Preparing panARG database"
 $GeneAssimilatoR -d $db/$database_dir -o $db/panARG -p panARG
 echo "Database: $db/panARG Done !!!"
 
-# Plot overlapping genes across databases
-echo "Preparing panARG summary plot"
-python3 $Heatmap -i $db/panARG/overview/panARG_master_gene_tbl.tsv -o $db/panARG/overview/plots
-echo "Heatmap: $db/panARG/overview/plots"
-
-# Create a metadata file for the AMR Genes
-echo "Preparing panARG annotations"
+# Create a metadata file for the AMR Genes, with the overlap matrices and plots of genes across databases
+# (gene_overlap_heatmap_plot.py, run in-process on the same gene table; both need stage_metrics.py next to them).
+# With bin/ on PYTHONPATH their stages are recorded when ARG_SNIPER_METRICS is set
+echo "Preparing panARG annotations and summary plot"
+export PYTHONPATH="$(dirname "$AnnotationIndex")${PYTHONPATH:+:$PYTHONPATH}"
 python3 $scripts/get_args.py $db/panARG/overview/panARG_master_gene_tbl.tsv \
     --amrfinderplus $db/AMRfinderPlus_db/ReferenceGeneCatalog_filtered.txt \
     --card $db/card_db/aro_index.tsv \
     --megares $db/megares_db/megares_annotations_v3.00.csv \
     --resfinder $db/resfinder_db/notes.txt \
-    --summary $db/panARG/overview/panARG_annotations.tsv
\ No newline at end of file
+    --summary $db/panARG/overview/panARG_annotations.tsv \
+    --overlap-dir $db/panARG/overview/plots --overlap-plots
+echo "Heatmap: $db/panARG/overview/plots"
+
+# Compile the annotations into the binary index read by bin/summarize_results.py
+echo "Compiling panARG annotation index"
+python3 $AnnotationIndex compile $db/panARG/overview/panARG_annotations.tsv
+echo "Index: $db/panARG/overview/panARG_annotations.tsv.idx"
+
+# Map the gene names of every tool database to the panARG genes (summarize_results.py --crosswalk)
+echo "Building panARG gene crosswalk"
+python3 $GeneCrosswalk build --metadata $db/panARG/overview/panARG_annotations.tsv \
+    --master_table $db/panARG/overview/panARG_master_gene_tbl.tsv \
+    $(for fasta in $db/panARG/*.fasta $db/panARG/*.fa; do [ -f "$fasta" ] && echo "--panarg_fasta $fasta"; done) \
+    --fasta groot=$db/panarg_2_groot/sequence.fa \
+    --fasta ariba=$db/panarg_2_ariba/prepare/02.cdhit.all.fa \
+    --fasta karga=$db/panarg_2_karga/sequence.fa \
+    --fasta srst2=$db/panarg_2_srst2/sequence.fa \
+    --fasta argprofiler=$db/panarg_2_argprofiler/sequence.fa \
+    --output $db/panARG/overview/panARG_crosswalk.tsv \
+    --unresolved_file $db/panARG/overview/panARG_crosswalk_unresolved.tsv
+echo "Crosswalk: $db/panARG/overview/panARG_crosswalk.tsv"
@@ -1,34 +1,203 @@
 #!/usr/bin/env python3
 
+import gzip
+import io
+import re
+import struct
+from contextlib import ExitStack
+
 import click
 
-def filter_fasta(input_file, output_file):
-    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
-        write_sequence = True
-        for line in infile:
-            if line.startswith('>'):
-                if 'RequiresSNPConfirmation' in line:
-                    write_sequence = False
-                else:
-                    write_sequence = True
-                    outfile.write(line)
-            elif write_sequence:
+GZIP_MAGIC = b'\x1f\x8b'
+START_CODONS = (b'ATG', b'GTG', b'TTG')
+STOP_CODONS = (b'TAA', b'TAG', b'TGA')
+BUFFER_SIZE = 1 << 20
+
+def open_fasta(path, mode='rb', bgzip=False):
+    """
+    Open a FASTA file as a buffered binary stream. Input compression is detected
+    from the gzip magic bytes (bgzip files are gzip files); output is gzipped
+    when the name ends in .gz/.bgz, and BGZF-compressed with bgzip=True.
+    """
+    if 'r' in mode:
+        with open(path, 'rb') as handle:
+            compressed = handle.read(2) == GZIP_MAGIC
+        if compressed:
+            return io.BufferedReader(gzip.open(path, 'rb'), buffer_size=BUFFER_SIZE)
+        return open(path, 'rb', buffering=BUFFER_SIZE)
+    if bgzip:
+        try:
+            from Bio import bgzf
+        except ImportError:
+            raise click.ClickException("--bgzip output requires Biopython (Bio.bgzf)")
+        return bgzf.BgzfWriter(path, 'wb')
+    if path.endswith(('.gz', '.bgz')):
+        return io.BufferedWriter(gzip.open(path, 'wb', compresslevel=6), buffer_size=BUFFER_SIZE)
+    return open(path, 'wb', buffering=BUFFER_SIZE)
+
+def read_ids(path):
+    # One sequence ID per line (the first word of the FASTA header, without '>')
+    with open(path) as handle:
+        return {line.split()[0] for line in handle if line.strip()}
+
+def fasta_records(infile):
+    """
+    Yield (header, sequence lines) per record; lines keep their line endings.
+    Lines before the first header are yielded with a header of None.
+    """
+    header = None
+    lines = []
+    for line in infile:
+        if line.startswith(b'>'):
+            if header is not None or lines:
+                yield header, lines
+            header = line
+            lines = []
+        else:
+            lines.append(line)
+    if header is not None or lines:
+        yield header, lines
+
+def build_predicates(include_headers=(), exclude_headers=('RequiresSNPConfirmation',), include_ids=None, exclude_ids=None,
+                     min_length=None, max_length=None, require_start=False, require_stop=False):
+    """
+    Turn the filter options into a list of (reason, test) pairs; a record is kept
+    when every test returns True for (record ID, header text, sequence).
+    """
+    predicates = []
+    if include_headers:
+        include = re.compile('|'.join(f'(?:{pattern})' for pattern in include_headers))
+        predicates.append(('include_header', lambda name, header, seq: include.search(header) is not None))
+    if exclude_headers:
+        exclude = re.compile('|'.join(f'(?:{pattern})' for pattern in exclude_headers))
+        predicates.append(('exclude_header', lambda name, header, seq: exclude.search(header) is None))
+    if include_ids is not None:
+        predicates.append(('include_ids', lambda name, header, seq: name in include_ids))
+    if exclude_ids is not None:
+        predicates.append(('exclude_ids', lambda name, header, seq: name not in exclude_ids))
+    if min_length is not None:
+        predicates.append(('min_length', lambda name, header, seq: len(seq) >= min_length))
+    if max_length is not None:
+        predicates.append(('max_length', lambda name, header, seq: len(seq) <= max_length))
+    if require_start:
+        predicates.append(('start_codon', lambda name, header, seq: seq[:3].upper() in START_CODONS))
+    if require_stop:
+        predicates.append(('stop_codon', lambda name, header, seq: seq[-3:].upper() in STOP_CODONS))
+    return predicates
+
+def write_gzi(bgzf_path, gzi_path):
+    # BGZF block index (as written by bgzip -i): block count, then the
+    # (compressed, uncompressed) start offsets of every block after the first
+    from Bio import bgzf
+    entries = []
+    uncompressed = 0
+    with open(bgzf_path, 'rb') as handle:
+        for start, _, _, data_length in bgzf.BgzfBlocks(handle):
+            if start:
+                entries.append((start, uncompressed))
+            uncompressed += data_length
+    with open(gzi_path, 'wb') as handle:
+        handle.write(struct.pack('<Q', len(entries)))
+        for entry in entries:
+            handle.write(struct.pack('<QQ', *entry))
+
+def filter_fasta(input_file, output_file, predicates=None, index_file=None, bgzip=False):
+    """
+    Stream input_file to output_file, keeping the records that pass every predicate
+    (by default: headers without 'RequiresSNPConfirmation'). With index_file, a
+    samtools-style .fai of the kept records is written (offsets are uncompressed
+    byte offsets; bgzip output also gets a .gzi). Returns {reason: dropped count}
+    with the number of kept records under 'kept'.
+    """
+    if index_file and not bgzip and output_file.endswith(('.gz', '.bgz')):
+        # Plain gzip cannot be seeked, so the offsets of the index would be useless
+        raise click.UsageError(f"An index of {output_file} needs --bgzip (BGZF) or uncompressed output")
+    if predicates is None:
+        predicates = build_predicates()
+    needs_sequence = any(reason in ('min_length', 'max_length', 'start_codon', 'stop_codon') for reason, _ in predicates)
+    stats = {'kept': 0, **{reason: 0 for reason, _ in predicates}}
+    irregular = []
+    offset = 0
+
+    with ExitStack() as stack:
+        infile = stack.enter_context(open_fasta(input_file))
+        outfile = stack.enter_context(open_fasta(output_file, 'wb', bgzip))
+        index = stack.enter_context(open(index_file, 'w')) if index_file else None
+        for header, lines in fasta_records(infile):
+            if header is None:
+                # Text before the first record is copied unchanged
+                outfile.write(b''.join(lines))
+                offset += sum(len(line) for line in lines)
+                continue
+
+            text = header[1:].decode('utf-8', 'replace').rstrip('\r\n')
+            name = text.split(maxsplit=1)[0] if text.strip() else ''
+            seq = b''.join(line.rstrip(b'\r\n') for line in lines) if needs_sequence or index else b''
+            failed = next((reason for reason, test in predicates if not test(name, text, seq)), None)
+            if failed:
+                stats[failed] += 1
+                continue
+
+            outfile.write(header)
+            offset += len(header)
+            if index:
+                # name, length, offset of the first base, bases per line, bytes per line
+                widths = [len(line.rstrip(b'\r\n')) for line in lines]
+                line_bases = widths[0] if widths else 0
+                line_width = len(lines[0]) if lines else 0
+                if any(width != line_bases for width in widths[:-1]) or (len(widths) > 1 and widths[-1] > line_bases):
+                    irregular.append(name)
+                index.write(f"{name}\t{len(seq)}\t{offset}\t{line_bases}\t{line_width}\n")
+            for line in lines:
                 outfile.write(line)
+            offset += sum(len(line) for line in lines)
+            stats['kept'] += 1
+
+    if index_file:
+        if irregular:
+            click.echo(f"Warning: {len(irregular)} records have irregular line lengths and cannot be seeked through {index_file} (e.g. {irregular[0]})", err=True)
+        if bgzip:
+            write_gzi(output_file, re.sub(r'\.fai$', '', index_file) + '.gzi')
+    return stats
 
 @click.command()
 @click.argument('input_file', type=click.Path(exists=True))
 @click.argument('output_file', type=click.Path())
+@click.option('--include-header', multiple=True, help='Keep only records whose header matches one of these regexes (repeatable)')
+@click.option('--exclude-header', multiple=True, default=['RequiresSNPConfirmation'], show_default=True, help='Drop records whose header matches one of these regexes (repeatable; replaces the default)')
+@click.option('--include-ids', type=click.Path(exists=True), help='File of sequence IDs to keep, one per line')
+@click.option('--exclude-ids', type=click.Path(exists=True), help='File of sequence IDs to drop, one per line')
+@click.option('--min-length', type=int, help='Minimum sequence length')
+@click.option('--max-length', type=int, help='Maximum sequence length')
+@click.option('--require-start', is_flag=True, help='Keep only sequences starting with a start codon (ATG, GTG, TTG)')
+@click.option('--require-stop', is_flag=True, help='Keep only sequences ending with a stop codon (TAA, TAG, TGA)')
+@click.option('--index', 'index_file', type=click.Path(), help='Write a .fai index of the kept records (default with --fai: OUTPUT_FILE.fai)')
+@click.option('--fai', is_flag=True, help='Write OUTPUT_FILE.fai (uncompressed or --bgzip output only)')
+@click.option('--bgzip', is_flag=True, help='Write BGZF-compressed output (requires Biopython); with an index, also OUTPUT_FILE.gzi')
 @click.option('--verbose', '-v', is_flag=True, help='Print verbose output')
-def main(input_file, output_file, verbose):
+def main(input_file, output_file, include_header, exclude_header, include_ids, exclude_ids, min_length, max_length,
+         require_start, require_stop, index_file, fai, bgzip, verbose):
     """
     Filter FASTA sequences, discarding those with 'RequiresSNPConfirmation' in the header.
+    Plain, gzip and bgzip input is read directly; all filters are applied in one pass.
 
     INPUT_FILE: Path to the input FASTA file \n
-    OUTPUT_FILE: Path to the output FASTA file
+    OUTPUT_FILE: Path to the output FASTA file (.gz for gzip output)
     """
-    filter_fasta(input_file, output_file)
+    predicates = build_predicates(
+        include_header, exclude_header,
+        read_ids(include_ids) if include_ids else None,
+        read_ids(exclude_ids) if exclude_ids else None,
+        min_length, max_length, require_start, require_stop,
+    )
+    if fai and not index_file:
+        index_file = f"{output_file}.fai"
+    stats = filter_fasta(input_file, output_file, predicates, index_file, bgzip)
     if verbose:
-        click.echo(f"Filtered sequences have been written to {output_file}")
+        dropped = ", ".join(f"{reason}: {count}" for reason, count in stats.items() if reason != 'kept')
+        click.echo(f"Filtered sequences have been written to {output_file} ({stats['kept']} kept; dropped by {dropped or 'none'})")
+        if index_file:
+            click.echo(f"Index: {index_file}")
 
 if __name__ == "__main__":
     main()
@@ -3,98 +3,132 @@
 import click
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 from pathlib import Path
 from typing import Dict, Set, List, Tuple
 
+from stage_metrics import instrumented, stage
+
+REQUIRED_COLUMNS = ['userGeneName', 'database']
+
 class DatabaseAnalyzer:
-    def __init__(self, input_file: str):
-        """Initialize the analyzer with input file path."""
+    def __init__(self, input_file: str = None, data: pd.DataFrame = None):
+        """Initialize the analyzer with an input file path or an in-memory gene table."""
         self.input_file = input_file
         self.data = None
-        self.gene_sets = {}
+        self.genes = None
         self.databases = []
+        self.membership = None
+        self.db_sizes = None
+        self.patterns = None
+        self.pattern_counts = None
+        if data is not None:
+            self.set_data(data)
         
     def read_data(self) -> None:
         """Read and validate input data."""
         try:
             # Read the file with flexible whitespace delimiter
-            self.data = pd.read_csv(self.input_file, sep="\t")
-            required_columns = ['userGeneName', 'database']
-            
-            # Validate required columns exist
-            if not all(col in self.data.columns for col in required_columns):
-                raise ValueError(f"Input file must contain columns: {required_columns}")
-                
+            self.set_data(pd.read_csv(self.input_file, sep="\t", usecols=lambda col: col in REQUIRED_COLUMNS))
+
+        except click.ClickException:
+            raise
         except Exception as e:
             raise click.ClickException(f"Error reading input file: {str(e)}")
+
+    def set_data(self, data: pd.DataFrame) -> None:
+        """Validate and use an in-memory gene table (e.g. the one get_args.py already read)."""
+        # Validate required columns exist
+        if not all(col in data.columns for col in REQUIRED_COLUMNS):
+            raise click.ClickException(f"Input data must contain columns: {REQUIRED_COLUMNS}")
+        self.data = data[REQUIRED_COLUMNS]
             
     def process_data(self) -> None:
-        """Process data into gene sets for each database."""
+        """Process data into a gene x database membership matrix."""
         try:
-            # Group genes by database
-            for db, group in self.data.groupby('database'):
-                self.gene_sets[db] = set(group['userGeneName'])
-            self.databases = sorted(self.gene_sets.keys())
-            
+            data = self.data[['userGeneName', 'database']].dropna().drop_duplicates()
+            gene_ids, self.genes = pd.factorize(data['userGeneName'])
+            db_ids, databases = pd.factorize(data['database'], sort=True)
+            self.databases = list(databases)
+
+            # Boolean membership M[gene, database]
+            self.membership = np.zeros((len(self.genes), len(self.databases)), dtype=bool)
+            self.membership[gene_ids, db_ids] = True
+            self.db_sizes = pd.Series(self.membership.sum(axis=0), index=self.databases)
+
+            # Each gene's database combination as a packed bitset; genes sharing a
+            # combination collapse to one pattern row with a count
+            bitsets = np.packbits(self.membership, axis=1)
+            _, first, self.pattern_counts = np.unique(bitsets, axis=0, return_index=True, return_counts=True)
+            self.patterns = self.membership[first]
+
         except Exception as e:
             raise click.ClickException(f"Error processing data: {str(e)}")
-            
+
     def generate_matrix(self) -> pd.DataFrame:
         """Generate the sharing matrix."""
         try:
-            # Create empty matrix
-            n_dbs = len(self.databases)
-            matrix = pd.DataFrame(
-                np.zeros((n_dbs, n_dbs), dtype=int),
-                index=self.databases,
-                columns=self.databases
-            )
-            
-            # Fill matrix with intersection sizes
-            for i, db1 in enumerate(self.databases):
-                for j, db2 in enumerate(self.databases):
-                    if i <= j:  # Fill upper triangle and diagonal
-                        intersection = len(self.gene_sets[db1] & self.gene_sets[db2])
-                        matrix.iloc[i, j] = intersection
-                        matrix.iloc[j, i] = intersection  # Mirror for lower triangle
-                        
-            return matrix
-            
+            # All pairwise intersection sizes as one Mᵀ·M product, over the
+            # distinct membership patterns weighted by their gene counts
+            patterns = self.patterns.astype(np.int64)
+            counts = (patterns * self.pattern_counts[:, None]).T @ patterns
+            return pd.DataFrame(counts, index=self.databases, columns=self.databases)
+
         except Exception as e:
             raise click.ClickException(f"Error generating matrix: {str(e)}")
-            
+
     def generate_percentage_matrix(self, matrix: pd.DataFrame) -> pd.DataFrame:
         """Generate percentage sharing matrix."""
         try:
-            # Get database sizes
-            db_sizes = {db: len(genes) for db, genes in self.gene_sets.items()}
-            
-            # Create percentage matrix
-            percent_matrix = pd.DataFrame(
-                np.zeros((len(self.databases), len(self.databases)), dtype=float),
-                index=self.databases,
-                columns=self.databases
-            )
-            
-            # Calculate percentages
-            for i, db1 in enumerate(self.databases):
-                for j, db2 in enumerate(self.databases):
-                    intersection = matrix.iloc[i, j]
-                    # Calculate percentage based on the smaller database
-                    smaller_db_size = min(db_sizes[db1], db_sizes[db2])
-                    percent = (intersection / smaller_db_size * 100) if smaller_db_size > 0 else 0
-                    percent_matrix.iloc[i, j] = round(percent, 1)
-                    
-            return percent_matrix
-            
+            # Calculate percentage based on the smaller database
+            sizes = self.db_sizes.to_numpy()
+            smaller_db_size = np.minimum.outer(sizes, sizes)
+            percent = np.divide(matrix.to_numpy() * 100, smaller_db_size, out=np.zeros(matrix.shape), where=smaller_db_size > 0)
+            return pd.DataFrame(np.round(percent, 1), index=self.databases, columns=self.databases)
+
         except Exception as e:
             raise click.ClickException(f"Error generating percentage matrix: {str(e)}")
-            
+
+    def generate_jaccard_matrix(self, matrix: pd.DataFrame) -> pd.DataFrame:
+        """Generate Jaccard index matrix: |A ∩ B| / |A ∪ B|."""
+        try:
+            sizes = self.db_sizes.to_numpy()
+            union = np.add.outer(sizes, sizes) - matrix.to_numpy()
+            jaccard = np.divide(matrix.to_numpy(), union, out=np.zeros(matrix.shape), where=union > 0)
+            return pd.DataFrame(jaccard, index=self.databases, columns=self.databases)
+
+        except Exception as e:
+            raise click.ClickException(f"Error generating Jaccard matrix: {str(e)}")
+
+    def generate_containment_matrix(self, matrix: pd.DataFrame) -> pd.DataFrame:
+        """Generate containment matrix: fraction of the row database's genes found in the column database."""
+        try:
+            sizes = self.db_sizes.to_numpy()[:, None]
+            containment = np.divide(matrix.to_numpy(), sizes, out=np.zeros(matrix.shape), where=sizes > 0)
+            return pd.DataFrame(containment, index=self.databases, columns=self.databases)
+
+        except Exception as e:
+            raise click.ClickException(f"Error generating containment matrix: {str(e)}")
+
+    def generate_upset_counts(self) -> pd.DataFrame:
+        """Generate exact (UpSet-style) intersection counts: genes found in exactly each combination of databases."""
+        try:
+            upset = pd.DataFrame(self.patterns, columns=self.databases)
+            upset['degree'] = self.patterns.sum(axis=1)
+            upset['gene_count'] = self.pattern_counts
+            return upset.sort_values(['gene_count', 'degree'], ascending=[False, True], ignore_index=True)
+
+        except Exception as e:
+            raise click.ClickException(f"Error generating intersection counts: {str(e)}")
+
     def plot_heatmap(self, matrix: pd.DataFrame, output_file: str, title: str) -> None:
         """Generate heatmap visualization."""
         try:
+            # Plotting libraries are slow to import, so load them only when a heatmap is drawn
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+
             plt.figure(figsize=(10, 8))
             sns.heatmap(
                 matrix,
@@ -112,6 +146,45 @@ class DatabaseAnalyzer:
         except Exception as e:
             raise click.ClickException(f"Error generating heatmap: {str(e)}")
 
+def write_overlap_outputs(analyzer: DatabaseAnalyzer, output: str, prefix: str = 'sharing_matrix', plots: bool = True) -> Path:
+    """Write the sharing matrices (and optionally heatmaps) of a processed analyzer to output."""
+    # Create output directory if it doesn't exist
+    output_path = Path(output)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    # Generate matrices
+    click.echo("Generating sharing matrices...")
+    with stage("matrices"):
+        count_matrix = analyzer.generate_matrix()
+        percent_matrix = analyzer.generate_percentage_matrix(count_matrix)
+        jaccard_matrix = analyzer.generate_jaccard_matrix(count_matrix)
+        containment_matrix = analyzer.generate_containment_matrix(count_matrix)
+        upset_counts = analyzer.generate_upset_counts()
+
+    # Save matrices to CSV
+    with stage("write"):
+        count_matrix.to_csv(output_path / f"{prefix}_counts.csv")
+        percent_matrix.to_csv(output_path / f"{prefix}_percentages.csv")
+        jaccard_matrix.to_csv(output_path / f"{prefix}_jaccard.csv", float_format='%.4f')
+        containment_matrix.to_csv(output_path / f"{prefix}_containment.csv", float_format='%.4f')
+        upset_counts.to_csv(output_path / f"{prefix}_intersections.csv", index=False)
+
+    if plots:
+        # Generate and save heatmaps
+        click.echo("Generating visualizations...")
+        with stage("plots"):
+            analyzer.plot_heatmap(
+                count_matrix,
+                output_path / f"{prefix}_counts_heatmap.png",
+                "Database Gene Sharing (Counts)"
+            )
+            analyzer.plot_heatmap(
+                percent_matrix,
+                output_path / f"{prefix}_percentages_heatmap.png",
+                "Database Gene Sharing (Percentages)"
+            )
+    return output_path
+
 @click.command()
 @click.option(
     '--input', '-i',
@@ -130,51 +203,35 @@ class DatabaseAnalyzer:
     default='sharing_matrix',
     help='Prefix for output files'
 )
-def main(input: str, output: str, prefix: str):
+@click.option(
+    '--no-plots',
+    is_flag=True,
+    help='Only write the matrices; skip the heatmaps (and the matplotlib/seaborn imports)'
+)
+@instrumented("gene_overlap_heatmap_plot")
+def main(input: str, output: str, prefix: str, no_plots: bool):
     """Generate database sharing matrix and visualizations from input gene data."""
     try:
-        # Create output directory if it doesn't exist
-        output_path = Path(output)
-        output_path.mkdir(parents=True, exist_ok=True)
-        
         # Initialize analyzer
         analyzer = DatabaseAnalyzer(input)
         
         # Process data
         click.echo("Reading input data...")
-        analyzer.read_data()
+        with stage("read"):
+            analyzer.read_data()
         
         click.echo("Processing data...")
-        analyzer.process_data()
+        with stage("process"):
+            analyzer.process_data()
         
-        # Generate matrices
-        click.echo("Generating sharing matrices...")
-        count_matrix = analyzer.generate_matrix()
-        percent_matrix = analyzer.generate_percentage_matrix(count_matrix)
-        
-        # Save matrices to CSV
-        count_matrix.to_csv(output_path / f"{prefix}_counts.csv")
-        percent_matrix.to_csv(output_path / f"{prefix}_percentages.csv")
-        
-        # Generate and save heatmaps
-        click.echo("Generating visualizations...")
-        analyzer.plot_heatmap(
-            count_matrix,
-            output_path / f"{prefix}_counts_heatmap.png",
-            "Database Gene Sharing (Counts)"
-        )
-        analyzer.plot_heatmap(
-            percent_matrix,
-            output_path / f"{prefix}_percentages_heatmap.png",
-            "Database Gene Sharing (Percentages)"
-        )
+        output_path = write_overlap_outputs(analyzer, output, prefix, plots=not no_plots)
         
         click.echo(f"Results saved to: {output_path}")
         
         # Print summary statistics
         click.echo("\nSummary Statistics:")
         for db in analyzer.databases:
-            click.echo(f"{db}: {len(analyzer.gene_sets[db])} genes")
+            click.echo(f"{db}: {analyzer.db_sizes[db]} genes")
             
     except Exception as e:
         raise click.ClickException(str(e))
@@ -1,38 +1,70 @@
 import click
+import numpy as np
 import pandas as pd
-import re
 
-def filter_amr_rows(row):
+from gene_overlap_heatmap_plot import DatabaseAnalyzer, write_overlap_outputs
+from stage_metrics import instrumented, stage
+
+def filter_amr_ids(df):
+    """
+    Extract the database accession of every row from its fa_header, one masked
+    vectorised operation per source database.
+    """
+    header = df['fa_header']
+    parts = header.str.split('_')
+    n_parts = parts.str.len()
+    ids = header.copy()
+
+    # AMRfinderPlus: WP_ accessions keep their prefix
+    mask = df['database'] == "AMRfinderPlus_cds"
+    ids[mask] = parts[mask].str[1].where(parts[mask].str[1] != 'WP', parts[mask].str[1:3].str.join('_'))
+
+    # CARD: ARO_<n> as ARO:<n>
+    mask = df['database'] == "card_cds"
+    ids[mask] = header[mask].str.extract(r'(ARO_\d+)', expand=False).str.replace('_', ':').fillna(header[mask])
+
+    # ARG-ANNOT: accession is the 4th field from the end, joined with the one before it when numeric
+    mask = df['database'] == "ARG-ANNOT_cds"
+    accession = parts[mask].str[-4]
+    joined = parts[mask].str[-5] + '_' + accession
+    ids[mask] = accession.where(~accession.str.isdigit().eq(True) | (n_parts[mask] < 6), joined)
+
+    # MEGARes: MEG_<n>
+    mask = df['database'] == "megares_cds"
+    ids[mask] = header[mask].str.extract(r'(MEG_\d+)', expand=False).fillna(header[mask])
+
+    # ResFinder: accession is the last field
+    mask = df['database'] == "ResFinder_cds"
+    ids[mask] = parts[mask].str[-1]
+    return ids
+
+def annotate_database_rows(merged_df):
     """
-    Function to filter AMR rows based on specific criteria.
+    Fill subtype/allele/gene_family of the ARG-ANNOT, MetalResistance and
+    ResFinder rows from their fa_header, and the ResFinder gene allele used to
+    join the ResFinder notes.
     """
-    if row.database=="AMRfinderPlus_cds":
-        a, *b = row.id.split('_')
-        if b[0]=='WP':
-            id = "_".join(b[0:2])
-        else:
-            id = b[0]
-    elif row.database=="card_cds":
-        match = re.search(r'ARO_\d+', row.id)
-        if match:
-            id = match.group()
-            id = id.replace('_', ':')
-    elif row.database=="ARG-ANNOT_cds":
-        _, *b = row.id.split('_')
-        if b[-4].isdigit():
-            id = "_".join(b[-5:-3])
-        else:
-            id = b[-4]
-    elif row.database=="megares_cds":
-        match = re.search(r'MEG_\d+', row.id)
-        if match:
-            id = match.group()
-    elif row.database=="ResFinder_cds":
-        a, *b = row.id.split('_')
-        id = b[-1]
-    else:
-        id = row.id
-    return id
+    parts = merged_df['fa_header'].str.split('_')
+    merged_df['gene_allele'] = pd.Series(pd.NA, index=merged_df.index, dtype=object)
+
+    mask = merged_df['database'] == 'ARG-ANNOT_cds'
+    merged_df.loc[mask, 'subtype'] = "AMR"
+    merged_df.loc[mask, 'allele'] = merged_df.loc[mask, 'fa_header']
+    merged_df.loc[mask, 'gene_family'] = parts[mask].str[2]
+
+    mask = merged_df['database'] == 'MetalResistance_cds'
+    merged_df.loc[mask, 'subtype'] = "Metal"
+    merged_df.loc[mask, 'id'] = parts[mask].str[-1]
+    merged_df.loc[mask, 'allele'] = parts[mask].str[0]
+    merged_df.loc[mask, 'gene_family'] = parts[mask].str[0]
+
+    mask = merged_df['database'] == 'ResFinder_cds'
+    merged_df.loc[mask, 'subtype'] = "AMR"
+    # gene allele: every field but the last two
+    merged_df.loc[mask, 'gene_allele'] = parts[mask].str[:-2].str.join('_')
+    merged_df.loc[mask, 'gene_family'] = parts[mask].str[0]
+    return merged_df
+
 def process_amrfinderplus(AMRFinderPlus_df):
     # replace NAN values in 'refseq_protein_accession' with values from 'genbank_protein_accession'
     AMRFinderPlus_df['refseq_protein_accession'] = AMRFinderPlus_df['refseq_protein_accession'].fillna(AMRFinderPlus_df['genbank_protein_accession'])
@@ -46,23 +78,43 @@ def process_card(card_df):
     #card_df.rename(columns={"Protein Accession": "refseq_protein_accession", "AMR Gene Family": "gene_family", "Drug Class": "class", "CARD Short Name": "allele"}, inplace=True)
     return card_df
 
+# Annotation columns joined per gene as a sorted, de-duplicated comma-separated list
+SUMMARY_JOIN_COLUMNS = ["shortname", "database", "id", "allele", "gene_family", "subtype", "class"]
+
 def summarize_arg(merged_df):
-    summary = merged_df.groupby("userGeneName").agg({
-        "gene_len": "first",
-        "shortname": lambda x: ",".join(sorted(set(x.dropna()))),
-        "database": lambda x: ",".join(sorted(set(x.dropna()))),
-        "fa_header": "count",  # Number of entries
-        "id": lambda x: ",".join(sorted(set(x.dropna()))),
-        "allele": lambda x: ",".join(sorted(set(x.dropna()))),
-        "gene_family": lambda x: ",".join(sorted(set(x.dropna()))),
-        "subtype": lambda x: ",".join(sorted(set(x.dropna()))),
-        "class": lambda x: ",".join(sorted(set(x.dropna())))
-    }).rename(columns={"fa_header": "entry_count"})
-    
-    # Remove duplicates within the strings in "type" column
-    summary["subtype"] = summary["subtype"].apply(
-        lambda x: ",".join(sorted(set(str(x).split(",")))) if pd.notna(x) and "," in str(x) else x
-    )
+    """
+    One row per userGeneName: the first gene_len, the number of entries and the
+    distinct values of every annotation column. The values are exploded,
+    de-duplicated and sorted once in long form, then joined per group.
+    """
+    groups = merged_df.groupby("userGeneName")
+    summary = pd.DataFrame({
+        "gene_len": groups["gene_len"].first(),
+        "entry_count": groups["fa_header"].count(),  # Number of entries
+    })
+
+    values = merged_df.melt(id_vars="userGeneName", value_vars=SUMMARY_JOIN_COLUMNS, var_name="column").dropna()
+    values["value"] = values["value"].astype(str)
+    # subtype may already hold several comma-separated types: de-duplicate the individual types
+    subtype = values["column"] == "subtype"
+    values = pd.concat([values[~subtype], values[subtype].assign(value=values.loc[subtype, "value"].str.split(",")).explode("value")])
+    values = values.drop_duplicates().sort_values(["userGeneName", "column", "value"], ignore_index=True)
+    # Join each (gene, column) run of the sorted values; slicing one list avoids a Series per group
+    group = values[["userGeneName", "column"]]
+    starts = np.flatnonzero((group != group.shift()).any(axis=1).to_numpy())
+    ends = np.append(starts[1:], len(values))
+    value_list = values["value"].tolist()
+    joined = pd.DataFrame({
+        "userGeneName": values["userGeneName"].to_numpy()[starts],
+        "column": values["column"].to_numpy()[starts],
+        "value": [",".join(value_list[start:end]) for start, end in zip(starts, ends)],
+    }).pivot(index="userGeneName", columns="column", values="value")
+
+    # Genes without any value in a column get an empty string
+    joined = joined.reindex(index=summary.index, columns=SUMMARY_JOIN_COLUMNS).fillna("")
+    summary = summary.join(joined)
+    summary = summary[["gene_len", "shortname", "database", "entry_count", "id", "allele", "gene_family", "subtype", "class"]]
+    summary.columns.name = None
 
     summary.reset_index(inplace=True)
 
@@ -77,108 +129,93 @@ def summarize_arg(merged_df):
 @click.option('--megares', type=str, default='megares_annotations_v3.00.csv', help='Megares annotations file')
 @click.option('--resfinder', type=str, default='notes.txt', help='Notes file for ResFinder')
 @click.option('--summary', type=str, default='summary.txt', help='Summary File name')
-
-def main(filename, amrfinderplus, card, megares, resfinder, summary):
-    df = pd.read_csv(filename, sep="\t", header=0)
-    
-    # Parse AMR databases metadata files
-    AMRFinderPlus_df = pd.read_csv(amrfinderplus, sep="\t", header=0) # AMRFinderPlus
-    
-    card_df = pd.read_csv(card, sep="\t", header=0) # CARD
+@click.option('--overlap-dir', type=click.Path(), default=None, help='Also write the database overlap matrices of FILENAME to this directory')
+@click.option('--overlap-plots', is_flag=True, help='Draw the overlap heatmaps as well (needs matplotlib and seaborn)')
+
+@instrumented("get_args")
+def main(filename, amrfinderplus, card, megares, resfinder, summary, overlap_dir, overlap_plots):
+    with stage("read") as record:
+        df = pd.read_csv(filename, sep="\t", header=0)
+        record["rows"] = len(df)
+
+    # Database overlap statistics from the gene table already in memory
+    if overlap_dir:
+        with stage("overlap"):
+            analyzer = DatabaseAnalyzer(data=df)
+            analyzer.process_data()
+            write_overlap_outputs(analyzer, overlap_dir, plots=overlap_plots)
     
-    megares_df = pd.read_csv(megares, sep=",", header=0) # MEGARes
-    megares_df["header"] = megares_df["header"].str.extract(r"(MEG_\d+)") # MEGARes
-    # if type = Multi-compound, copy value from class to type
-    megares_df.loc[megares_df["type"] == "Multi-compound", "type"] = megares_df["class"]
-    # now replace word resistance with nothing in the "type" column
-    megares_df["type"] = megares_df["type"].str.replace(" resistance", "")
-    # replace Drug with AMR in the "type" column and replace "and" with ","
-    megares_df["type"] = megares_df["type"].str.replace(" and ", ",")
-    # replace Drug or Drugs with AMR in the "type" column
-    megares_df["type"] = megares_df["type"].str.replace("Drugs", "AMR")
-    megares_df["type"] = megares_df["type"].str.replace("Drug", "AMR")
-    megares_df["type"] = megares_df["type"].str.replace("Biocides", "Biocide")
-    megares_df["type"] = megares_df["type"].str.replace("Metals", "Metal")
-    
-    resfinder_df = pd.read_csv(resfinder, sep=":", comment="#",names=["Gene allele", "class","empty"])# ResFinder
-    # class remove "resistance" word
-    resfinder_df['class'] = resfinder_df['class'].str.replace("resistance", "")
-    # Substitute special characters in "Gene allele" with "_"
-    resfinder_df['Gene symbol'] = resfinder_df['Gene allele'].str.replace(r'[^a-zA-Z0-9]', '_', regex=True)
-    
-    # Process AMR databases
-    AMRFinderPlus_df=process_amrfinderplus(AMRFinderPlus_df)
-    card_df=process_card(card_df)
-
-    df['id'] = df['fa_header']
-    for row in df.itertuples(index=True):  # or index=True if you want the index
-        df.at[row.Index, 'id']=filter_amr_rows(row)
+    with stage("read_annotations"):
+        # Parse AMR databases metadata files
+        AMRFinderPlus_df = pd.read_csv(amrfinderplus, sep="\t", header=0) # AMRFinderPlus
+        
+        card_df = pd.read_csv(card, sep="\t", header=0) # CARD
+        
+        megares_df = pd.read_csv(megares, sep=",", header=0) # MEGARes
+        megares_df["header"] = megares_df["header"].str.extract(r"(MEG_\d+)") # MEGARes
+        # if type = Multi-compound, copy value from class to type
+        megares_df.loc[megares_df["type"] == "Multi-compound", "type"] = megares_df["class"]
+        # now replace word resistance with nothing in the "type" column
+        megares_df["type"] = megares_df["type"].str.replace(" resistance", "")
+        # replace Drug with AMR in the "type" column and replace "and" with ","
+        megares_df["type"] = megares_df["type"].str.replace(" and ", ",")
+        # replace Drug or Drugs with AMR in the "type" column
+        megares_df["type"] = megares_df["type"].str.replace("Drugs", "AMR")
+        megares_df["type"] = megares_df["type"].str.replace("Drug", "AMR")
+        megares_df["type"] = megares_df["type"].str.replace("Biocides", "Biocide")
+        megares_df["type"] = megares_df["type"].str.replace("Metals", "Metal")
+        
+        resfinder_df = pd.read_csv(resfinder, sep=":", comment="#",names=["Gene allele", "class","empty"])# ResFinder
+        # class remove "resistance" word
+        resfinder_df['class'] = resfinder_df['class'].str.replace("resistance", "")
+        # Substitute special characters in "Gene allele" with "_"
+        resfinder_df['Gene symbol'] = resfinder_df['Gene allele'].str.replace(r'[^a-zA-Z0-9]', '_', regex=True)
+        
+        # Process AMR databases
+        AMRFinderPlus_df=process_amrfinderplus(AMRFinderPlus_df)
+        card_df=process_card(card_df)
 
+    with stage("metadata_join") as record:
+        df['id'] = filter_amr_ids(df)
 
-    merged_df = pd.merge(df, AMRFinderPlus_df, left_on='id', right_on='refseq_protein_accession', how='left')
-    merged_df = pd.merge(merged_df, card_df , left_on='id', right_on='ARO Accession', how='left')
-    
-    merged_df['subtype'] = merged_df['subtype_x'].combine_first(merged_df['subtype_y'])
-    merged_df['allele'] = merged_df['allele'].combine_first(merged_df['CARD Short Name'])
-    merged_df['gene_family'] = merged_df['gene_family'].combine_first(merged_df['AMR Gene Family'])
-    merged_df['class'] = merged_df['class'].combine_first(merged_df['Drug Class'])
-    
-    # Drop column subtype_x and subtype_y
-    merged_df.drop(columns=['chosenSeq','fa_name','AMR Gene Family','subtype_x', 'subtype_y', 'refseq_protein_accession', 'ARO Accession', 'CARD Short Name','Drug Class'], inplace=True)
-
-    for row in merged_df.itertuples(index=True):
-        if row.database == 'ARG-ANNOT_cds':
-            merged_df.at[row.Index, 'subtype'] = "AMR"
-            # split 'fa_header' by '_ and join 2 and 3 elements
-            # and assign to 'allele'
-            #_, *b = row.fa_header.split('_')
-            # check if 3rd element in b is integer
-            ##if b[2].isdigit():
-            merged_df.at[row.Index, 'allele'] = row.fa_header
-            else:
-                merged_df.at[row.Index, 'allele'] = b[1]
-            
-            merged_df.at[row.Index, 'gene_family'] = b[1]
+        merged_df = pd.merge(df, AMRFinderPlus_df, left_on='id', right_on='refseq_protein_accession', how='left')
+        merged_df = pd.merge(merged_df, card_df , left_on='id', right_on='ARO Accession', how='left')
         
-        if row.database == 'MetalResistance_cds':
-            merged_df.at[row.Index, 'subtype'] = "Metal"
-            # split 'fa_header' by '_ and join 2 and 3 elements
-            # and assign to 'allele'
-            a, *b = row.fa_header.split('_')
-            merged_df.at[row.Index, 'id'] = b[-1]
-            merged_df.at[row.Index, 'allele'] = a
-            merged_df.at[row.Index, 'gene_family'] = a
+        merged_df['subtype'] = merged_df['subtype_x'].combine_first(merged_df['subtype_y'])
+        merged_df['allele'] = merged_df['allele'].combine_first(merged_df['CARD Short Name'])
+        merged_df['gene_family'] = merged_df['gene_family'].combine_first(merged_df['AMR Gene Family'])
+        merged_df['class'] = merged_df['class'].combine_first(merged_df['Drug Class'])
         
-        if row.database == 'ResFinder_cds':
-            merged_df.at[row.Index, 'subtype'] = "AMR"
-            # split 'fa_header' by '_ and join 2 and 3 elements
-            # and assign to 'allele'
-            a = row.fa_header.split('_')
-            merged_df.at[row.Index, 'gene_allele'] = "_".join(a[:-2])
-            merged_df.at[row.Index, 'gene_family'] = a[0]
+        # Drop column subtype_x and subtype_y
+        merged_df.drop(columns=['chosenSeq','fa_name','AMR Gene Family','subtype_x', 'subtype_y', 'refseq_protein_accession', 'ARO Accession', 'CARD Short Name','Drug Class'], inplace=True)
+
+        merged_df = annotate_database_rows(merged_df)
         
-    
-    merged_df = pd.merge(merged_df, megares_df , left_on='id', right_on='header', how='left')
-    merged_df['subtype'] = merged_df['subtype'].combine_first(merged_df['type'])
-    merged_df['gene_family'] = merged_df['gene_family'].combine_first(merged_df['group'])
-    merged_df['class'] = merged_df['class_x'].combine_first(merged_df['class_y'])
-    # Drop column subtype_x and subtype_y
-    merged_df.drop(columns=['type','group','class_x','class_y','header','mechanism'], inplace=True)
-
-    # Merge with ResFinder
-    merged_df = pd.merge(merged_df, resfinder_df , left_on='gene_allele', right_on='Gene symbol', how='left')
-    merged_df['class'] = merged_df['class_x'].combine_first(merged_df['class_y'])
-    merged_df['allele'] = merged_df['allele'].combine_first(merged_df['Gene allele'])
-    merged_df.drop(columns=['Gene allele','gene_allele','Gene symbol','class_x','class_y','empty'], inplace=True)
+        merged_df = pd.merge(merged_df, megares_df , left_on='id', right_on='header', how='left')
+        merged_df['subtype'] = merged_df['subtype'].combine_first(merged_df['type'])
+        merged_df['gene_family'] = merged_df['gene_family'].combine_first(merged_df['group'])
+        merged_df['class'] = merged_df['class_x'].combine_first(merged_df['class_y'])
+        # Drop column subtype_x and subtype_y
+        merged_df.drop(columns=['type','group','class_x','class_y','header','mechanism'], inplace=True)
+
+        # Merge with ResFinder
+        merged_df = pd.merge(merged_df, resfinder_df , left_on='gene_allele', right_on='Gene symbol', how='left')
+        merged_df['class'] = merged_df['class_x'].combine_first(merged_df['class_y'])
+        merged_df['allele'] = merged_df['allele'].combine_first(merged_df['Gene allele'])
+        merged_df.drop(columns=['Gene allele','gene_allele','Gene symbol','class_x','class_y','empty'], inplace=True)
+        record["rows"] = len(merged_df)
     
     # Summarize ARGs
-    # make all in uppercase subtype column
-    merged_df['subtype'] = merged_df['subtype'].str.upper()
-    # Remove duplicates within the "type" column
-    summary_df=summarize_arg(merged_df)
+    with stage("summarize") as record:
+        # make all in uppercase subtype column
+        merged_df['subtype'] = merged_df['subtype'].str.upper()
+        # Remove duplicates within the "type" column
+        summary_df=summarize_arg(merged_df)
+        record["rows"] = len(summary_df)
 
     # write the merged dataframe to a new file
-    summary_df.to_csv(summary, sep="\t", index=False)
+    with stage("write"):
+        summary_df.to_csv(summary, sep="\t", index=False)
 
 if __name__ == '__main__':
     main()
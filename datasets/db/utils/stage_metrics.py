@@ -0,0 +1,16 @@
+"""Stage metrics (bin/instrumentation.py) for the database scripts.
+
+The scripts stay independent of bin/: with bin/ on PYTHONPATH their stages are
+recorded, otherwise stage and instrumented do nothing.
+"""
+
+from contextlib import nullcontext
+
+try:
+    from instrumentation import instrumented, stage  # noqa: F401
+except ImportError:
+    def stage(name, **fields):
+        return nullcontext({})
+
+    def instrumented(script):
+        return lambda function: function
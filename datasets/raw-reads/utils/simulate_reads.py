@@ -0,0 +1,199 @@
+import click
+import numpy as np
+import pandas as pd
+import gzip
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Bases as codes 0-3 (N and other symbols: 4) and back
+BASES = np.frombuffer(b"ACGTN", dtype=np.uint8)
+CODES = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate(b"ACGT"):
+    CODES[base] = code
+    CODES[ord(chr(base).lower())] = code
+COMPLEMENT = np.array([3, 2, 1, 0, 4], dtype=np.uint8)
+
+# Genome name -> base codes, loaded once per process
+GENOMES = {}
+
+def read_genomes(fasta_files):
+    """Read genome FASTA files (as written by subsample_genomes.py) into base-code arrays."""
+    genomes = {}
+    for fasta_file in fasta_files:
+        opener = gzip.open if fasta_file.endswith('.gz') else open
+        name, chunks = None, []
+        with opener(fasta_file, 'rb') as handle:
+            for line in handle:
+                if line.startswith(b'>'):
+                    if name is not None:
+                        genomes[name] = CODES[np.frombuffer(b''.join(chunks), dtype=np.uint8)]
+                    name, chunks = line[1:].split()[0].decode(), []
+                else:
+                    chunks.append(line.strip())
+        if name is not None:
+            genomes[name] = CODES[np.frombuffer(b''.join(chunks), dtype=np.uint8)]
+    return genomes
+
+def load_genomes(fasta_files):
+    # Pool initializer: forked workers inherit GENOMES, others read the files once
+    if not GENOMES:
+        GENOMES.update(read_genomes(fasta_files))
+
+def error_profile(read_length, error_start, error_end):
+    """Per-position substitution probability, rising linearly along the read, and its Phred quality."""
+    error_rate = np.linspace(error_start, error_end, read_length)
+    quality = np.clip(np.round(-10 * np.log10(error_rate)), 2, 41).astype(np.uint8)
+    return error_rate, quality
+
+def sequencing_errors(reads, error_rate, rng):
+    """Substitute bases in place with the positional error rate; N bases are left unchanged."""
+    errors = (rng.random(reads.shape) < error_rate) & (reads < 4)
+    reads[errors] = (reads[errors] + rng.integers(1, 4, errors.sum(), dtype=np.uint8)) % 4
+    return errors
+
+def fastq_block(names, reads, qualities):
+    """Format reads (base codes) and qualities (Phred) as FASTQ bytes."""
+    newline = np.full((len(reads), 1), ord('\n'), dtype=np.uint8)
+    seq_rows = np.hstack([BASES[reads], newline]).tobytes()
+    qual_rows = np.hstack([qualities + 33, newline]).tobytes()
+    width = reads.shape[1] + 1
+    return b''.join(
+        b'@' + name + b'\n' + seq_rows[i * width:(i + 1) * width] + b'+\n' + qual_rows[i * width:(i + 1) * width]
+        for i, name in enumerate(names)
+    )
+
+def simulate_chunk(task):
+    """Simulate one chunk of read pairs from one genome and write them to gzipped R1/R2 shard files.
+
+    Fragment lengths, positions, strands, errors and quality noise are drawn
+    as arrays for the whole chunk from the chunk's own seed, so the reads do
+    not depend on how chunks are spread over workers.
+    """
+    (genome, first_pair, n_pairs, seed, read_length, fragment_mean, fragment_sd,
+     error_start, error_end, r1_file, r2_file, compresslevel) = task
+    sequence = GENOMES[genome]
+    rng = np.random.default_rng(seed)
+
+    fragment = np.rint(rng.normal(fragment_mean, fragment_sd, n_pairs)).astype(np.int64)
+    fragment = np.clip(fragment, read_length, len(sequence))
+    start = (rng.random(n_pairs) * (len(sequence) - fragment + 1)).astype(np.int64)
+    offsets = np.arange(read_length)
+    forward = sequence[start[:, None] + offsets]
+    reverse = COMPLEMENT[sequence[(start + fragment)[:, None] - 1 - offsets]]
+
+    # Half of the fragments come from the reverse strand: swap the mates
+    swap = rng.random(n_pairs) < 0.5
+    r1 = np.where(swap[:, None], reverse, forward)
+    r2 = np.where(swap[:, None], forward, reverse)
+
+    error_rate, quality = error_profile(read_length, error_start, error_end)
+    names = [f"{genome}_{first_pair + i}".encode() for i in range(n_pairs)]
+    for reads, mate, output_file in ((r1, b'/1', r1_file), (r2, b'/2', r2_file)):
+        errors = sequencing_errors(reads, error_rate, rng)
+        qualities = np.clip(quality - rng.integers(0, 4, reads.shape, dtype=np.uint8), 2, 41)
+        qualities[errors] = np.minimum(qualities[errors], 12)
+        # No file name or timestamp in the gzip header: the same seed gives the same bytes
+        with open(output_file, 'wb') as raw, gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=compresslevel, mtime=0) as handle:
+            handle.write(fastq_block([name + mate for name in names], reads, qualities))
+    return n_pairs
+
+def read_plan(coverage_table, genomes, read_length, depth=None):
+    """Read pairs per genome from the subsample_genomes.py coverage table (#FILE, coverage, genome_size, n_reads).
+
+    With depth, the number of pairs is recomputed from the genome length so the
+    same genomes can be simulated at several depths.
+    """
+    table = pd.read_csv(coverage_table, sep="\t", header=None, names=["genome", "coverage", "genome_size", "n_reads"])
+    # Genomes subsample_genomes.py could not read are listed in the table but have no sequence
+    missing = ~table["genome"].isin(list(genomes))
+    if missing.any():
+        click.echo(f"Warning: skipping {missing.sum()} genomes of {coverage_table} not found in the FASTA files (e.g. {table.loc[missing, 'genome'].iloc[0]})", err=True)
+        table = table[~missing].reset_index(drop=True)
+    if depth is not None:
+        lengths = table["genome"].map({name: len(sequence) for name, sequence in genomes.items()})
+        table["coverage"] = depth
+        table["n_reads"] = (depth * lengths / read_length).apply(math.ceil)
+    table["n_pairs"] = (table["n_reads"] / 2).apply(math.ceil)
+    return table
+
+@click.command()
+@click.option('--genomes', '-g', 'fasta_files', required=True, multiple=True, type=click.Path(exists=True),
+              help='Genome FASTA files, e.g. <prefix>_complete_genomes.fasta and <prefix>_draft_genomes.fasta (repeatable)')
+@click.option('--coverage-table', required=True, type=click.Path(exists=True),
+              help='Coverage table written by subsample_genomes.py (<prefix>.txt)')
+@click.option('--output-prefix', required=True,
+              help='Output prefix; writes <prefix>_R1.fastq.gz and <prefix>_R2.fastq.gz')
+@click.option('--depth', type=float, default=None,
+              help='Simulate this depth (X) instead of the n_reads of the coverage table')
+@click.option('--read-length', default=125, type=int,
+              help='Read length (default: 125)')
+@click.option('--fragment-mean', default=350.0, type=float,
+              help='Mean fragment (insert) length (default: 350)')
+@click.option('--fragment-sd', default=35.0, type=float,
+              help='Fragment length standard deviation (default: 35)')
+@click.option('--error-start', default=0.001, type=float,
+              help='Substitution rate at the first base of a read (default: 0.001)')
+@click.option('--error-end', default=0.01, type=float,
+              help='Substitution rate at the last base of a read (default: 0.01)')
+@click.option('--seed', default=42, type=int,
+              help='Random seed (default: 42)')
+@click.option('--chunk-pairs', default=200000, type=click.IntRange(min=1),
+              help='Read pairs simulated per shard (default: 200000)')
+@click.option('--jobs', default=1, type=click.IntRange(min=1),
+              help='Number of shards simulated in parallel (default: 1)')
+@click.option('--compresslevel', default=4, type=click.IntRange(1, 9),
+              help='gzip compression level (default: 4)')
+def main(fasta_files, coverage_table, output_prefix, depth, read_length, fragment_mean, fragment_sd,
+         error_start, error_end, seed, chunk_pairs, jobs, compresslevel):
+    """Simulate paired-end Illumina-like reads of a mock community into gzipped FASTQ pairs."""
+    if not 0 < error_start < 1 or not 0 < error_end < 1:
+        raise click.BadParameter("Error rates must be between 0 and 1")
+
+    click.echo("Reading genomes...")
+    GENOMES.update(read_genomes(fasta_files))
+    plan = read_plan(coverage_table, GENOMES, read_length, depth)
+    short = [name for name in plan["genome"] if len(GENOMES[name]) < read_length]
+    if short:
+        raise click.ClickException(f"{len(short)} genomes are shorter than the read length (e.g. {short[0]})")
+
+    # One task per chunk of each genome; every chunk gets its own child seed
+    work_dir = tempfile.mkdtemp(prefix=".simulate_reads.", dir=os.path.dirname(os.path.abspath(output_prefix)))
+    seeds = np.random.SeedSequence(seed)
+    tasks = []
+    for genome, n_pairs, genome_seed in zip(plan["genome"], plan["n_pairs"], seeds.spawn(len(plan))):
+        n_chunks = max(1, math.ceil(n_pairs / chunk_pairs))
+        for chunk, chunk_seed in enumerate(genome_seed.spawn(n_chunks)):
+            first_pair = chunk * chunk_pairs
+            pairs = min(chunk_pairs, n_pairs - first_pair)
+            if pairs <= 0:
+                continue
+            shard = os.path.join(work_dir, f"{len(tasks)}")
+            tasks.append((genome, first_pair, pairs, chunk_seed, read_length, fragment_mean, fragment_sd,
+                          error_start, error_end, f"{shard}_R1.fastq.gz", f"{shard}_R2.fastq.gz", compresslevel))
+
+    click.echo(f"Simulating {plan['n_pairs'].sum()} read pairs from {len(plan)} genomes in {len(tasks)} shards...")
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=load_genomes, initargs=(fasta_files,)) if jobs > 1 else None
+    try:
+        results = executor.map(simulate_chunk, tasks) if executor else map(simulate_chunk, tasks)
+        # Concatenated gzip members are a valid gzip file: append the shards in task order
+        with open(f"{output_prefix}_R1.fastq.gz", 'wb') as r1, open(f"{output_prefix}_R2.fastq.gz", 'wb') as r2:
+            with click.progressbar(zip(tasks, results), length=len(tasks), label='Simulating reads') as bar:
+                for task, _ in bar:
+                    for shard_file, output in ((task[-3], r1), (task[-2], r2)):
+                        with open(shard_file, 'rb') as shard:
+                            shutil.copyfileobj(shard, output)
+                        os.remove(shard_file)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    plan[["genome", "coverage", "genome_size", "n_reads", "n_pairs"]].to_csv(f"{output_prefix}_reads.tsv", sep="\t", index=False)
+    click.echo(f"Reads: {output_prefix}_R1.fastq.gz, {output_prefix}_R2.fastq.gz")
+    click.echo(f"Read counts: {output_prefix}_reads.tsv")
+
+if __name__ == '__main__':
+    main()
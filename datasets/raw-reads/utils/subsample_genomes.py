@@ -2,8 +2,22 @@ import click
 import pandas as pd
 import os
 import math
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from Bio import SeqIO
 
+try:
+    # Stage metrics (bin/instrumentation.py) when bin/ is on PYTHONPATH; no-ops otherwise
+    from instrumentation import instrumented, stage
+except ImportError:
+    def stage(name, **fields):
+        return nullcontext({})
+
+    def instrumented(script):
+        return lambda function: function
+
 def merge_and_filter_data(genomes_file, metadata_file, amr_count):
     """Merge and filter genome and metadata files."""
     # Read input files
@@ -35,23 +49,55 @@ def sample_strains(strains_w_amr, strains_wo_amr, sample_size, random_state,
 
 
 
-def process_genome(file_name, file_path, output_handle):
-    """Process individual genome files."""
+def process_genome(file_name, file_path, output_file):
+    """Write one genome as a single FASTA record of its concatenated contigs.
+
+    Contigs are streamed to output_file one at a time, so memory stays
+    proportional to the largest contig. Returns False if the genome could not be read.
+    """
     base_name = file_name.replace('.fna.gz', '')
     
     try:
-        concatenated_sequence = ""
-        # Parse the FASTA file
-        for record in SeqIO.parse(file_path, "fasta"):
-            concatenated_sequence += str(record.seq)
-            
-        # write out the FASTA file
-        new_header = f">{base_name}\n"
-        output_handle.write(new_header)
-        output_handle.write(f"{concatenated_sequence}\n")
+        with open(output_file, 'w') as output_handle:
+            # write out the FASTA file
+            new_header = f">{base_name}\n"
+            output_handle.write(new_header)
+            # Parse the FASTA file
+            for record in SeqIO.parse(file_path, "fasta"):
+                output_handle.write(str(record.seq))
+            output_handle.write("\n")
+        return True
 
     except OSError as e:
         click.echo(f"Error accessing file {file_path}: {e}", err=True)
+        return False
+
+def process_genome_task(task):
+    return process_genome(*task)
+
+def process_genomes(genomes, outputs, work_dir, jobs=1):
+    """Write each (file name, path, genome type) to outputs[genome type], in input order.
+
+    Genomes are written to temporary files in work_dir by a pool of jobs
+    workers and appended to the combined FASTA files in the order of genomes,
+    so the output does not depend on the number of workers.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=".subsample_genomes.", dir=work_dir)
+    tasks = [(file_name, file_path, os.path.join(tmp_dir, f"{i}.fasta")) for i, (file_name, file_path, _) in enumerate(genomes)]
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        # executor.map yields results in submission order
+        results = executor.map(process_genome_task, tasks) if executor else map(process_genome_task, tasks)
+        with click.progressbar(zip(genomes, tasks, results), length=len(tasks), label='Processing genomes') as bar:
+            for (_, _, genome_type), (_, _, genome_file), written in bar:
+                if written:
+                    with open(genome_file) as genome:
+                        shutil.copyfileobj(genome, outputs[genome_type])
+                    os.remove(genome_file)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
 @click.command()
 @click.option('--genomes-file', required=True, 
@@ -70,8 +116,11 @@ def process_genome(file_name, file_path, output_handle):
               help='Depth for sequences (X) (default: 1)')
 @click.option('--read-length', default=125.0, type=int,
               help='Max read length (default: 125)')
+@click.option('--jobs', default=1, type=click.IntRange(min=1),
+              help='Number of genomes processed in parallel (default: 1)')
+@instrumented("subsample_genomes")
 def main(genomes_file, metadata_file, output_prefix, 
-         sample_size, random_state, amr_count, sequencing_depth, read_length):
+         sample_size, random_state, amr_count, sequencing_depth, read_length, jobs):
     """Process genome files and create coverage and combined FASTA outputs."""
     
     # Validate input files
@@ -84,10 +133,12 @@ def main(genomes_file, metadata_file, output_prefix,
         raise click.BadParameter("AMR count and sequencing depth values must be positive numbers")
     
     click.echo("Processing input files...")
-    strains_w_amr, strains_wo_amr = merge_and_filter_data(genomes_file, metadata_file, amr_count)
+    with stage("read"):
+        strains_w_amr, strains_wo_amr = merge_and_filter_data(genomes_file, metadata_file, amr_count)
     
     click.echo(f"Sampling {sample_size} strains from each group...")
-    df = sample_strains(strains_w_amr, strains_wo_amr, sample_size, random_state, sequencing_depth)
+    with stage("sample"):
+        df = sample_strains(strains_w_amr, strains_wo_amr, sample_size, random_state, sequencing_depth)
     #print(df['genome_type'])
     
     # Save coverage file
@@ -107,15 +158,10 @@ def main(genomes_file, metadata_file, output_prefix,
                                     sep="\t")
     # Process genomes and create combined FASTA
     click.echo("Creating combined FASTA file...")
-    with open(output_prefix + '_complete_genomes.fasta', 'w') as complete_genome, open(output_prefix + '_draft_genomes.fasta', 'w') as draft_genome :
-        with click.progressbar(df.iterrows(), 
-                             length=len(df), 
-                             label='Processing genomes') as bar:
-            for _, row in bar:
-                if row['genome_type'] == 'Complete Genome':
-                    process_genome(row['#FILE'], row['GENOME_LOC'], complete_genome)
-                else:
-                    process_genome(row['#FILE'], row['GENOME_LOC'], draft_genome)
+    with stage("genomes", genomes=len(df), jobs=jobs), open(output_prefix + '_complete_genomes.fasta', 'w') as complete_genome, open(output_prefix + '_draft_genomes.fasta', 'w') as draft_genome :
+        genome_types = (df['genome_type'] == 'Complete Genome').map({True: 'complete', False: 'draft'})
+        genomes = list(zip(df['#FILE'], df['GENOME_LOC'], genome_types))
+        process_genomes(genomes, {'complete': complete_genome, 'draft': draft_genome}, os.path.dirname(os.path.abspath(output_prefix)), jobs)
     
     click.echo(f"Coverage file:{output_prefix}.txt")
     click.echo(f"Complete genomes:{output_prefix}_complete_genomes.fasta")
@@ -49,6 +49,32 @@ Optional Arguments:
         --skip_ariba      Skip running ARIBA
         --skip_karga      Skip running KARGA
         --skip_srst2      Skip running SRST2
+    KMA (ARGprofiler):
+        --mapstat_depth   Minimum mean depth of a KMA hit (default: 6)
+        --kma_raw_mapstat Filter the raw KMA mapstat in the summary step instead of running bin/mapstatFilters.R
+    Read preparation:
+        --prepare_reads   Decompress and validate each read pair once and give every tool the prepared reads
+        --prepare_reads_compress  Keep the prepared reads gzipped (fast level) instead of plain FASTQ
+    Downsampling:
+        --target_depth    Subsample each read pair to this depth (X) before running the tools (default: 0, off)
+        --genome_size     Genome size used for the depth estimate, e.g. 5m (default: estimated from the reads' k-mers)
+        --downsample_seed Seed of the read subsampling (default: 42)
+    Result cache:
+        --result_cache    Directory of a result cache shared between runs; tool runs found in it are restored instead of re-run
+        --result_cache_max_size  Evict least recently used cache entries beyond this size (e.g. 500G)
+    Prescreen:
+        --prescreen       Screen each sample's k-mers against panARG; ARIBA and SRST2 align against the candidate genes only
+        --prescreen_index Prebuilt bin/kmer_prescreen.py index (default: built at the start of the run)
+        --prescreen_min_coverage  Fraction of a gene's k-mers that must be seen in the reads (default: 0.5)
+    Summary:
+        --cohort_summary  Summarise all samples in a single process (one gene x sample matrix)
+        --summary_format  Summary file format: tsv (default), parquet or arrow
+        --summary_state_dir  Keep parsed reports here so cohort summaries only re-parse new or changed reports
+        --summary_thresholds  JSON {tool: {metric: minimum}} detection thresholds (default: KARGA coverage >= 80)
+        --summary_evidence  Also write per-call coverage/depth/identity/reads (evidence_<sample> / summary_evidence)
+        --summary_crosswalk  Gene crosswalk (bin/gene_crosswalk.py) mapping each tool's gene names to panARG genes
+        --python_metrics  Record per-stage time and peak memory of the summarizer (python_metrics_summary.tsv next to the Nextflow report)
+        --python_metrics_baseline  python_metrics_summary.tsv of an earlier release; slower stages are reported as regressions
 """
 }
 
@@ -68,16 +94,27 @@ srst2OutputDir = "${params.output}/srst2_results"
 kargaOutputDir = "${params.output}/karga_results"
 argprofilerOutputDir = "${params.output}/argprofiler_results"
 argSummaryOutputDir = "${params.output}/summary"
+prescreenOutputDir = "${params.output}/prescreen"
+downsampleOutputDir = "${params.output}/downsample"
 
 
 //5. IMPORT FUNCTIONS / MODULES / SUBWORKFLOWS / WORKFLOWS
 include { groot_align } from './modules/groot' addParams(OUTPUT: grootOutputDir)
 include { ariba_run } from './modules/ariba' addParams(OUTPUT: aribaOutputDir)
+include { ariba_run_prescreened } from './modules/ariba' addParams(OUTPUT: aribaOutputDir)
 include { ariba_summary } from './modules/ariba' addParams(OUTPUT: aribaOutputDir)
 include { srst2 } from './modules/srst2' addParams(OUTPUT: srst2OutputDir)
+include { srst2_prescreened } from './modules/srst2' addParams(OUTPUT: srst2OutputDir)
 include { karga } from './modules/karga' addParams(OUTPUT: kargaOutputDir)
+include { karga_prepared } from './modules/karga' addParams(OUTPUT: kargaOutputDir)
+include { prepare_reads } from './modules/prepare_reads'
+include { downsample_reads } from './modules/downsample' addParams(OUTPUT: downsampleOutputDir)
+include { cache_restore; cache_store; cacheSettings } from './modules/cache'
+include { kmer_index; kmer_prescreen } from './modules/prescreen' addParams(OUTPUT: prescreenOutputDir)
 include { kma_align } from './modules/argprofiler' addParams(OUTPUT: argprofilerOutputDir)
 include { summarize_results } from './modules/summary' addParams(OUTPUT: argSummaryOutputDir)
+include { summarize_cohort } from './modules/summary' addParams(OUTPUT: argSummaryOutputDir)
+include { collect_metrics } from './modules/summary'
 
 
 // Define the pattern which will be used to find the FASTQ files
@@ -95,15 +132,78 @@ params.skip_kma = false
 params.skip_ariba = false
 params.skip_karga = false
 params.skip_srst2 = false
+params.cohort_summary = false
 
 workflow {
 
-    groot_ch = params.skip_groot ? Channel.empty() : groot_align(fastq_ch)
-    kma_ch = params.skip_kma ? Channel.empty() : kma_align(fastq_ch)
-    ariba_ch = params.skip_ariba ? Channel.empty() : ariba_run(fastq_ch)
+    // Optionally restore the reports of runs already in the result cache: only the misses run the tools
+    def tools = [groot: params.skip_groot, kma: params.skip_kma, ariba: params.skip_ariba, karga: params.skip_karga, srst2: params.skip_srst2]
+        .findAll { tool, skip -> !skip }.keySet() as List
+    if (params.result_cache) {
+        cache_ch = cache_restore(fastq_ch, tools)
+        misses_ch = cache_ch.keys
+            .splitCsv(sep: '\t')
+            .filter { sample_name, tool, key, status -> status == 'miss' }
+        prepare_ch = misses_ch.map { it[0] }.unique().map { [it] }.join(fastq_ch)
+        // Tools each sample still has to run, read from its own key file
+        sample_tools_ch = cache_ch.keys
+            .map { keys -> keys.splitCsv(sep: '\t').findAll { it[3] == 'miss' } }
+            .filter { it }
+            .map { rows -> [rows[0][0], rows.collect { it[1] }] }
+    } else {
+        prepare_ch = fastq_ch
+        sample_tools_ch = fastq_ch.map { [it[0], tools] }
+    }
+    // Reads of the samples a tool still has to run on, and the reports restored for it
+    def toRun = { tool, reads -> params.result_cache ? misses_ch.filter { it[1] == tool }.map { [it[0]] }.join(reads) : reads }
+    def restored = { tool ->
+        params.result_cache ? cache_ch.reports.transpose().filter { sample_name, report -> report.parent.name == cacheSettings(tool).dir } : Channel.empty()
+    }
+
+    // Optionally subsample deep samples down to --target_depth before anything else reads them
+    sample_reads_ch = params.target_depth ? downsample_reads(prepare_ch).reads : fastq_ch
+
+    // Optionally decompress each pair once and hand the tools the prepared reads; only the
+    // layouts the sample's tools read are written (pairs, and the interleaved file for KARGA)
+    reads_ch = params.prepare_reads ? prepare_reads((params.target_depth ? sample_reads_ch : prepare_ch).join(sample_tools_ch)).pairs : sample_reads_ch
+
+    // Optionally prescreen the reads so ARIBA and SRST2 align against the candidate panARG genes only;
+    // samples without candidates get no subsets and skip both tools
+    if (params.prescreen) {
+        index_ch = params.prescreen_index ? Channel.value(file(params.prescreen_index)) : kmer_index().first()
+        subsets_ch = kmer_prescreen(reads_ch, index_ch).subsets
+    }
+    def withSubset = { reads, suffix ->
+        reads.join(subsets_ch
+            .map { sample_name, subsets -> [sample_name, [subsets].flatten().find { it.name.endsWith(suffix) }] }
+            .filter { it[1] })
+    }
+
+    groot_run = params.skip_groot ? Channel.empty() : groot_align(toRun('groot', reads_ch))
+    kma_run = params.skip_kma ? Channel.empty() : kma_align(toRun('kma', reads_ch))
+    ariba_run_ch = params.skip_ariba ? Channel.empty() : (params.prescreen ? ariba_run_prescreened(withSubset(toRun('ariba', reads_ch), '.ariba.fasta')) : ariba_run(toRun('ariba', reads_ch)))
+    karga_run = params.skip_karga ? Channel.empty() : (params.prepare_reads ? karga_prepared(toRun('karga', prepare_reads.out.interleaved)) : karga(toRun('karga', sample_reads_ch)))
+    srst2_run = params.skip_srst2 ? Channel.empty() : (params.prescreen ? srst2_prescreened(withSubset(toRun('srst2', reads_ch), '.srst2.fasta')) : srst2(toRun('srst2', reads_ch)))
+
+    groot_ch = groot_run.mix(restored('groot'))
+    kma_ch = kma_run.mix(restored('kma'))
+    ariba_ch = ariba_run_ch.mix(restored('ariba'))
     ariba_summary_ch = params.skip_ariba ? Channel.empty() : ariba_summary(ariba_ch)
-    karga_ch = params.skip_karga ? Channel.empty() : karga(fastq_ch)
-    srst2_ch = params.skip_srst2 ? Channel.empty() : srst2(fastq_ch)
+    karga_ch = karga_run.mix(restored('karga'))
+    srst2_ch = srst2_run.mix(restored('srst2'))
+
+    if (params.result_cache) {
+        // Cache the reports of the runs that were misses, matched to their key by (sample, tool)
+        fresh_ch = groot_run.map { [[it[0], 'groot'], it[1]] }
+            .mix(kma_run.map { [[it[0], 'kma'], it[1]] })
+            .mix(ariba_run_ch.map { [[it[0], 'ariba'], it[1]] })
+            .mix(karga_run.map { [[it[0], 'karga'], it[1]] })
+            .mix(srst2_run.map { [[it[0], 'srst2'], it[1]] })
+        cache_store(misses_ch
+            .map { sample_name, tool, key, status -> [[sample_name, tool], key] }
+            .join(fresh_ch)
+            .map { id, key, reports -> tuple(id[0], id[1], key, reports) })
+    }
 
     summary_inputs = groot_ch
         .mix(kma_ch)
@@ -125,11 +225,34 @@ workflow {
                 getFile("ariba_summary_${sample_name}.csv"),
                 getFile("karga_report_${sample_name}.csv"),
                 getFile("srst2_report_${sample_name}_fullgenes_sequence_results.txt"),
-                getFile("ARGprofiler_report_${sample_name}.txt"),
+                getFile("ARGprofiler_report_${sample_name}."),  // .txt, or the raw .mapstat with --kma_raw_mapstat
                 file(params.metadata_file)  // or however you pass metadata
             )
     }
     .set { final_inputs }
-    // Call the summarize_results process with the final inputs
-    summarize_results(final_inputs)
+
+    if (params.cohort_summary) {
+        // One manifest row per sample, pointing at the staged report file names
+        def manifest_header = "sample\tgroot_results\tariba_results\tariba_summary\tkarga_results\tsrst2_results\targprofiler_results\tkma_mapstat"
+        manifest_ch = final_inputs
+            .map { row ->
+                def names = row[0..6].collect { it instanceof Path ? it.name : it }
+                // A raw KMA mapstat goes to the kma_mapstat column
+                def raw = names[6].endsWith('.mapstat')
+                (names[0..5] + [raw ? '' : names[6], raw ? names[6] : '']).join('\t')
+            }
+            .collectFile(name: 'summary_manifest.tsv', newLine: true, sort: true, seed: manifest_header)
+        reports_ch = final_inputs
+            .flatMap { row -> row[1..6].findAll { it != '' } }
+            .collect()
+        // Parse every sample in one process so the metadata is only read once
+        metrics_ch = summarize_cohort(manifest_ch, reports_ch, params.metadata_file).metrics
+    } else {
+        // Call the summarize_results process with the final inputs
+        metrics_ch = summarize_results(final_inputs).metrics
+    }
+
+    if (params.python_metrics) {
+        collect_metrics(metrics_ch.collect())
+    }
 }
\ No newline at end of file
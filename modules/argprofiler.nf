@@ -6,6 +6,7 @@ nextflow.enable.dsl=2
 
 // Align reads to ARGprofiler database
 process kma_align {
+    tag "${sample_name}"
     container "${params.container__kma}"
     publishDir params.OUTPUT, mode: 'copy'
 
@@ -13,11 +14,15 @@ process kma_align {
     tuple val(sample_name), path(R1_fastq), path(R2_fastq)
 
     output:
-    tuple val(sample_name), path("ARGprofiler_report_${sample_name}.txt"), emit: kma_report
+    tuple val(sample_name), path("ARGprofiler_report_${sample_name}.*"), emit: kma_report
 
     shell:
+    // With --kma_raw_mapstat the summarizer filters the raw mapstat itself (bin/mapstat_filters.py)
+    def mapstat_cmd = params.kma_raw_mapstat ?
+        "mv ${sample_name}.mapstat ARGprofiler_report_${sample_name}.mapstat" :
+        "Rscript ${projectDir}/bin/mapstatFilters.R -i ${sample_name}.mapstat -o ARGprofiler_report_${sample_name}.txt -r ${params.argprofilerdb}/gene_length.tsv -d ${params.mapstat_depth}"
     '''
-    kma -ipe !{R1_fastq} !{R2_fastq} -o !{sample_name} -t_db !{params.argprofilerdb}/argprofiler.fa -ef -1t1 -nf -vcf -sam -matrix -t !{params.NCPUS} > !{sample_name}.sam 2>log.txt
-    Rscript !{projectDir}/bin/mapstatFilters.R -i !{sample_name}.mapstat -o ARGprofiler_report_!{sample_name}.txt -r !{params.argprofilerdb}/gene_length.tsv -d 6
+    kma -ipe !{R1_fastq} !{R2_fastq} -o !{sample_name} -t_db !{params.argprofilerdb}/argprofiler.fa -ef -1t1 -nf -vcf -sam -matrix -t !{task.cpus} > !{sample_name}.sam 2>log.txt
+    !{mapstat_cmd}
     '''
 }
\ No newline at end of file
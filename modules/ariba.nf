@@ -5,6 +5,7 @@ nextflow.enable.dsl=2
 
 // Align a genome with ariba
 process ariba_run {
+    tag "${sample_name}"
     container "${params.container__ariba}"
     publishDir params.OUTPUT, mode: 'copy'
 
@@ -18,13 +19,34 @@ process ariba_run {
 
     shell:
     '''
-    ariba run !{params.aribadb} !{R1_fastq} !{R2_fastq} ./results --threads !{params.NCPUS}
+    ariba run !{params.aribadb} !{R1_fastq} !{R2_fastq} ./results --threads !{task.cpus}
+    mv results/report.tsv ariba_report_!{sample_name}.tsv
+    '''
+}
+
+// Align a genome with ariba against its prescreened panARG subset
+process ariba_run_prescreened {
+    tag "${sample_name}"
+    container "${params.container__ariba}"
+    publishDir params.OUTPUT, mode: 'copy'
+
+    input:
+    tuple val(sample_name), path(R1_fastq), path(R2_fastq), path(reference)
+
+    output:
+    tuple val(sample_name), path("ariba_report_${sample_name}.tsv"), emit: ariba_report
+
+    shell:
+    '''
+    ariba prepareref -f !{reference} --all_coding yes --threads !{task.cpus} ./prescreen_db
+    ariba run ./prescreen_db !{R1_fastq} !{R2_fastq} ./results --threads !{task.cpus}
     mv results/report.tsv ariba_report_!{sample_name}.tsv
     '''
 }
 
 // Summarise ariba results
 process ariba_summary {
+    tag "${sample_name}"
     container "${params.container__ariba}"
     publishDir params.OUTPUT, mode: 'copy'
 
@@ -0,0 +1,73 @@
+#!/usr/bin/env nextflow
+
+// Using DSL-2
+nextflow.enable.dsl=2
+
+// What a cached report depends on besides the reads, and where the tool publishes it
+def cacheSettings(tool) {
+    def prescreen = params.prescreen ? ["prescreen_k=${params.prescreen_k}", "prescreen_min_coverage=${params.prescreen_min_coverage}"] : []
+    // The key is computed from the raw reads, so the subsampling settings are part of it
+    def downsample = params.target_depth ? ["target_depth=${params.target_depth}", "genome_size=${params.genome_size}", "downsample_seed=${params.downsample_seed}"] : []
+    [
+        groot: [dir: 'groot_results', database: params.grootdb, container: params.container__groot, params: ["groot_cov=${params.groot_cov}"] + downsample],
+        kma: [dir: 'argprofiler_results', database: params.argprofilerdb, container: params.container__kma, params: (params.kma_raw_mapstat ? ["raw_mapstat"] : ["mapstat_depth=${params.mapstat_depth}"]) + downsample],
+        ariba: [dir: 'ariba_results', database: params.aribadb, container: params.container__ariba, params: prescreen + downsample],
+        karga: [dir: 'karga_results', database: params.kargadb, container: params.container__karga, params: downsample],
+        srst2: [dir: 'srst2_results', database: params.srst2db, container: params.container__srst2, params: prescreen + downsample],
+    ][tool]
+}
+
+// Look up every tool of a sample in the result cache and restore (and publish) the hits
+process cache_restore {
+    tag "${sample_name}"
+    publishDir "${params.output}", mode: 'copy', saveAs: { fn -> fn.startsWith('restored/') ? fn - 'restored/' : null }
+
+    input:
+    tuple val(sample_name), path(R1_fastq), path(R2_fastq)
+    val(tools)
+
+    output:
+    path("cache_keys_${sample_name}.tsv"), emit: keys
+    tuple val(sample_name), path("restored/*/*"), optional: true, emit: reports
+
+    script:
+        def lookups = tools.collect { tool ->
+            def settings = cacheSettings(tool)
+            def args = []
+            args << "--tool ${tool}"
+            args << "--reads ${R1_fastq} --reads ${R2_fastq}"
+            args << "--database ${settings.database}"
+            args << "--container ${settings.container}"
+            settings.params.each { args << "--param ${it}" }
+            """
+            key=\$(python3 ${projectDir}/bin/result_cache.py key --cache ${params.result_cache} ${args.join(' ')})
+            mkdir -p restored/${settings.dir}
+            if python3 ${projectDir}/bin/result_cache.py restore --cache ${params.result_cache} --key \$key --sample_name ${sample_name} --dest restored/${settings.dir}; then status=hit; else status=miss; fi
+            printf '%s\\t%s\\t%s\\t%s\\n' ${sample_name} ${tool} \$key \$status >> cache_keys_${sample_name}.tsv
+            """.stripIndent()
+        }
+        """
+        touch cache_keys_${sample_name}.tsv
+        ${lookups.join('\n')}
+        """
+}
+
+// Add the reports of a tool run to the result cache
+process cache_store {
+    tag "${tool}: ${sample_name}"
+
+    input:
+    tuple val(sample_name), val(tool), val(key), path(reports)
+
+    script:
+        def args = []
+
+        args << "--cache ${params.result_cache}"
+        args << "--key ${key}"
+        args << "--sample_name ${sample_name}"
+        args << "--tool ${tool}"
+        if (params.result_cache_max_size) args << "--max_size '${params.result_cache_max_size}'"
+        """
+        python3 ${projectDir}/bin/result_cache.py store ${args.join(' ')} ${reports}
+        """
+}
@@ -0,0 +1,32 @@
+#!/usr/bin/env nextflow
+
+// Using DSL-2
+nextflow.enable.dsl=2
+
+// Estimate the depth of a read pair and subsample the pairs (seeded) down to params.target_depth
+process downsample_reads {
+    tag "${sample_name}"
+    publishDir params.OUTPUT, mode: 'copy', pattern: "downsample_${sample_name}.json"
+
+    input:
+    tuple val(sample_name), path(R1_fastq), path(R2_fastq)
+
+    output:
+    tuple val(sample_name), path("${sample_name}_ds_R1.fastq.gz"), path("${sample_name}_ds_R2.fastq.gz"), emit: reads
+    path("downsample_${sample_name}.json"), emit: stats
+
+    script:
+        def args = []
+
+        args << "--r1 ${R1_fastq}"
+        args << "--r2 ${R2_fastq}"
+        args << "--target_depth ${params.target_depth}"
+        if (params.genome_size)         args << "--genome_size ${params.genome_size}"
+        args << "--seed ${params.downsample_seed}"
+        args << "--output_prefix ${sample_name}_ds"
+        args << "--threads ${task.cpus}"
+        args << "--stats_file downsample_${sample_name}.json"
+        """
+        python3 ${projectDir}/bin/downsample_reads.py ${args.join(' ')}
+        """
+}
@@ -5,6 +5,7 @@ nextflow.enable.dsl=2
 
 // Align a genome with groot
 process groot_align {
+    tag "${sample_name}"
     container "${params.container__groot}"
     publishDir params.OUTPUT, mode: 'copy'
 
@@ -16,7 +17,7 @@ process groot_align {
 
     shell:
     '''
-    groot align -i !{params.grootdb}  -f !{R1_fastq},!{R2_fastq} -p !{params.NCPUS} | groot report -c !{params.groot_cov} > groot_report_!{sample_name}.tsv
+    groot align -i !{params.grootdb}  -f !{R1_fastq},!{R2_fastq} -p !{task.cpus} | groot report -c !{params.groot_cov} > groot_report_!{sample_name}.tsv
     mv groot.log groot_!{sample_name}.log
     '''
 }
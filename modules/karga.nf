@@ -3,8 +3,9 @@
 // Using DSL-2
 nextflow.enable.dsl=2
 
-// Analyse a genome with KARGA
+// Analyse a genome with KARGA (the JVM heap is kept within the task memory, when one is set)
 process karga {
+    tag "${sample_name}"
     container "${params.container__karga}"
     publishDir params.OUTPUT, mode: 'copy'
 
@@ -17,7 +18,26 @@ process karga {
     shell:
     '''
     cat !{R1_fastq} !{R2_fastq} > !{sample_name}.fastq.gz
-    java KARGA !{sample_name}.fastq.gz d:!{params.kargadb}
+    java !{task.memory ? "-Xmx${(task.memory.toMega() * 0.85) as long}m" : ''} KARGA !{sample_name}.fastq.gz d:!{params.kargadb}
     mv !{sample_name}_KARGA_mappedGenes.csv karga_report_!{sample_name}.csv
     '''
 }
+
+// Analyse a genome with KARGA from the interleaved reads written by prepare_reads
+process karga_prepared {
+    tag "${sample_name}"
+    container "${params.container__karga}"
+    publishDir params.OUTPUT, mode: 'copy'
+
+    input:
+    tuple val(sample_name), path(reads_fastq)
+
+    output:
+    tuple val(sample_name), path("karga_report_${sample_name}.csv"), emit: karga_report
+
+    shell:
+    '''
+    java !{task.memory ? "-Xmx${(task.memory.toMega() * 0.85) as long}m" : ''} KARGA !{reads_fastq} d:!{params.kargadb}
+    mv !{sample_name}_interleaved_KARGA_mappedGenes.csv karga_report_!{sample_name}.csv
+    '''
+}
@@ -0,0 +1,33 @@
+#!/usr/bin/env nextflow
+
+// Using DSL-2
+nextflow.enable.dsl=2
+
+// Decompress and validate a read pair once, writing the inputs of every tool in one pass
+process prepare_reads {
+    tag "${sample_name}"
+
+    input:
+    tuple val(sample_name), path(R1_fastq), path(R2_fastq), val(tools)
+
+    output:
+    tuple val(sample_name), path("${sample_name}_prepared_R1.*"), path("${sample_name}_prepared_R2.*"), optional: true, emit: pairs
+    tuple val(sample_name), path("${sample_name}_interleaved.*"), optional: true, emit: interleaved
+
+    script:
+        def extension = params.prepare_reads_compress ? "fastq.gz" : "fastq"
+        def args = []
+
+        args << "--r1 ${R1_fastq}"
+        args << "--r2 ${R2_fastq}"
+        // Only the layouts read by the tools this sample runs
+        if (tools.any { it != 'karga' }) args << "--pairs_prefix ${sample_name}_prepared"
+        // KARGA reads single-end input: give it the interleaved pair instead of a concatenated copy
+        if ('karga' in tools)            args << "--interleaved ${sample_name}_interleaved.${extension}"
+        if (params.prepare_reads_compress) args << "--compress"
+        args << "--threads ${task.cpus}"
+        args << "--stats_file ${sample_name}_reads.json"
+        """
+        python3 ${projectDir}/bin/prepare_reads.py ${args.join(' ')}
+        """
+}
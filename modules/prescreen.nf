@@ -0,0 +1,49 @@
+#!/usr/bin/env nextflow
+
+// Using DSL-2
+nextflow.enable.dsl=2
+
+// Pack the k-mers of the panARG sequences used by SRST2 and ARIBA into one index
+process kmer_index {
+    tag "panARG"
+
+    output:
+    path("panARG_prescreen.npz")
+
+    script:
+        def args = []
+
+        if (!params.skip_srst2)         args << "--fasta srst2=${params.srst2db}"
+        if (!params.skip_ariba)         args << "--fasta ariba=${params.aribadb}/02.cdhit.all.fa"
+        args << "--kmer_size ${params.prescreen_k}"
+        args << "--output panARG_prescreen.npz"
+        """
+        python3 ${projectDir}/bin/kmer_prescreen.py build ${args.join(' ')}
+        """
+}
+
+// Screen a sample's reads and write the panARG subsets to align against; no subsets without ARG signal
+process kmer_prescreen {
+    tag "${sample_name}"
+    publishDir params.OUTPUT, mode: 'copy', pattern: "prescreen_${sample_name}.tsv"
+
+    input:
+    tuple val(sample_name), path(R1_fastq), path(R2_fastq)
+    path(index)
+
+    output:
+    path("prescreen_${sample_name}.tsv"), emit: table
+    tuple val(sample_name), path("prescreen_${sample_name}.*.fasta"), optional: true, emit: subsets
+
+    script:
+        def args = []
+
+        args << "--index ${index}"
+        args << "--reads ${R1_fastq} --reads ${R2_fastq}"
+        args << "--min_coverage ${params.prescreen_min_coverage}"
+        args << "--output_file prescreen_${sample_name}.tsv"
+        args << "--subset_prefix prescreen_${sample_name}"
+        """
+        python3 ${projectDir}/bin/kmer_prescreen.py screen ${args.join(' ')}
+        """
+}
@@ -5,6 +5,7 @@ nextflow.enable.dsl=2
 
 // Align a genome with SRST2
 process srst2 {
+    tag "${sample_name}"
     maxRetries 5
     container "${params.container__srst2}"
     publishDir params.OUTPUT, mode: 'copy'
@@ -18,7 +19,7 @@ process srst2 {
 
     shell:
     '''
-    srst2 --forward '_R1' --reverse '_R2' --input_pe !{R1_fastq} !{R2_fastq} --output srst2_report_!{sample_name} --log --gene_db !{params.srst2db} --threads !{params.NCPUS}
+    srst2 --forward '_R1' --reverse '_R2' --input_pe !{R1_fastq} !{R2_fastq} --output srst2_report_!{sample_name} --log --gene_db !{params.srst2db} --threads !{task.cpus}
     mv srst2_report_!{sample_name}__genes__sequence__results.txt srst2_report_!{sample_name}_genes_sequence_results.txt
     
     if [ -f srst2_report_!{sample_name}__fullgenes__sequence__results.txt ]; then
@@ -28,3 +29,29 @@ process srst2 {
     fi
     '''
 }
+
+// Align a genome with SRST2 against its prescreened panARG subset
+process srst2_prescreened {
+    tag "${sample_name}"
+    maxRetries 5
+    container "${params.container__srst2}"
+    publishDir params.OUTPUT, mode: 'copy'
+
+    input:
+    tuple val(sample_name), path(R1_fastq), path(R2_fastq), path(reference)
+
+    output:
+    tuple val(sample_name), path("srst2_report_${sample_name}_fullgenes_sequence_results.txt"), emit: srst2_report
+
+    shell:
+    '''
+    srst2 --forward '_R1' --reverse '_R2' --input_pe !{R1_fastq} !{R2_fastq} --output srst2_report_!{sample_name} --log --gene_db !{reference} --threads !{task.cpus}
+    mv srst2_report_!{sample_name}__genes__prescreen_!{sample_name}.srst2__results.txt srst2_report_!{sample_name}_genes_sequence_results.txt
+
+    if [ -f srst2_report_!{sample_name}__fullgenes__prescreen_!{sample_name}.srst2__results.txt ]; then
+        mv srst2_report_!{sample_name}__fullgenes__prescreen_!{sample_name}.srst2__results.txt srst2_report_!{sample_name}_fullgenes_sequence_results.txt
+    else
+        touch srst2_report_!{sample_name}_fullgenes_sequence_results.txt
+    fi
+    '''
+}
@@ -1,15 +1,20 @@
 process summarize_results {
-    tag "Summary"
-    publishDir "${params.OUTPUT}", mode: 'copy'
+    tag "${sample_name}"
+    // Metrics records are published once merged by collect_metrics
+    publishDir "${params.OUTPUT}", mode: 'copy', saveAs: { fn -> fn.startsWith('metrics_') ? null : fn }
     
     input:
     tuple val(sample_name), val(groot_file), val(ariba_file), val(ariba_summary_file), val(karga_file), val(srst2_fullgenes_file), val(kma_file), val(metadata_file)
 
     output:
-    path("summary_${sample_name}.tsv")
+    path("summary_${sample_name}.*")
+    path("evidence_${sample_name}.*"), optional: true
+    path("unmatched_${sample_name}.tsv"), optional: true
+    path("metrics_${sample_name}.jsonl"), optional: true, emit: metrics
 
     script:
         def args = []
+        def metrics = params.python_metrics ? "ARG_SNIPER_METRICS=metrics_${sample_name}.jsonl ARG_SNIPER_RELEASE=${workflow.revision ?: workflow.commitId ?: ''} " : ""
     
         // Add sample name to arguments
 
@@ -18,10 +23,72 @@ process summarize_results {
         if (ariba_summary_file != '')   args << "--ariba_summary ${ariba_summary_file}"
         if (karga_file != '')           args << "--karga_results ${karga_file}"
         if (srst2_fullgenes_file != '') args << "--srst2_results ${srst2_fullgenes_file}"
-        if (kma_file != '')             args << "--argprofiler_results ${kma_file}"
+        if (kma_file != '')             args << (kma_file.toString().endsWith('.mapstat') ? "--kma_mapstat ${kma_file}" : "--argprofiler_results ${kma_file}")
+        if (params.kma_raw_mapstat)     args << "--kma_refdata ${params.argprofilerdb}/gene_length.tsv --mapstat_depth ${params.mapstat_depth}"
         if (metadata_file != '')        args << "--metadata ${metadata_file}"
         args << "--output_file summary_${sample_name}.tsv"
+        args << "--output_format ${params.summary_format}"
+        if (params.summary_thresholds)  args << "--thresholds ${params.summary_thresholds}"
+        if (params.summary_evidence)    args << "--evidence_file evidence_${sample_name}.tsv"
+        if (params.summary_crosswalk)   args << "--crosswalk ${params.summary_crosswalk}"
+        args << "--unmatched_file unmatched_${sample_name}.tsv"
         """
-        python3 ${projectDir}/bin/summarize_results.py ${args.join(' ')}
+        ${metrics}python3 ${projectDir}/bin/summarize_results.py ${args.join(' ')}
         """
-}
\ No newline at end of file
+}
+
+// Summarise every sample in a single process from a manifest of report paths
+process summarize_cohort {
+    tag "Cohort summary"
+    publishDir "${params.OUTPUT}", mode: 'copy', saveAs: { fn -> fn.startsWith('metrics_') ? null : fn }
+
+    input:
+    path(manifest)
+    path(reports)
+    val(metadata_file)
+
+    output:
+    path("summary_*")
+    path("metrics_cohort.jsonl"), optional: true, emit: metrics
+
+    script:
+        def args = []
+        def metrics = params.python_metrics ? "ARG_SNIPER_METRICS=metrics_cohort.jsonl ARG_SNIPER_RELEASE=${workflow.revision ?: workflow.commitId ?: ''} " : ""
+
+        args << "--manifest ${manifest}"
+        if (metadata_file != '')        args << "--metadata ${metadata_file}"
+        args << "--output_dir ."
+        args << "--matrix_file summary_matrix.tsv"
+        args << "--jobs ${task.cpus}"
+        if (params.summary_state_dir)   args << "--state_dir ${params.summary_state_dir}"
+        if (params.kma_raw_mapstat)     args << "--kma_refdata ${params.argprofilerdb}/gene_length.tsv --mapstat_depth ${params.mapstat_depth}"
+        args << "--output_format ${params.summary_format}"
+        if (params.summary_thresholds)  args << "--thresholds ${params.summary_thresholds}"
+        if (params.summary_evidence)    args << "--evidence_file summary_evidence.tsv"
+        if (params.summary_crosswalk)   args << "--crosswalk ${params.summary_crosswalk}"
+        args << "--unmatched_file summary_unmatched.tsv"
+        """
+        ${metrics}python3 ${projectDir}/bin/summarize_results.py ${args.join(' ')}
+        """
+}
+
+// Merge the metrics records of the Python steps into the folder of the Nextflow report
+process collect_metrics {
+    tag "Metrics"
+    publishDir "${params.output}", mode: 'copy'
+
+    input:
+    path(metrics_files)
+
+    output:
+    path("python_metrics*")
+
+    script:
+        def args = []
+
+        args << "--output_dir ."
+        if (params.python_metrics_baseline) args << "--baseline ${params.python_metrics_baseline}"
+        """
+        python3 ${projectDir}/bin/instrumentation.py collect ${metrics_files} ${args.join(' ')}
+        """
+}
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+
+import annotation_index
+from annotation_index import AnnotationIndex, compile_index, open_index
+
+
+def write_annotations(path, classes):
+    rows = [f"gene_{i}\t{100 + i}\t{value}\t" for i, value in enumerate(classes)]
+    path.write_text("userGeneName\tgene_len\tclass\tnotes\n" + "\n".join(rows) + "\n")
+
+
+def test_rebuild_swaps_the_index_in(tmp_path):
+    tsv = tmp_path / "panARG_annotations.tsv"
+    index_dir = str(tmp_path / "panARG_annotations.tsv.idx")
+    write_annotations(tsv, ["AMR", "METAL"])
+    compile_index(str(tsv), index_dir)
+    reader = AnnotationIndex(index_dir)
+
+    write_annotations(tsv, ["BIOCIDE", "AMR", "METAL"])
+    compile_index(str(tsv), index_dir)
+    # Only the new index is left next to the TSV; a reader opened before keeps the old rows
+    assert sorted(os.listdir(tmp_path)) == ["panARG_annotations.tsv", "panARG_annotations.tsv.idx"]
+    assert reader.lookup(["gene_1"])["class"].tolist() == ["METAL"]
+    assert AnnotationIndex(index_dir).lookup(["gene_1"])["class"].tolist() == ["AMR"]
+
+
+def open_and_lookup(paths):
+    tsv, index_dir = paths
+    return open_index(tsv, index_dir).lookup(["gene_1"])["class"].tolist()
+
+
+def test_concurrent_jobs_build_the_index_once(tmp_path, monkeypatch):
+    tsv = tmp_path / "panARG_annotations.tsv"
+    index_dir = str(tmp_path / "panARG_annotations.tsv.idx")
+    write_annotations(tsv, ["AMR", "METAL"])
+    compile_index(str(tsv), index_dir)
+    write_annotations(tsv, ["BIOCIDE", "AMR", "METAL"])
+
+    builds = tmp_path / "builds.txt"
+
+    def counted_compile(*args):
+        with open(builds, "a") as handle:
+            handle.write("build\n")
+        return compile_index(*args)
+
+    monkeypatch.setattr(annotation_index, "compile_index", counted_compile)
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        results = pool.map(open_and_lookup, [(str(tsv), index_dir)] * 8)
+    assert results == [["AMR"]] * 8
+    assert builds.read_text() == "build\n"
+
+
+def test_unusable_index_falls_back_to_the_tsv(tmp_path):
+    tsv = tmp_path / "panARG_annotations.tsv"
+    write_annotations(tsv, ["AMR"])
+    # The lock file cannot be created in a missing directory
+    assert open_index(str(tsv), str(tmp_path / "missing" / "index")) is None
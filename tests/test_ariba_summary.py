@@ -0,0 +1,33 @@
+import os
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from summarize_results import summary_report
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ariba")
+
+
+def data(name):
+    return os.path.join(DATA_DIR, name)
+
+
+# Expected summaries were written by the original summarize_results.py on the same reports
+@pytest.mark.parametrize("expected, extra", [
+    ("expected_ariba_S1.tsv", []),
+    ("expected_groot_ariba_S1.tsv", ["--groot_results", data("groot_report_S1.tsv")]),
+])
+def test_ariba_statuses_match_the_original_summary(tmp_path, expected, extra):
+    output_file = str(tmp_path / "summary_S1.tsv")
+    args = ["--ariba_results", data("ariba_report_S1.tsv"), "--ariba_summary", data("ariba_summary.csv"), *extra, "--output_file", output_file]
+    result = CliRunner().invoke(summary_report, args)
+    assert result.exit_code == 0, result.output
+
+    actual = pd.read_csv(output_file, sep="\t", keep_default_na=False)
+    expected = pd.read_csv(data(expected), sep="\t", keep_default_na=False)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    # yes -> 1, no -> dropped, other statuses written as they are
+    calls = dict(zip(actual["Gene"], actual["ariba_report_S1"].astype(str)))
+    assert calls["blaTEM-1"] == "1" and calls["tet(A)"] == "yes_nonunique" and calls["sul1"] == "fragmented"
+    assert "aac(6')-Ib" not in calls
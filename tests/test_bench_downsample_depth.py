@@ -0,0 +1,41 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+from click.testing import CliRunner
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(TESTS_DIR, "..", "benchmarks", "golden")
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "benchmarks"))
+
+from bench_downsample_depth import cli, read_calls  # noqa: E402
+
+
+def test_ariba_statuses_and_zeros(tmp_path):
+    summary = pd.DataFrame({"Gene": ["a", "b", "c", "d", "e"], "ariba_report_S1": [0, 1, "yes_nonunique", "no", "0"],
+                            "groot_report_S1": [0.0, 1.0, 0.0, 0.0, 1.0]})
+    summary.to_csv(tmp_path / "summary_S1.tsv", sep="\t", index=False)
+    calls = read_calls(str(tmp_path), "Gene")
+    assert sorted(calls.loc[calls["tool"] == "ariba", "gene"]) == ["b", "c"]
+    assert sorted(calls.loc[calls["tool"] == "groot", "gene"]) == ["b", "e"]
+
+
+def test_golden_calls_match_the_summary_values():
+    calls = read_calls(GOLDEN_DIR, "Gene")
+    summary = pd.read_csv(os.path.join(GOLDEN_DIR, "summary_S1.tsv"), sep="\t", dtype=str)
+    expected = (~summary["ariba_report_S1"].isin(["0", "0.0"])).sum()
+    assert len(calls[(calls["sample"] == "S1") & (calls["tool"] == "ariba")]) == expected == 26
+
+
+def test_score_picks_the_cheapest_depth(tmp_path):
+    for depth in ("20x", "50x"):
+        os.makedirs(tmp_path / depth)
+        for name in ("summary_S1.tsv", "summary_S2.tsv"):
+            shutil.copy(os.path.join(GOLDEN_DIR, name), tmp_path / depth)
+    truth = tmp_path / "truth.tsv"
+    truth.write_text("Gene\npanARG_gene_000009\npanARG_gene_000020\n")
+    result = CliRunner().invoke(cli, ["score", "--run", f"50={tmp_path / '50x'}", "--run", f"20={tmp_path / '20x'}", "--truth", str(truth)])
+    assert result.exit_code == 0, result.output
+    assert "cheapest depth within 0.01 of it: 20x" in result.output
+    assert result.output.splitlines()[1].startswith("20\t")
@@ -0,0 +1,24 @@
+import numpy as np
+
+from downsample_reads import estimate_depth, kmer_spectrum
+
+
+def write_reads(path, n_reads, length=100, seed=1):
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as handle:
+        for i in range(n_reads):
+            sequence = "".join(rng.choice(list("ACGT"), length))
+            handle.write(f"@read{i}\n{sequence}\n+\n{'I' * length}\n")
+
+
+def test_max_reads_stops_within_a_chunk(tmp_path):
+    write_reads(tmp_path / "r1.fastq", 500)
+    n_reads, n_bases, sketched, _ = kmer_spectrum(str(tmp_path / "r1.fastq"), max_reads=123, chunk_bytes=1 << 20)
+    assert (n_reads, n_bases, sketched) == (500, 50000, 123)
+
+
+def test_genome_size_skips_the_sketch(tmp_path):
+    write_reads(tmp_path / "r1.fastq", 200)
+    assert kmer_spectrum(str(tmp_path / "r1.fastq"), max_reads=0)[2] == 0
+    n_reads, genome, depth, kmer_depth = estimate_depth(str(tmp_path / "r1.fastq"), "10k")
+    assert (n_reads, genome, depth, kmer_depth) == (200, 10000, 4.0, None)
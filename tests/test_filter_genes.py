@@ -0,0 +1,60 @@
+import gzip
+import os
+import struct
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "datasets", "db", "utils"))
+
+from filterGenes import main  # noqa: E402
+
+FASTA = (b">geneA some gene\nATGAAACCC\nGGGTTT\n"
+         b">geneB RequiresSNPConfirmation\nATGCCC\n"
+         b">geneC\nATGAAACCC\nGGGTTTAAA\nTAA\n")
+
+
+def test_fai_offsets_seek_to_every_kept_record(tmp_path):
+    source, output = tmp_path / "panARG.fa", tmp_path / "filtered.fa"
+    source.write_bytes(FASTA)
+    result = CliRunner().invoke(main, [str(source), str(output), "--fai"])
+    assert result.exit_code == 0, result.output
+
+    data = output.read_bytes()
+    rows = [line.split("\t") for line in (tmp_path / "filtered.fa.fai").read_text().splitlines()]
+    assert [row[0] for row in rows] == ["geneA", "geneC"]
+    for name, length, offset, line_bases, line_width in rows:
+        # samtools faidx arithmetic: the last base of the record
+        last = int(length) - 1
+        position = int(offset) + last // int(line_bases) * int(line_width) + last % int(line_bases)
+        assert data[int(offset) - 1:int(offset)] == b"\n"
+        assert data[position:position + 1] == {"geneA": b"T", "geneC": b"A"}[name]
+    assert rows[0][1:] == ["15", "17", "9", "10"]
+
+
+def test_fai_of_plain_gzip_output_is_refused(tmp_path):
+    source = tmp_path / "panARG.fa"
+    source.write_bytes(FASTA)
+    result = CliRunner().invoke(main, [str(source), str(tmp_path / "filtered.fa.gz"), "--fai"])
+    assert result.exit_code != 0
+    assert "needs --bgzip" in result.output
+    assert not (tmp_path / "filtered.fa.gz.fai").exists()
+
+
+def test_bgzip_output_gets_a_gzi(tmp_path):
+    pytest.importorskip("Bio.bgzf")
+    source, output = tmp_path / "panARG.fa", tmp_path / "filtered.fa.gz"
+    source.write_bytes(FASTA)
+    result = CliRunner().invoke(main, [str(source), str(output), "--fai", "--bgzip"])
+    assert result.exit_code == 0, result.output
+
+    gzi = (tmp_path / "filtered.fa.gz.gzi").read_bytes()
+    count, = struct.unpack("<Q", gzi[:8])
+    assert len(gzi) == 8 + 16 * count
+    raw = output.read_bytes()
+    data = gzip.decompress(raw)
+    # Every (compressed, uncompressed) entry starts a block that decompresses to the rest of the data
+    for compressed, uncompressed in struct.iter_unpack("<QQ", gzi[8:]):
+        assert gzip.decompress(raw[compressed:]) == data[uncompressed:]
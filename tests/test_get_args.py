@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "datasets", "db", "utils"))
+
+from get_args import filter_amr_ids, main  # noqa: E402
+
+DATA_DIR = os.path.join(TESTS_DIR, "data", "get_args")
+DATABASES = ["AMRfinderPlus", "card", "ARG-ANNOT", "megares", "ResFinder", "MetalResistance", "mixed"]
+
+
+def data(name):
+    return os.path.join(DATA_DIR, name)
+
+
+# Expected files were written by the original per-row get_args.py (with its stray else: removed)
+def test_filter_amr_ids_match_the_per_row_ids():
+    expected = pd.read_csv(data("expected_ids.tsv"), sep="\t")
+    ids = filter_amr_ids(expected[["fa_header", "database"]])
+    pd.testing.assert_series_equal(ids, expected["id"], check_names=False)
+
+
+@pytest.mark.parametrize("database", DATABASES)
+def test_summary_matches_the_per_row_summary(tmp_path, database):
+    summary = str(tmp_path / "summary.txt")
+    args = [data(f"master_{database}.tsv"), "--amrfinderplus", data("ReferenceGeneCatalog.txt"), "--card", data("aro_index.tsv"),
+            "--megares", data("megares_annotations.csv"), "--resfinder", data("notes.txt"), "--summary", summary]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0, result.output
+
+    actual = pd.read_csv(summary, sep="\t", keep_default_na=False)
+    expected = pd.read_csv(data(f"expected_summary_{database}.tsv"), sep="\t", keep_default_na=False)
+    pd.testing.assert_frame_equal(actual, expected)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "benchmarks"))
+
+from bench_summarize_results import GOLDEN_DIR, GOLDEN_FILES, golden_outputs  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def output_dir(tmp_path_factory):
+    return golden_outputs(str(tmp_path_factory.mktemp("golden")))
+
+
+@pytest.mark.parametrize("name", GOLDEN_FILES)
+def test_summaries_match_the_golden_outputs(output_dir, name):
+    expected = pd.read_csv(os.path.join(GOLDEN_DIR, name), sep="\t", keep_default_na=False)
+    actual = pd.read_csv(os.path.join(output_dir, name), sep="\t", keep_default_na=False)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from kmer_prescreen import CODES, build_index, cli, kmer_codes, reverse_complement, screen_reads
+
+COMPLEMENT = bytes.maketrans(b"ACGT", b"TGCA")
+
+
+def encode(sequence):
+    value = 0
+    for base in sequence:
+        value = (value << 2) | b"ACGT".index(base)
+    return value
+
+
+def revcomp(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def random_sequence(rng, length):
+    return rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), length).tobytes()
+
+
+@pytest.mark.parametrize("k", [31, 21, 11])
+def test_reverse_complement(k):
+    rng = np.random.default_rng(k)
+    sequences = [random_sequence(rng, k) for _ in range(50)] + [b"A" * k, b"ACGT" * (k // 4) + b"A" * (k % 4)]
+    kmers = np.array([encode(sequence) for sequence in sequences], dtype=np.uint64)
+    assert reverse_complement(kmers, k).tolist() == [encode(revcomp(sequence)) for sequence in sequences]
+
+
+@pytest.mark.parametrize("k", [31, 17, 11])
+def test_kmer_codes(k):
+    sequence = random_sequence(np.random.default_rng(k), 120)
+    sequence = sequence[:50] + b"N" + sequence[51:]
+    codes = CODES[np.frombuffer(sequence, dtype=np.uint8)]
+
+    forward, valid = kmer_codes(codes, k, canonical=False)
+    windows = [sequence[i:i + k] for i in range(len(sequence) - k + 1)]
+    assert valid.tolist() == [b"N" not in window for window in windows]
+    assert forward[valid].tolist() == [encode(window) for window in windows if b"N" not in window]
+
+    canonical, _ = kmer_codes(codes, k)
+    assert canonical[valid].tolist() == [min(encode(window), encode(revcomp(window))) for window in windows if b"N" not in window]
+
+
+def write_fastq(path, reads):
+    path.write_bytes(b"".join(b"@r%d\n%s\n+\n%s\n" % (i, read, b"I" * len(read)) for i, read in enumerate(reads)))
+
+
+def test_screen_reads_counts_both_strands(tmp_path):
+    rng = np.random.default_rng(1)
+    gene_a, gene_b = random_sequence(rng, 60), random_sequence(rng, 60)
+    fasta = tmp_path / "panarg.fa"
+    fasta.write_bytes(b">geneA\n" + gene_a + b"\n>geneB\n" + gene_b + b"\n")
+    index = build_index({"srst2": str(fasta)}, 21)
+
+    reads = tmp_path / "S1.fastq"
+    # A forward and a reverse-complement read of geneA, and one of unrelated sequence
+    write_fastq(reads, [gene_a[:40], revcomp(gene_a[20:60]), random_sequence(rng, 40)])
+    hits, n_reads = screen_reads(index, [str(reads)], chunk_bytes=64)
+    assert n_reads == 3
+
+    expected = np.zeros(len(index["kmers"]), dtype=np.int64)
+    for read in (gene_a[:40], gene_a[20:60]):
+        for i in range(len(read) - 20):
+            window = read[i:i + 21]
+            expected[np.searchsorted(index["kmers"], min(encode(window), encode(revcomp(window))))] += 1
+    assert hits.tolist() == expected.tolist()
+
+    hits, n_reads = screen_reads(index, [str(reads)], chunk_bytes=64, max_reads=1)
+    assert n_reads == 1
+    assert hits.sum() == 20
+
+
+def test_screen_refuses_a_changed_source(tmp_path):
+    rng = np.random.default_rng(2)
+    gene = random_sequence(rng, 60)
+    fasta = tmp_path / "panarg.fa"
+    fasta.write_bytes(b">geneA\n" + gene + b"\n")
+    reads = tmp_path / "S1.fastq"
+    write_fastq(reads, [gene])
+    runner = CliRunner()
+    assert runner.invoke(cli, ["build", "--fasta", f"srst2={fasta}", "-k", "21", "--output", str(tmp_path / "index.npz")]).exit_code == 0
+
+    screen = ["screen", "--index", str(tmp_path / "index.npz"), "--reads", str(reads), "--output_file", str(tmp_path / "S1.tsv"), "--subset_prefix", str(tmp_path / "S1")]
+    result = runner.invoke(cli, screen)
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "S1.srst2.fasta").read_bytes() == fasta.read_bytes()
+
+    fasta.write_bytes(b">geneA\n" + gene + b"\n>geneB\n" + gene + b"\n")
+    result = runner.invoke(cli, screen)
+    assert result.exit_code != 0
+    assert "changed since the index was built" in result.output
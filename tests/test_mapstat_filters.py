@@ -0,0 +1,36 @@
+import locale
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from mapstat_filters import cli
+from summarize_results import read_kma_mapstat_evidence
+
+# The expected files are worked out by hand from mapstatFilters.R (merge, na.omit,
+# logical indexing and write.table) for a session under the C locale
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "mapstat")
+
+
+@pytest.fixture
+def c_collation(monkeypatch):
+    monkeypatch.setenv("LC_ALL", "C")
+    yield
+    locale.setlocale(locale.LC_COLLATE, "C")
+
+
+@pytest.mark.parametrize("fixture", ["unmatched", "missing_values"])
+def test_filter_writes_the_r_output(tmp_path, c_collation, fixture):
+    output = tmp_path / f"{fixture}.flt.mapstat"
+    result = CliRunner().invoke(cli, ["filter", "-i", os.path.join(DATA_DIR, f"{fixture}.mapstat"), "-o", str(output),
+                                      "-r", os.path.join(DATA_DIR, f"{fixture}.refdata"), "-d", "6"])
+    assert result.exit_code == 0, result.output
+    with open(os.path.join(DATA_DIR, f"{fixture}.expected.mapstat")) as expected:
+        assert output.read_text() == expected.read()
+
+
+def test_undecided_references_are_not_calls():
+    _, evidence = read_kma_mapstat_evidence(os.path.join(DATA_DIR, "missing_values.mapstat"), os.path.join(DATA_DIR, "missing_values.refdata"))
+    # mcr-1 has no nucHighDepthVariance, so R writes a row of NA in its place
+    assert evidence["Gene"].tolist() == ["floR", "qnrS1", "sul1"]
+    assert evidence["depth"].tolist() == [10, 8, 10]
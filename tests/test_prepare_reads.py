@@ -0,0 +1,36 @@
+import gzip
+
+import pytest
+
+from prepare_reads import ReadPairError, prepare_reads
+
+
+def write_fastq(path, records, end=b"\n"):
+    data = b"\n".join(b"@%s\n%s\n+\n%s" % record for record in records) + end
+    with (gzip.open if str(path).endswith(".gz") else open)(path, "wb") as handle:
+        handle.write(data)
+
+
+def test_last_record_without_newline(tmp_path):
+    write_fastq(tmp_path / "r1.fastq", [(b"read1/1", b"ACGT", b"IIII"), (b"read2/1", b"GGC", b"III")], end=b"")
+    write_fastq(tmp_path / "r2.fastq.gz", [(b"read1/2", b"TTGA", b"IIII"), (b"read2/2", b"CCA", b"III")])
+    stats = prepare_reads(str(tmp_path / "r1.fastq"), str(tmp_path / "r2.fastq.gz"), pairs_prefix=str(tmp_path / "out"),
+                          interleaved=str(tmp_path / "interleaved.fastq"))
+    assert stats == {"read_pairs": 2, "bases_R1": 7, "bases_R2": 7}
+    assert (tmp_path / "out_R1.fastq").read_bytes() == b"@read1/1\nACGT\n+\nIIII\n@read2/1\nGGC\n+\nIII\n"
+    interleaved = (tmp_path / "interleaved.fastq").read_bytes().split(b"\n")
+    assert interleaved[4::4] == [b"@read1/2", b"@read2/1", b"@read2/2", b""]
+
+
+def test_only_the_requested_layouts_are_written(tmp_path):
+    write_fastq(tmp_path / "r1.fastq", [(b"read1", b"ACGT", b"IIII")])
+    write_fastq(tmp_path / "r2.fastq", [(b"read1", b"TTGA", b"IIII")])
+    prepare_reads(str(tmp_path / "r1.fastq"), str(tmp_path / "r2.fastq"), interleaved=str(tmp_path / "interleaved.fastq"))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["interleaved.fastq", "r1.fastq", "r2.fastq"]
+
+
+def test_quality_length_mismatch(tmp_path):
+    write_fastq(tmp_path / "r1.fastq", [(b"read1", b"ACGT", b"III")])
+    write_fastq(tmp_path / "r2.fastq", [(b"read1", b"TTGA", b"IIII")])
+    with pytest.raises(ReadPairError, match="R1 at read 1"):
+        prepare_reads(str(tmp_path / "r1.fastq"), str(tmp_path / "r2.fastq"), pairs_prefix=str(tmp_path / "out"))
@@ -0,0 +1,34 @@
+import os
+
+from result_cache import ResultCache, SAMPLE_PLACEHOLDER
+
+
+def store_report(tmp_path, name, sample, tool):
+    report = tmp_path / name
+    report.write_text("gene\tcoverage\nblaTEM-1\t100\n")
+    cache = ResultCache(str(tmp_path / "cache"))
+    key = "0" * 64
+    assert cache.store(key, [str(report)], sample, tool)
+    return cache, key
+
+
+def test_store_templates_only_the_sample_field(tmp_path):
+    # Sample "2" also occurs in the tool name
+    cache, key = store_report(tmp_path, "srst2_report_2_fullgenes_sequence_results.txt", "2", "srst2")
+    names = [stored["name"] for meta in cache.entries() for stored in meta["files"]]
+    assert names == [f"srst2_report_{SAMPLE_PLACEHOLDER}_fullgenes_sequence_results.txt"]
+
+
+def test_restore_renames_for_another_sample(tmp_path):
+    cache, key = store_report(tmp_path, "srst2_report_2_fullgenes_sequence_results.txt", "2", "srst2")
+    dest = tmp_path / "restored"
+    dest.mkdir()
+    restored = cache.restore(key, str(dest), "S7")
+    assert [os.path.basename(path) for path in restored] == ["srst2_report_S7_fullgenes_sequence_results.txt"]
+
+
+def test_names_without_the_tool_prefix_are_kept(tmp_path):
+    cache, key = store_report(tmp_path, "notes_S1.txt", "S1", "kma")
+    dest = tmp_path / "restored"
+    dest.mkdir()
+    assert os.path.basename(cache.restore(key, str(dest), "S2")[0]) == "notes_S1.txt"
@@ -0,0 +1,32 @@
+import pytest
+
+from summarize_results import parse_srst2_results, read_srst2_evidence
+
+SRST2_COLUMNS = ["Sample", "DB", "gene", "allele", "coverage", "depth", "diffs", "uncertainty", "divergence", "length", "maxMAF", "clusterid", "seqid", "annotation"]
+
+
+def write_srst2(path, rows):
+    lines = ["\t".join(SRST2_COLUMNS)]
+    for gene, coverage, depth in rows:
+        lines.append("\t".join(["S1", "panARG", gene, f"{gene}_1", str(coverage), str(depth), "", "", "0.5", "900", "0.1", "1", "1", ""]))
+    path.write_text("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 100000])
+def test_thresholds_apply_before_the_first_row_per_gene(tmp_path, monkeypatch, chunksize):
+    import summarize_results
+    scan_report = summarize_results.scan_report
+    monkeypatch.setattr(summarize_results, "scan_report", lambda *args, **kwargs: scan_report(*args, **kwargs, chunksize=chunksize))
+    report = tmp_path / "S1_fullgenes_sequence_results.txt"
+    write_srst2(report, [("sul1", 60, 5), ("tetM", 99, 20), ("sul1", 98, 12), ("sul1", 99, 30), ("ermB", 50, 2)])
+
+    # Without thresholds every gene keeps its first row
+    _, evidence = read_srst2_evidence(str(report))
+    assert evidence["Gene"].tolist() == ["sul1", "tetM", "ermB"]
+    assert evidence["coverage"].tolist() == [60, 99, 50]
+
+    # sul1 is called on its first passing allele; ermB keeps its failing row as evidence
+    _, evidence = read_srst2_evidence(str(report), {"coverage": 90})
+    assert dict(zip(evidence["Gene"], evidence["coverage"])) == {"tetM": 99, "sul1": 98, "ermB": 50}
+    calls = parse_srst2_results(str(report), {"coverage": 90})
+    assert dict(zip(calls["Gene"], calls.iloc[:, 1])) == {"tetM": 1, "sul1": 1}
@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+from click.testing import CliRunner
+
+from summarize_results import MANIFEST_COLUMNS, load_results, summary_report
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ariba")
+
+
+def test_relative_matrix_file_is_written_in_the_output_dir(tmp_path, monkeypatch):
+    manifest = tmp_path / "manifest.tsv"
+    reports = {"groot_results": "groot_report_S1.tsv", "ariba_results": "ariba_report_S1.tsv", "ariba_summary": "ariba_summary.csv"}
+    row = ["S1"] + [os.path.join(DATA_DIR, reports[column]) if column in reports else "" for column in MANIFEST_COLUMNS[1:]]
+    manifest.write_text("\t".join(MANIFEST_COLUMNS) + "\n" + "\t".join(row) + "\n")
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(summary_report, ["--manifest", str(manifest), "--output_dir", "summary", "--matrix_file", "summary_matrix.tsv"])
+    assert result.exit_code == 0, result.output
+    assert sorted(os.listdir(tmp_path / "summary")) == ["summary_S1.tsv", "summary_matrix.tsv"]
+
+
+def test_load_results_reads_only_the_sample_summaries(tmp_path):
+    manifest = tmp_path / "manifest.tsv"
+    reports = {"groot_results": "groot_report_S1.tsv", "ariba_results": "ariba_report_S1.tsv", "ariba_summary": "ariba_summary.csv"}
+    row = ["S1"] + [os.path.join(DATA_DIR, reports[column]) if column in reports else "" for column in MANIFEST_COLUMNS[1:]]
+    manifest.write_text("\t".join(MANIFEST_COLUMNS) + "\n" + "\t".join(row) + "\n")
+    output_dir = tmp_path / "summary"
+
+    result = CliRunner().invoke(summary_report, [
+        "--manifest", str(manifest), "--output_dir", str(output_dir), "--output_format", "parquet",
+        "--evidence_file", "summary_evidence.tsv", "--matrix_file", "summary_matrix.tsv",
+    ])
+    assert result.exit_code == 0, result.output
+    # A per-sample run next to the cohort would also leave evidence_<sample> behind
+    (output_dir / "evidence_S1.parquet").write_bytes((output_dir / "summary_evidence.parquet").read_bytes())
+
+    calls = load_results(str(output_dir), "parquet")
+    expected = pd.read_parquet(output_dir / "summary_S1.parquet")
+    assert list(calls.columns) == list(expected.columns)
+    assert len(calls) == len(expected)
@@ -0,0 +1,21 @@
+import pandas as pd
+import pytest
+
+from summary_state import SummaryState
+
+# Pickles that fail to load in different ways: an unknown module, an unknown
+# attribute, an invalid opcode and a truncated stream
+BROKEN_PICKLES = [b"cno_such_module\nThing\n.", b"cos\nno_such_attr\n.", b"\xffgarbage", b"\x80\x04K"]
+
+
+@pytest.mark.parametrize("payload", BROKEN_PICKLES)
+def test_unreadable_frame_is_a_cache_miss(tmp_path, payload):
+    report = tmp_path / "groot_report_S1.tsv"
+    report.write_text("gene\n")
+    state = SummaryState(str(tmp_path / "state"))
+    state.put("S1", "groot", [str(report)], ("groot_report_S1.tsv", pd.DataFrame({"Gene": ["a"]})))
+    assert state.get("S1", "groot", [str(report)])[0] == "groot_report_S1.tsv"
+
+    entry = state.entries[state.key("S1", "groot")]
+    (tmp_path / "state" / "frames" / entry["frame"]).write_bytes(payload)
+    assert state.get("S1", "groot", [str(report)]) is None